@@ -1,13 +1,21 @@
+import json
 import streamlit as st
 import os
+import time
 from utils.input import get_input
 from utils.load_env import load_env
-from threat_model import get_threat_model, get_threat_model_azure, get_threat_model_google, get_threat_model_anthropic, get_threat_model_mistral, get_threat_model_ollama, create_threat_model_prompt, json_to_markdown
-from mitigations import get_mitigations, get_mitigations_azure, get_mitigations_google, get_mitigations_anthropic, get_mitigations_mistral, get_mitigations_ollama, create_mitigations_prompt
-from attack_tree import get_attack_tree, get_attack_tree_azure, get_attack_tree_anthropic, get_attack_tree_mistral, get_attack_tree_ollama, create_attack_tree_prompt
-from test_cases import get_test_cases, get_test_cases_azure, get_test_cases_google, get_test_cases_anthropic, get_test_cases_mistral, get_test_cases_ollama, create_test_cases_prompt
-from dread import get_dread_assessment, get_dread_assessment_azure, get_dread_assessment_google, get_dread_assessment_anthropic, get_dread_assessment_mistral, get_dread_assessment_ollama, create_dread_assessment_prompt, dread_json_to_markdown
+from threat_model import stream_threat_model, stream_threat_model_azure, stream_threat_model_google, stream_threat_model_anthropic, stream_threat_model_mistral, stream_threat_model_ollama, create_sharded_threat_model_prompts, create_threat_model_prompt, failed_shards_warning, iter_threat_model_shards, merge_threat_models
+from pipeline import STAGE_DONE, STAGE_FAILED, STAGE_RUNNING, STAGE_TIMEOUT, STAGE_UNSUPPORTED, STAGES, StageResult, create_stage_prompts, provider_args, run_downstream, stage_timeout
+from utils.job_client import get_job_client
+from utils.job_queue import FINISHED_STATUSES, JOB_DONE
 from utils.mermaid import mermaid
+from utils.dread_engine import DreadTable
+from utils.results_view import dread_columns, render_dread_assessment, render_threat_model, threat_columns
+from utils.sdk import preload_provider
+from utils.telemetry import traced
+from utils.diagnostics import render_diagnostics
+from utils.streaming import JSONArrayStreamParser
+from utils.store_view import find_stored_model, load_stored_model, render_model_store, store_identity, store_result
 
 # Load environment variables
 load_env()
@@ -32,11 +40,15 @@ def main():
         ["OpenAI", "Azure OpenAI", "Google", "Anthropic", "Mistral", "Ollama"],
         help="Choose your AI model provider for threat analysis"
     )
+    # Only the selected provider's SDK is imported; start now, while the form is filled in
+    preload_provider(model_provider)
 
     # API Configuration based on provider
+    selected_model = None
     if model_provider == "OpenAI":
         api_key = st.sidebar.text_input("OpenAI API Key", type="password", help="Enter your OpenAI API key")
         model_name = st.sidebar.selectbox("Model", ["gpt-4", "gpt-3.5-turbo", "gpt-4-turbo"])
+        selected_model = model_name
         if api_key:
             st.session_state['openai_api_key'] = api_key
             st.session_state['model_name'] = model_name
@@ -46,6 +58,7 @@ def main():
         azure_api_key = st.sidebar.text_input("Azure API Key", type="password", help="Enter your Azure OpenAI API key")
         azure_api_version = st.sidebar.text_input("Azure API Version", value="2023-05-15", help="Enter your Azure OpenAI API version")
         azure_deployment_name = st.sidebar.text_input("Azure Deployment Name", help="Enter your Azure OpenAI deployment name")
+        selected_model = azure_deployment_name
         if azure_api_key and azure_api_endpoint and azure_deployment_name:
             st.session_state['azure_api_endpoint'] = azure_api_endpoint
             st.session_state['azure_api_key'] = azure_api_key
@@ -55,6 +68,7 @@ def main():
     elif model_provider == "Google":
         google_api_key = st.sidebar.text_input("Google API Key", type="password", help="Enter your Google API key")
         google_model = st.sidebar.selectbox("Model", ["gemini-pro", "gemini-pro-vision"])
+        selected_model = google_model
         if google_api_key:
             st.session_state['google_api_key'] = google_api_key
             st.session_state['google_model'] = google_model
@@ -62,6 +76,7 @@ def main():
     elif model_provider == "Anthropic":
         anthropic_api_key = st.sidebar.text_input("Anthropic API Key", type="password", help="Enter your Anthropic API key")
         anthropic_model = st.sidebar.selectbox("Model", ["claude-3-opus-20240229", "claude-3-sonnet-20240229", "claude-3-haiku-20240307"])
+        selected_model = anthropic_model
         if anthropic_api_key:
             st.session_state['anthropic_api_key'] = anthropic_api_key
             st.session_state['anthropic_model'] = anthropic_model
@@ -69,15 +84,40 @@ def main():
     elif model_provider == "Mistral":
         mistral_api_key = st.sidebar.text_input("Mistral API Key", type="password", help="Enter your Mistral API key")
         mistral_model = st.sidebar.selectbox("Model", ["mistral-large-latest", "mistral-medium-latest", "mistral-small-latest"])
+        selected_model = mistral_model
         if mistral_api_key:
             st.session_state['mistral_api_key'] = mistral_api_key
             st.session_state['mistral_model'] = mistral_model
     
     elif model_provider == "Ollama":
         ollama_model = st.sidebar.text_input("Ollama Model", value="llama2", help="Enter the Ollama model name (e.g., llama2, codellama)")
+        selected_model = ollama_model
         if ollama_model:
             st.session_state['ollama_model'] = ollama_model
 
+    use_llm_cache = st.sidebar.checkbox(
+        "Reuse cached responses",
+        value=True,
+        help="Return the stored response when the same prompt was already sent to the same model. Untick to always query the model."
+    )
+    shard_threat_model = st.sidebar.checkbox(
+        "Generate STRIDE categories in parallel",
+        value=False,
+        help="Ask for the threats of each STRIDE category in a separate request, all at once, and merge them. Faster for large applications, at the cost of six requests."
+    )
+    stage_timeout_seconds = st.sidebar.number_input(
+        "Stage timeout (seconds)",
+        min_value=10,
+        value=int(stage_timeout()),
+        help="Give up on a mitigations, attack tree, test cases or DREAD stage that has not answered in this time. The other stages carry on."
+    )
+    st.sidebar.checkbox(
+        "Show diagnostics",
+        value=os.getenv('STRIDE_GPT_DIAGNOSTICS', '').lower() in ("1", "true", "yes"),
+        key="show_diagnostics",
+        help="Show the time, tokens and estimated cost of each stage and provider request at the bottom of the page."
+    )
+
     # GitHub API Key for RAG functionality
     st.sidebar.subheader("🔍 RAG Configuration")
     github_api_key = st.sidebar.text_input(
@@ -137,83 +177,316 @@ def main():
             """)
         
         # Get application input (includes RAG functionality)
-        app_input = get_input()
+        app_input = get_input(model=selected_model)
         
     with col2:
-        if st.button("🔍 Generate Threat Model", use_container_width=True):
-            if not app_input.strip():
-                st.error("Please provide an application description or GitHub repository URL.")
+        generate_clicked = st.button("🔍 Generate Threat Model", use_container_width=True)
+
+    if generate_clicked:
+        if not app_input.strip():
+            st.error("Please provide an application description or GitHub repository URL.")
+            return
+
+        # Create the threat model prompt, or one per STRIDE category
+        if shard_threat_model:
+            prompts = create_sharded_threat_model_prompts(
+                app_type, authentication, internet_facing, sensitive_data, app_input,
+                repo_index=st.session_state.get('repo_index'),
+            )
+        else:
+            prompt = create_threat_model_prompt(
+                app_type, authentication, internet_facing, sensitive_data, app_input,
+                repo_index=st.session_state.get('repo_index'),
+            )
+
+        # The same repository commit, inputs and model were stored before: load instead of generating
+        store_key, store_fields = store_identity(
+            model_provider, selected_model, (app_type, authentication, internet_facing, sensitive_data),
+            app_input, sharded=shard_threat_model,
+        )
+        stored = find_stored_model(store_key, use_cache=use_llm_cache)
+
+        job_client = get_job_client()
+        if stored is not None:
+            threat_model = stored["artifacts"]["threat_model"]
+        elif job_client is not None:
+            # Thin client: the job service generates, so a refresh does not lose the job
+            credentials = provider_args(model_provider, st.session_state)
+            if credentials is None:
+                st.error(f"Please configure {model_provider} API credentials in the sidebar.")
                 return
-            
-            # Create the threat model prompt
-            prompt = create_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, app_input)
-            
-            with st.spinner("🔮 Analyzing threats..."):
-                try:
-                    if model_provider == "OpenAI" and 'openai_api_key' in st.session_state:
-                        threat_model = get_threat_model(st.session_state['openai_api_key'], st.session_state['model_name'], prompt)
-                    elif model_provider == "Azure OpenAI" and 'azure_api_key' in st.session_state:
-                        threat_model = get_threat_model_azure(
-                            st.session_state['azure_api_endpoint'],
-                            st.session_state['azure_api_key'],
-                            st.session_state['azure_api_version'],
-                            st.session_state['azure_deployment_name'],
-                            prompt
-                        )
-                    elif model_provider == "Google" and 'google_api_key' in st.session_state:
-                        threat_model = get_threat_model_google(st.session_state['google_api_key'], st.session_state['google_model'], prompt)
-                    elif model_provider == "Anthropic" and 'anthropic_api_key' in st.session_state:
-                        threat_model = get_threat_model_anthropic(st.session_state['anthropic_api_key'], st.session_state['anthropic_model'], prompt)
-                    elif model_provider == "Mistral" and 'mistral_api_key' in st.session_state:
-                        threat_model = get_threat_model_mistral(st.session_state['mistral_api_key'], st.session_state['mistral_model'], prompt)
-                    elif model_provider == "Ollama" and 'ollama_model' in st.session_state:
-                        threat_model = get_threat_model_ollama(st.session_state['ollama_model'], prompt)
-                    else:
-                        st.error(f"Please configure {model_provider} API credentials in the sidebar.")
-                        return
-                    
-                    if threat_model:
-                        st.session_state['threat_model'] = threat_model
-                        st.success("✅ Threat model generated successfully!")
+            params = {"provider": model_provider, "model": selected_model, "use_cache": use_llm_cache}
+            if shard_threat_model:
+                params["prompts"] = prompts
+            else:
+                params["prompt"] = prompt
+            try:
+                job = job_client.submit("threat_model", params, credentials)
+            except Exception as e:
+                st.error(f"❌ Error submitting threat model job: {str(e)}")
+                return
+            st.query_params["job"] = job["id"]
+            threat_model = wait_for_job(job_client, job["id"], "🔮 Analyzing threats...")
+        elif shard_threat_model:
+            credentials = provider_args(model_provider, st.session_state)
+            if credentials is None:
+                st.error(f"Please configure {model_provider} API credentials in the sidebar.")
+                return
+
+            # Show the merged threats so far each time a category finishes
+            live_results = st.empty()
+            shards = {}
+            failed = {}
+            with st.spinner("🔮 Analyzing threats, one STRIDE category per request..."):
+                for category, result, error in iter_threat_model_shards(
+                    model_provider, credentials, prompts, use_cache=use_llm_cache
+                ):
+                    if result:
+                        shards[category] = result
+                        live_results.dataframe(threat_columns(merge_threat_models(shards)['threat_model']), hide_index=True)
                     else:
-                        st.error("❌ Failed to generate threat model. Please check your API configuration.")
-                        
-                except Exception as e:
-                    st.error(f"❌ Error generating threat model: {str(e)}")
+                        failed[category] = error
+            live_results.empty()
+            threat_model = merge_threat_models(shards) if shards else None
+            if failed:
+                st.warning(f"⚠️ {failed_shards_warning(failed)}")
+        else:
+            if model_provider == "OpenAI" and 'openai_api_key' in st.session_state:
+                stream = stream_threat_model(st.session_state['openai_api_key'], st.session_state['model_name'], prompt, use_cache=use_llm_cache)
+            elif model_provider == "Azure OpenAI" and 'azure_api_key' in st.session_state:
+                stream = stream_threat_model_azure(
+                    st.session_state['azure_api_endpoint'],
+                    st.session_state['azure_api_key'],
+                    st.session_state['azure_api_version'],
+                    st.session_state['azure_deployment_name'],
+                    prompt,
+                    use_cache=use_llm_cache,
+                )
+            elif model_provider == "Google" and 'google_api_key' in st.session_state:
+                stream = stream_threat_model_google(st.session_state['google_api_key'], st.session_state['google_model'], prompt, use_cache=use_llm_cache)
+            elif model_provider == "Anthropic" and 'anthropic_api_key' in st.session_state:
+                stream = stream_threat_model_anthropic(st.session_state['anthropic_api_key'], st.session_state['anthropic_model'], prompt, use_cache=use_llm_cache)
+            elif model_provider == "Mistral" and 'mistral_api_key' in st.session_state:
+                stream = stream_threat_model_mistral(st.session_state['mistral_api_key'], st.session_state['mistral_model'], prompt, use_cache=use_llm_cache)
+            elif model_provider == "Ollama" and 'ollama_model' in st.session_state:
+                stream = stream_threat_model_ollama(st.session_state['ollama_model'], prompt, use_cache=use_llm_cache)
+            else:
+                st.error(f"Please configure {model_provider} API credentials in the sidebar.")
+                return
+
+            # Render each threat as soon as the model has finished writing it
+            live_results = st.empty()
+            parser = JSONArrayStreamParser("threat_model")
+            try:
+                with st.spinner("🔮 Analyzing threats..."):
+                    for chunk in stream:
+                        if parser.feed(chunk):
+                            live_results.dataframe(threat_columns(parser.items), hide_index=True)
+                threat_model = parser.result()
+            except json.JSONDecodeError as e:
+                live_results.empty()
+                st.error(f"❌ The model's response is not valid JSON: {str(e)}")
+                with st.expander("Raw response", expanded=False):
+                    st.code(parser.text)
+                return
+            except Exception as e:
+                live_results.empty()
+                st.error(f"❌ Error generating threat model: {str(e)}")
+                return
+            live_results.empty()
+
+        if threat_model:
+            if stored is not None:
+                load_stored_model(stored)
+                st.success("✅ Threat model loaded from the store. Untick \"Reuse cached responses\" to generate it again.")
+            else:
+                st.session_state['threat_model'] = threat_model
+                st.session_state['stored_model_key'] = store_key
+                st.session_state['stored_model_fields'] = store_fields
+                # Downstream results belong to the previous threat model
+                for stage in STAGES:
+                    st.session_state.pop(stage, None)
+                store_result("threat_model", threat_model)
+                st.success("✅ Threat model generated successfully!")
+        else:
+            st.error("❌ Failed to generate threat model. Please check your API configuration.")
+    elif not st.session_state.get('threat_model') and "job" in st.query_params and get_job_client() is not None:
+        # The page was reloaded while the job service generated: pick the job up again
+        threat_model = wait_for_job(get_job_client(), st.query_params["job"], "🔮 Analyzing threats...")
+        if threat_model:
+            st.session_state['threat_model'] = threat_model
+
+    render_model_store()
 
     # Display threat model results
     if 'threat_model' in st.session_state and st.session_state['threat_model']:
         st.subheader("🛡️ Threat Model Results")
         
         threat_model = st.session_state['threat_model']
-        improvement_suggestions = threat_model.get('improvement_suggestions', [])
-        
-        # Convert JSON to markdown and display
-        markdown_output = json_to_markdown(threat_model, improvement_suggestions)
-        st.markdown(markdown_output)
-        
-        # Action buttons
-        col1, col2, col3, col4 = st.columns(4)
+
+        # Display as a paginated table; the view is kept across reruns
+        render_threat_model(threat_model)
         
+        # Action buttons; "Run All" starts every downstream stage at once
+        col1, col2, col3, col4, col5 = st.columns(5)
+        requested_stages = []
+
         with col1:
             if st.button("🛠️ Generate Mitigations"):
-                # Implementation for mitigations
-                st.info("Mitigation generation feature coming soon...")
-        
+                requested_stages = ["mitigations"]
+
         with col2:
             if st.button("🌳 Create Attack Tree"):
-                # Implementation for attack tree
-                st.info("Attack tree generation feature coming soon...")
-        
+                requested_stages = ["attack_tree"]
+
         with col3:
             if st.button("🧪 Generate Test Cases"):
-                # Implementation for test cases
-                st.info("Test case generation feature coming soon...")
-        
+                requested_stages = ["test_cases"]
+
         with col4:
             if st.button("📊 DREAD Assessment"):
-                # Implementation for DREAD assessment
-                st.info("DREAD assessment feature coming soon...")
+                requested_stages = ["dread_assessment"]
+
+        with col5:
+            if st.button("🚀 Run All"):
+                requested_stages = list(STAGES)
+
+        # One area per stage, in a fixed order, so results fill in where they belong
+        stage_areas = {stage: st.empty() for stage in STAGES}
+        for stage, area in stage_areas.items():
+            if stage not in requested_stages and st.session_state.get(stage):
+                with area.container():
+                    render_stage(stage, st.session_state[stage])
+
+        if requested_stages:
+            credentials = provider_args(model_provider, st.session_state)
+            if credentials is None:
+                st.error(f"Please configure {model_provider} API credentials in the sidebar.")
+                return
+
+            prompts = create_stage_prompts(threat_model, app_type, authentication, internet_facing, sensitive_data, app_input)
+            for stage in requested_stages:
+                stage_areas[stage].info(f"⏳ {STAGE_TITLES[stage]}: generating...")
+
+            stage_prompts = {stage: prompts[stage] for stage in requested_stages}
+            job_client = get_job_client()
+            if job_client is not None:
+                results = run_stage_jobs(
+                    job_client, model_provider, selected_model, credentials, stage_prompts,
+                    timeout=stage_timeout_seconds, use_cache=use_llm_cache,
+                )
+            else:
+                # Streamed, so each analysis is shown as it is being written
+                results = run_downstream(
+                    model_provider, credentials, stage_prompts, timeout=stage_timeout_seconds,
+                    use_cache=use_llm_cache, stream=True,
+                )
+            parsers = {}
+            for result in results:
+                area = stage_areas[result.stage]
+                if result.status == STAGE_RUNNING:
+                    with area.container():
+                        render_stage_progress(result.stage, result.result, parsers)
+                elif result.status == STAGE_DONE:
+                    st.session_state[result.stage] = result.result
+                    store_result(result.stage, result.result)
+                    with area.container():
+                        render_stage(result.stage, result.result)
+                elif result.status == STAGE_TIMEOUT:
+                    area.error(f"⌛ {STAGE_TITLES[result.stage]}: {result.error}.")
+                elif result.status == STAGE_UNSUPPORTED:
+                    area.warning(f"{STAGE_TITLES[result.stage]}: {result.error}.")
+                else:
+                    area.error(f"❌ {STAGE_TITLES[result.stage]} failed: {result.error}")
+
+
+# Seconds between status checks of jobs running on the job service
+JOB_POLL_INTERVAL = 1.0
+
+STAGE_TITLES = {
+    "mitigations": "🛠️ Mitigations",
+    "attack_tree": "🌳 Attack Tree",
+    "test_cases": "🧪 Test Cases",
+    "dread_assessment": "📊 DREAD Risk Assessment",
+}
+
+
+# Function to wait for a job of the job service, showing its failure if it does not succeed
+def wait_for_job(job_client, job_id, message):
+    try:
+        with st.spinner(message):
+            job = job_client.wait(job_id, poll_interval=JOB_POLL_INTERVAL)
+    except Exception as e:
+        st.error(f"❌ Error waiting for job {job_id}: {str(e)}")
+        return None
+    if job["status"] != JOB_DONE:
+        st.error(f"❌ Job {job_id} {job['status']}: {job.get('error') or 'no result'}")
+        return None
+    return job["result"]
+
+
+# Function to run downstream stages as jobs of the job service, yielding a StageResult as each finishes
+def run_stage_jobs(job_client, provider, model, credentials, prompts, timeout, use_cache=True):
+    pending = {}
+    for stage, prompt in prompts.items():
+        params = {"provider": provider, "model": model, "prompt": prompt, "use_cache": use_cache}
+        pending[stage] = job_client.submit(stage, params, credentials)["id"]
+    start = time.monotonic()
+    try:
+        while pending:
+            for stage, job_id in list(pending.items()):
+                job = job_client.get(job_id)
+                if job["status"] not in FINISHED_STATUSES:
+                    continue
+                del pending[stage]
+                seconds = time.monotonic() - start
+                if job["status"] == JOB_DONE:
+                    yield StageResult(stage, STAGE_DONE, job["result"], None, seconds)
+                else:
+                    yield StageResult(stage, STAGE_FAILED, None, job.get("error") or job["status"], seconds)
+            if pending and time.monotonic() - start > timeout:
+                for stage in pending:
+                    yield StageResult(stage, STAGE_TIMEOUT, None, f"No response within {timeout:g} seconds", timeout)
+                return
+            if pending:
+                time.sleep(JOB_POLL_INTERVAL)
+    finally:
+        # Also reached on a Streamlit rerun; the service stops work nobody waits for
+        for job_id in pending.values():
+            job_client.cancel(job_id)
+
+
+# Function to display the text a downstream stage has streamed so far. Widgets
+# are left out: the area is redrawn with every chunk, within one script run.
+def render_stage_progress(stage, text, parsers):
+    st.subheader(STAGE_TITLES[stage])
+    if stage == "dread_assessment":
+        # Score each threat as soon as the model has finished writing it
+        parser = parsers.setdefault(stage, JSONArrayStreamParser("Risk Assessment"))
+        parser.feed(text[parser.length:])
+        if parser.items:
+            table = DreadTable.from_assessment({"Risk Assessment": parser.items})
+            st.dataframe(dread_columns(table), hide_index=True)
+        st.caption(f"⏳ {len(parser.items)} threats scored so far...")
+    else:
+        st.markdown(text)
+        st.caption("⏳ Generating...")
+
+
+# Function to display the output of a downstream stage
+@traced("render")
+def render_stage(stage, result):
+    st.subheader(STAGE_TITLES[stage])
+    if stage == "attack_tree":
+        mermaid(result)
+        st.code(result, language="mermaid")
+    elif stage == "dread_assessment":
+        render_dread_assessment(result)
+    else:
+        st.markdown(result)
 
 if __name__ == "__main__":
     main()
+    # After everything else, so it includes this run's spans
+    if st.session_state.get("show_diagnostics"):
+        render_diagnostics()
@@ -1,30 +1,10 @@
 import re
-import requests
-import streamlit as st
-from anthropic import Anthropic
-from mistralai import Mistral
-from openai import OpenAI, AzureOpenAI
 
-# Function to create a prompt to generate an attack tree
-def create_attack_tree_prompt(app_type, authentication, internet_facing, sensitive_data, app_input):
-    prompt = f"""
-APPLICATION TYPE: {app_type}
-AUTHENTICATION METHODS: {authentication}
-INTERNET FACING: {internet_facing}
-SENSITIVE DATA: {sensitive_data}
-APPLICATION DESCRIPTION: {app_input}
-"""
-    return prompt
-
-
-# Function to get attack tree from the GPT response.
-def get_attack_tree(api_key, model_name, prompt):
-    client = OpenAI(api_key=api_key)
+from utils.event_loop import run_sync
+from utils.providers import achat
+from utils.telemetry import traced
 
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": """
+ATTACK_TREE_SYSTEM_PROMPT = """
 Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to use the application description provided to you to produce an attack tree in Mermaid syntax. The attack tree should reflect the potential threats for the application based on the details given.
 
 You MUST only respond with the Mermaid code block. See below for a simple example of the required format and syntax for your output.
@@ -41,175 +21,52 @@ graph TD
 ```
 
 IMPORTANT: Round brackets are special characters in Mermaid syntax. If you want to use round brackets inside a node label you MUST wrap the label in double quotes. For example, ["Example Node Label (ENL)"].
-"""},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the 'content' attribute of the 'message' object directly
-    attack_tree_code = response.choices[0].message.content
-    
-    # Remove Markdown code block delimiters using regular expression
-    attack_tree_code = re.sub(r'^```mermaid\s*|\s*```$', '', attack_tree_code, flags=re.MULTILINE)
-
-    return attack_tree_code
+"""
 
-# Function to get attack tree from the Azure OpenAI response.
-def get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt):
-    client = AzureOpenAI(
-        azure_endpoint = azure_api_endpoint,
-        api_key = azure_api_key,
-        api_version = azure_api_version,
-    )
-
-    response = client.chat.completions.create(
-        model = azure_deployment_name,
-        messages=[
-            {"role": "system", "content": """
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to use the application description provided to you to produce an attack tree in Mermaid syntax. The attack tree should reflect the potential threats for the application based on the details given.
+# Function to create a prompt to generate an attack tree
+def create_attack_tree_prompt(app_type, authentication, internet_facing, sensitive_data, app_input):
+    prompt = f"""
+APPLICATION TYPE: {app_type}
+AUTHENTICATION METHODS: {authentication}
+INTERNET FACING: {internet_facing}
+SENSITIVE DATA: {sensitive_data}
+APPLICATION DESCRIPTION: {app_input}
+"""
+    return prompt
 
-You MUST only respond with the Mermaid code block. See below for a simple example of the required format and syntax for your output.
 
-```mermaid
-graph TD
-    A[Enter Chart Definition] --> B(Preview)
-    B --> C{{decide}}
-    C --> D["Keep"]
-    C --> E["Edit Definition (Edit)"]
-    E --> B
-    D --> F["Save Image and Code"]
-    F --> B
-```
+# The functions below are the entry points for each provider. They all go
+# through the async provider layer of utils/providers.py, which caches,
+# schedules and continues every request.
 
-IMPORTANT: Round brackets are special characters in Mermaid syntax. If you want to use round brackets inside a node label you MUST wrap the label in double quotes. For example, ["Example Node Label (ENL)"].
-"""},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the 'content' attribute of the 'message' object directly
-    attack_tree_code = response.choices[0].message.content
-    
-    # Remove Markdown code block delimiters using regular expression
-    attack_tree_code = re.sub(r'^```mermaid\s*|\s*```$', '', attack_tree_code, flags=re.MULTILINE)
+# Function to get attack tree from the GPT response.
+def get_attack_tree(api_key, model_name, prompt, use_cache=True):
+    return run_sync(aget_attack_tree("OpenAI", (api_key, model_name), prompt, use_cache=use_cache))
 
-    return attack_tree_code
+# Function to get attack tree from the Azure OpenAI response.
+def get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return run_sync(aget_attack_tree("Azure OpenAI", credentials, prompt, use_cache=use_cache))
 
 # Function to get attack tree from the Mistral model's response.
-def get_attack_tree_mistral(mistral_api_key, mistral_model, prompt):
-    client = Mistral(api_key=mistral_api_key)
-
-    response = client.chat.complete(
-        model=mistral_model,
-        messages=[
-            {"role": "system", "content": """
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to use the application description provided to you to produce an attack tree in Mermaid syntax. The attack tree should reflect the potential threats for the application based on the details given.
-
-You MUST only respond with the Mermaid code block. See below for a simple example of the required format and syntax for your output.
-
-```mermaid
-graph TD
-    A[Enter Chart Definition] --> B(Preview)
-    B --> C{{decide}}
-    C --> D["Keep"]
-    C --> E["Edit Definition (Edit)"]
-    E --> B
-    D --> F["Save Image and Code"]
-    F --> B
-```
-
-IMPORTANT: Round brackets are special characters in Mermaid syntax. If you want to use round brackets inside a node label you MUST wrap the label in double quotes. For example, ["Example Node Label (ENL)"].
-"""},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the 'content' attribute of the 'message' object directly
-    attack_tree_code = response.choices[0].message.content
-    
-    # Remove Markdown code block delimiters using regular expression
-    attack_tree_code = re.sub(r'^```mermaid\s*|\s*```$', '', attack_tree_code, flags=re.MULTILINE)
-
-    return attack_tree_code
+def get_attack_tree_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return run_sync(aget_attack_tree("Mistral", (mistral_api_key, mistral_model), prompt, use_cache=use_cache))
 
 # Function to get attack tree from Ollama hosted LLM.
-def get_attack_tree_ollama(ollama_model, prompt):
-    
-    url = "http://localhost:11434/api/chat"
-
-    data = {
-        "model": ollama_model,
-        "stream": False,
-        "messages": [
-            {
-                "role": "system", 
-                "content": """
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to use the application description provided to you to produce an attack tree in Mermaid syntax. The attack tree should reflect the potential threats for the application based on the details given.
-
-You MUST only respond with the Mermaid code block. See below for a simple example of the required format and syntax for your output.
-
-```mermaid
-graph TD
-    A[Enter Chart Definition] --> B(Preview)
-    B --> C{{decide}}
-    C --> D["Keep"]
-    C --> E["Edit Definition (Edit)"]
-    E --> B
-    D --> F["Save Image and Code"]
-    F --> B
-```
-
-IMPORTANT: Round brackets are special characters in Mermaid syntax. If you want to use round brackets inside a node label you MUST wrap the label in double quotes. For example, ["Example Node Label (ENL)"].
-"""},
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    }
-    response = requests.post(url, json=data)
-
-    outer_json = response.json()
-    
-    # Access the 'content' attribute of the 'message' dictionary
-    attack_tree_code = outer_json["message"]["content"]
-
-    # Remove Markdown code block delimiters using regular expression
-    attack_tree_code = re.sub(r'^```mermaid\s*|\s*```$', '', attack_tree_code, flags=re.MULTILINE)
-
-    return attack_tree_code
+def get_attack_tree_ollama(ollama_model, prompt, use_cache=True):
+    return run_sync(aget_attack_tree("Ollama", (ollama_model,), prompt, use_cache=use_cache))
 
 # Function to get attack tree from Anthropic's Claude model.
-def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt):
-    client = Anthropic(api_key=anthropic_api_key)
+def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return run_sync(aget_attack_tree("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache=use_cache))
 
-    response = client.messages.create(
-        model=anthropic_model,
-        max_tokens=1024,
-        system="""
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to use the application description provided to you to produce an attack tree in Mermaid syntax. The attack tree should reflect the potential threats for the application based on the details given.
-You MUST only respond with the Mermaid code block. See below for a simple example of the required format and syntax for your output.
-```mermaid
-graph TD
-    A[Enter Chart Definition] --> B(Preview)
-    B --> C{{decide}}
-    C --> D["Keep"]
-    C --> E["Edit Definition (Edit)"]
-    E --> B
-    D --> F["Save Image and Code"]
-    F --> B
-```
-IMPORTANT: Round brackets are special characters in Mermaid syntax. If you want to use round brackets inside a node label you MUST wrap the label in double quotes. For example, ["Example Node Label (ENL)"].
-""",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    # Access the 'content' attribute of the 'message' object directly
-    attack_tree_code = response.content[0].text
+# Function to get an attack tree from any provider through the async provider layer.
+@traced("generate", stage="attack_tree")
+async def aget_attack_tree(provider, credentials, prompt, use_cache=True):
+    attack_tree_code = await achat(provider, credentials, prompt, system=ATTACK_TREE_SYSTEM_PROMPT, use_cache=use_cache)
 
     # Remove Markdown code block delimiters using regular expression
     attack_tree_code = re.sub(r'^```mermaid\s*|\s*```$', '', attack_tree_code, flags=re.MULTILINE)
 
-    return attack_tree_code
\ No newline at end of file
+    return attack_tree_code
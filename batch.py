@@ -0,0 +1,296 @@
+"""Threat-model many repositories without the Streamlit UI.
+
+    python batch.py manifest.jsonl --provider OpenAI --model gpt-4o --out results.jsonl --workers 8
+
+The manifest is a JSON list or one JSON object per line. Each entry names a
+"repo" (GitHub URL or local path) and/or a "description", with optional
+"id", "app_type", "authentication", "internet_facing" and "sensitive_data";
+the command line options give the defaults. A plain line that is not JSON is
+taken as a repo. One result per entry is appended to the output as soon as it
+finishes. Running the same command again skips the entries already done, so
+an interrupted run picks up where it stopped. API keys are read from the
+environment (or .env), as in .env.example.
+
+This module and everything it imports must not import Streamlit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import ASYNC_STAGES, PROVIDER_ARGS, create_stage_prompts, provider_args
+from threat_model import aget_threat_model, aget_threat_model_sharded, create_sharded_threat_model_prompts, create_threat_model_prompt
+from utils.context_packer import DESCRIPTION_SHARE, OVERVIEW_SHARE, description_budget
+from utils.dread_engine import DreadTable
+from utils.load_env import load_env
+from utils.local_repo import analyze_local_repo, index_local_repo
+from utils.providers import PROVIDERS
+from utils.repo_analysis import analyze_and_index_github_repo
+from utils.telemetry import get_telemetry
+
+DEFAULT_WORKERS = 4
+DEFAULT_AZURE_API_VERSION = "2023-05-15"
+
+# The setting holding the model (or Azure deployment) of each provider
+MODEL_SETTINGS = {
+    "OpenAI": "model_name",
+    "Azure OpenAI": "azure_deployment_name",
+    "Google": "google_model",
+    "Anthropic": "anthropic_model",
+    "Mistral": "mistral_model",
+    "Ollama": "ollama_model",
+}
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+def provider_settings(provider, model):
+    """Collect the settings of `provider` from environment variables named after them (OPENAI_API_KEY...)."""
+    settings = {name: os.environ[name.upper()] for name in PROVIDER_ARGS[provider] if name.upper() in os.environ}
+    if provider == "Azure OpenAI":
+        settings.setdefault("azure_api_version", DEFAULT_AZURE_API_VERSION)
+    if model:
+        settings[MODEL_SETTINGS[provider]] = model
+    return settings
+
+
+def read_manifest(path):
+    """Return the manifest entries of `path`, each with an "id"."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        entries = json.loads(stripped)
+    else:
+        entries = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entries.append(json.loads(line) if line.startswith("{") else {"repo": line})
+
+    seen = set()
+    for position, entry in enumerate(entries):
+        if not entry.get("repo") and not entry.get("description"):
+            raise ValueError(f"Manifest entry {position + 1} has neither a repo nor a description")
+        entry.setdefault("id", entry.get("repo") or f"entry-{position + 1}")
+        if entry["id"] in seen:
+            raise ValueError(f"Duplicate manifest id: {entry['id']}")
+        seen.add(entry["id"])
+    return entries
+
+
+def read_results(path):
+    """Yield the result records of the output file `path`."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of an interrupted run may be cut short
+                continue
+
+
+def completed_ids(path):
+    """Return the ids that already have a successful result in the output file `path`."""
+    return {record["id"] for record in read_results(path) if record.get("status") == STATUS_OK}
+
+
+def write_dread_csv(results_path, csv_path):
+    """Write every DREAD-scored threat of the output file `results_path` to one CSV, ranked across repositories."""
+    table = DreadTable.from_assessments(
+        (record["id"], record["dread_assessment"])
+        for record in read_results(results_path)
+        if record.get("status") == STATUS_OK and record.get("dread_assessment")
+    )
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        table.sorted().to_csv(f)
+    counts = table.bucket_counts()
+    print(
+        f"{len(table)} DREAD-scored threats written to {csv_path} "
+        f"({', '.join(f'{count} {label}' for label, count in counts.items())})",
+        file=sys.stderr,
+    )
+
+
+def is_repo_url(repo):
+    return repo.startswith(("http://", "https://"))
+
+
+def analyze_repo(repo, model, use_cache=True, processes=1):
+    """Return (system description, repository index) for a GitHub URL or local path."""
+    if not is_repo_url(repo):
+        if not os.path.isdir(repo):
+            raise FileNotFoundError(f"No such directory: {repo}")
+        repo_index = index_local_repo(repo, use_cache=use_cache)
+        share = OVERVIEW_SHARE if repo_index else DESCRIPTION_SHARE
+        description = analyze_local_repo(
+            repo, processes=processes, use_cache=use_cache,
+            token_budget=description_budget(model, share), model=model,
+        )
+    else:
+        description, repo_index, _ = analyze_and_index_github_repo(
+            repo, os.getenv('GITHUB_API_KEY', ''), use_cache=use_cache, processes=processes, model=model,
+        )
+    return description, repo_index
+
+
+async def process_entry(entry, args, credentials):
+    """Analyse and threat-model one manifest entry and return its result record."""
+    start = time.monotonic()
+    record = {"id": entry["id"], "repo": entry.get("repo"), "provider": args.provider, "model": args.model}
+    try:
+        app_type = entry.get("app_type", args.app_type)
+        authentication = entry.get("authentication", args.authentication)
+        internet_facing = entry.get("internet_facing", args.internet_facing)
+        sensitive_data = entry.get("sensitive_data", args.sensitive_data)
+        app_input = entry.get("description", "")
+        repo_index = None
+        if entry.get("repo"):
+            # Analysis is blocking (git, the file system, summarizer processes)
+            system_description, repo_index = await asyncio.to_thread(
+                analyze_repo, entry["repo"], args.model, args.use_cache, args.processes
+            )
+            if not system_description:
+                raise RuntimeError("repository analysis returned no description")
+            app_input = system_description + "\n\n" + app_input
+
+        if args.sharded:
+            prompts = create_sharded_threat_model_prompts(
+                app_type, authentication, internet_facing, sensitive_data, app_input, repo_index=repo_index,
+            )
+            threat_model = await aget_threat_model_sharded(args.provider, credentials, prompts, use_cache=args.use_cache)
+        else:
+            prompt = create_threat_model_prompt(
+                app_type, authentication, internet_facing, sensitive_data, app_input, repo_index=repo_index,
+            )
+            threat_model = await aget_threat_model(args.provider, credentials, prompt, use_cache=args.use_cache)
+        if not threat_model:
+            raise RuntimeError("the model did not return a valid threat model")
+        record["threat_model"] = threat_model
+
+        if args.stages:
+            prompts = create_stage_prompts(threat_model, app_type, authentication, internet_facing, sensitive_data, app_input)
+            results = await asyncio.gather(
+                *(ASYNC_STAGES[stage](args.provider, credentials, prompts[stage], use_cache=args.use_cache)
+                  for stage in args.stages),
+                return_exceptions=True,
+            )
+            record["stage_errors"] = {}
+            for stage, result in zip(args.stages, results):
+                if isinstance(result, Exception):
+                    record["stage_errors"][stage] = str(result)
+                else:
+                    record[stage] = result
+        record["status"] = STATUS_OK
+    except Exception as e:
+        record["status"] = STATUS_FAILED
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.monotonic() - start, 2)
+    return record
+
+
+async def run_batch(entries, args, credentials, out):
+    """Process `entries` with at most `args.workers` in flight, appending each record to `out`."""
+    # Repository analysis runs in threads; give every worker one
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="stride-gpt-batch")
+    )
+    queue = asyncio.Queue()
+    for entry in entries:
+        queue.put_nowait(entry)
+    start = time.monotonic()
+    counts = {STATUS_OK: 0, STATUS_FAILED: 0}
+
+    async def worker():
+        while True:
+            try:
+                entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            record = await process_entry(entry, args, credentials)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+            finished = counts[STATUS_OK] + counts[STATUS_FAILED]
+            elapsed = time.monotonic() - start
+            print(
+                f"[{finished}/{len(entries)}] {record['status']:<6} {record['id']} "
+                f"({record['seconds']:.1f}s, {finished * 3600 / elapsed:.0f} repos/hour)"
+                + (f": {record['error']}" if record["status"] == STATUS_FAILED else ""),
+                file=sys.stderr,
+            )
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(args.workers, len(entries))))))
+    return counts, time.monotonic() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("manifest", help="JSON or JSONL file listing the repositories to model")
+    parser.add_argument("--out", default="threat_models.jsonl", help="JSONL file the results are appended to")
+    parser.add_argument("--provider", choices=PROVIDERS, default="OpenAI")
+    parser.add_argument("--model", required=True, help="model name (Azure: deployment name)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="entries processed at once")
+    parser.add_argument("--processes", type=int, default=1, help="summarizer processes per repository")
+    parser.add_argument("--stages", nargs="*", default=[], choices=list(ASYNC_STAGES),
+                        help="downstream stages to run after each threat model")
+    parser.add_argument("--dread-csv", metavar="PATH",
+                        help="afterwards, write the DREAD scores of every repository in --out to one ranked CSV")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="afterwards, write stage and provider metrics to PATH in the Prometheus text format")
+    parser.add_argument("--sharded", action="store_true",
+                        help="generate each STRIDE category in its own concurrent request and merge them")
+    parser.add_argument("--app-type", default="Web Application")
+    parser.add_argument("--authentication", nargs="*", default=[])
+    parser.add_argument("--internet-facing", choices=["Yes", "No"], default="Yes")
+    parser.add_argument("--sensitive-data", nargs="*", default=[])
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="do not reuse cached repository analyses or model responses")
+    parser.add_argument("--restart", action="store_true", help="ignore the results already in --out")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_env()
+    credentials = provider_args(args.provider, provider_settings(args.provider, args.model))
+    if credentials is None:
+        missing = [name.upper() for name in PROVIDER_ARGS[args.provider] if name != MODEL_SETTINGS[args.provider]]
+        raise SystemExit(f"{args.provider} needs these environment variables: {', '.join(missing)}")
+
+    entries = read_manifest(args.manifest)
+    if args.restart and os.path.exists(args.out):
+        os.remove(args.out)
+    done = completed_ids(args.out)
+    pending = [entry for entry in entries if entry["id"] not in done]
+    print(f"{len(entries)} entries, {len(entries) - len(pending)} already done, {len(pending)} to run", file=sys.stderr)
+    if not pending:
+        if args.dread_csv:
+            write_dread_csv(args.out, args.dread_csv)
+        return 0
+
+    with open(args.out, "a", encoding="utf-8") as out:
+        counts, elapsed = asyncio.run(run_batch(pending, args, credentials, out))
+    if args.dread_csv:
+        write_dread_csv(args.out, args.dread_csv)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(get_telemetry().prometheus_text())
+    finished = counts[STATUS_OK] + counts[STATUS_FAILED]
+    print(
+        f"{counts[STATUS_OK]} succeeded, {counts[STATUS_FAILED]} failed in {elapsed:.0f}s "
+        f"({finished * 3600 / max(elapsed, 1e-9):.0f} repos/hour)",
+        file=sys.stderr,
+    )
+    return 1 if counts[STATUS_FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
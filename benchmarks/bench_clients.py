@@ -0,0 +1,109 @@
+"""Compare per-call HTTP connections with the pooled session from utils/clients.py.
+
+    python -m benchmarks.bench_clients --requests 400 --concurrency 16 --tls
+
+Requests go to a local Ollama-style endpoint. With --tls the server uses a
+throwaway self-signed certificate (needs the openssl command), so every new
+connection pays a TLS handshake as it would against a hosted provider.
+"""
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.clients import get_http_session, http_timeout  # noqa: E402
+
+RESPONSE = json.dumps({"message": {"role": "assistant", "content": "{\"threat_model\": []}"}}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections open
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+
+def start_server(latency, tls):
+    Handler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if tls:
+        directory = tempfile.mkdtemp(prefix="stride-gpt-bench-")
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+            check=True, capture_output=True,
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/api/chat"
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(url, post, total, concurrency):
+    data = {"model": "llama2", "stream": False, "messages": [{"role": "user", "content": "x" * 2000}]}
+
+    def one(_):
+        start = time.perf_counter()
+        post(url, json=data, timeout=http_timeout(), verify=False).json()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.01, help="simulated seconds per response")
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    server, url = start_server(args.latency, args.tls)
+    session = get_http_session()
+    print(f"{'client':<10}{'seconds':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, post in (("per-call", requests.post), ("pooled", session.post)):
+        elapsed, latencies = run(url, post, args.requests, args.concurrency)
+        print(f"{label:<10}{elapsed:>10.2f}{percentile(latencies, 0.5) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.95) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure DREAD scoring, aggregation and rendering over a portfolio of repositories.
+
+    python -m benchmarks.bench_dread --repos 2500 --threats 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dread_engine import DREAD_FACTORS, DreadTable  # noqa: E402
+
+THREAT_TYPES = ("Spoofing", "Tampering", "Repudiation", "Information Disclosure",
+                "Denial of Service", "Elevation of Privilege")
+
+
+def synthetic_assessments(repo_count, threat_count, seed=0):
+    """Return {repo: DREAD assessment} with `threat_count` random threats per repository."""
+    rng = random.Random(seed)
+    return {
+        f"repo-{n}": {"Risk Assessment": [
+            {"Threat Type": rng.choice(THREAT_TYPES),
+             "Scenario": f"An attacker abuses endpoint {i} of service {n} to reach data it should not",
+             **{factor: rng.randint(1, 10) for factor in DREAD_FACTORS}}
+            for i in range(threat_count)
+        ]}
+        for n in range(repo_count)
+    }
+
+
+def legacy_markdown(dread_assessment):
+    # The previous renderer: one score at a time, the table grown by +=
+    markdown_output = "| Threat Type | Scenario | Damage Potential | Reproducibility | Exploitability | Affected Users | Discoverability | Risk Score |\n"
+    markdown_output += "|-------------|----------|------------------|-----------------|----------------|----------------|-----------------|-------------|\n"
+    for threat in dread_assessment.get("Risk Assessment", []):
+        scores = [threat.get(factor, 0) for factor in DREAD_FACTORS]
+        risk_score = sum(scores) / 5
+        markdown_output += f"| {threat.get('Threat Type', 'N/A')} | {threat.get('Scenario', 'N/A')} | " \
+                           + " | ".join(str(score) for score in scores) + f" | {risk_score:.2f} |\n"
+    return markdown_output
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{label:<28}{time.perf_counter() - start:>10.3f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repos", type=int, default=2500, help="number of synthetic repositories")
+    parser.add_argument("--threats", type=int, default=20, help="threats per repository")
+    args = parser.parse_args()
+
+    assessments = synthetic_assessments(args.repos, args.threats)
+    # One big assessment, as the previous code had no notion of a portfolio
+    merged = {"Risk Assessment": [threat for a in assessments.values() for threat in a["Risk Assessment"]]}
+    print(f"{args.repos} repositories, {len(merged['Risk Assessment'])} threats")
+    print(f"{'step':<28}{'seconds':>10}")
+
+    timed("legacy markdown", lambda: legacy_markdown(merged))
+    table = timed("load", lambda: DreadTable.from_assessments(assessments))
+    timed("risk, levels and ranks", lambda: (table.risk, table.buckets(), table.ranks()))
+    timed("stats per threat type", table.group_stats)
+    timed("stats per repository", lambda: table.group_stats(by="repo"))
+    timed("sort", table.sorted)
+    timed("top 100", lambda: table.top(100))
+    timed("markdown", table.to_markdown)
+    timed("csv", table.to_csv)
+    print(table.bucket_counts())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Run the app end to end against local stand-ins for GitHub and the LLM providers.
+
+    python -m benchmarks.bench_e2e --repo-files 100 5000 50000 --runs 20 --concurrency 4 --json report.json
+
+Nothing leaves the machine and no API keys are needed: benchmarks/fake_github.py
+serves synthetic repositories and benchmarks/fake_llm.py answers every stage
+like a model would, with --latency and --tokens-per-second setting its pace.
+Three groups of scenarios are measured:
+
+    repo      analyze_github_repo on a repository of each --repo-files size
+    generate  every get_* and stream_* generator of the OpenAI, Azure OpenAI,
+              Anthropic and Ollama providers (Google and Mistral cannot be
+              pointed at another host)
+    render    json_to_markdown, dread_json_to_markdown and the DreadTable
+              exports of a --render-threats threat model
+
+Each scenario reports latency percentiles, throughput and the peak Python heap
+of one traced run (tracemalloc). With --baseline, the p95 latencies are
+compared to an earlier --json report and the command exits with status 1
+when one is more than --tolerance slower, for use in CI before a deploy.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_github import FakeGitHub, synthetic_repo  # noqa: E402
+from benchmarks.fake_llm import FakeLLM, dread_answer, threat_model_answer  # noqa: E402
+from dread import (  # noqa: E402
+    dread_json_to_markdown, stream_dread_assessment, stream_dread_assessment_anthropic,
+    stream_dread_assessment_azure, stream_dread_assessment_ollama,
+)
+from mitigations import (  # noqa: E402
+    stream_mitigations, stream_mitigations_anthropic, stream_mitigations_azure, stream_mitigations_ollama,
+)
+from pipeline import STAGES, create_stage_prompts, provider_args  # noqa: E402
+from test_cases import (  # noqa: E402
+    stream_test_cases, stream_test_cases_anthropic, stream_test_cases_azure, stream_test_cases_ollama,
+)
+from threat_model import (  # noqa: E402
+    create_threat_model_prompt, get_threat_model, get_threat_model_anthropic, get_threat_model_azure,
+    get_threat_model_ollama, json_to_markdown, stream_threat_model, stream_threat_model_anthropic,
+    stream_threat_model_azure, stream_threat_model_ollama,
+)
+from utils.dread_engine import DreadTable  # noqa: E402
+from utils.repo_analysis import FETCH_ARCHIVE, FETCH_ASYNC, FETCH_CONCURRENT, analyze_github_repo  # noqa: E402
+
+PROVIDERS = ("OpenAI", "Azure OpenAI", "Anthropic", "Ollama")
+
+GENERATORS = {
+    "threat_model": {
+        "OpenAI": get_threat_model,
+        "Azure OpenAI": get_threat_model_azure,
+        "Anthropic": get_threat_model_anthropic,
+        "Ollama": get_threat_model_ollama,
+    },
+    **STAGES,
+}
+
+STREAMS = {
+    "threat_model": {
+        "OpenAI": stream_threat_model,
+        "Azure OpenAI": stream_threat_model_azure,
+        "Anthropic": stream_threat_model_anthropic,
+        "Ollama": stream_threat_model_ollama,
+    },
+    "mitigations": {
+        "OpenAI": stream_mitigations,
+        "Azure OpenAI": stream_mitigations_azure,
+        "Anthropic": stream_mitigations_anthropic,
+        "Ollama": stream_mitigations_ollama,
+    },
+    "test_cases": {
+        "OpenAI": stream_test_cases,
+        "Azure OpenAI": stream_test_cases_azure,
+        "Anthropic": stream_test_cases_anthropic,
+        "Ollama": stream_test_cases_ollama,
+    },
+    "dread_assessment": {
+        "OpenAI": stream_dread_assessment,
+        "Azure OpenAI": stream_dread_assessment_azure,
+        "Anthropic": stream_dread_assessment_anthropic,
+        "Ollama": stream_dread_assessment_ollama,
+    },
+}
+
+APP_DETAILS = ("Web application", "OAuth2", "Yes", "Confidential")
+
+
+def settings(llm):
+    """Return the session settings every benchmarked provider reads its credentials from."""
+    return {
+        "openai_api_key": "benchmark",
+        "model_name": "gpt-4o",
+        "azure_api_endpoint": llm.base_url,
+        "azure_api_key": "benchmark",
+        "azure_api_version": "2024-06-01",
+        "azure_deployment_name": "gpt-4o",
+        "anthropic_api_key": "benchmark",
+        "anthropic_model": "claude-3-5-sonnet-latest",
+        "ollama_model": "llama3",
+    }
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def measure(call, runs, concurrency=1, items=1, warmup=False):
+    """Run `call` `runs` times on `concurrency` threads, then once more under tracemalloc.
+
+    Returns the latency percentiles, the throughput in `items` per second and
+    the peak Python heap in MB, along with what each call returned. With
+    `warmup` an untimed call comes first, so importing an SDK and opening
+    connections are not counted.
+    """
+    if warmup:
+        call()
+
+    def timed(_):
+        start = time.perf_counter()
+        result = call()
+        return time.perf_counter() - start, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, range(runs)))
+    wall = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies = [seconds for seconds, _ in timings]
+    row = {
+        "runs": runs,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "per_second": runs * items / wall,
+        "peak_mb": peak / 2**20,
+    }
+    return row, [result for _, result in timings]
+
+
+def drain(stream):
+    """Read a stream to the end and return (seconds to the first chunk, whole text)."""
+    start = time.perf_counter()
+    first = None
+    chunks = []
+    for chunk in stream:
+        if first is None:
+            first = time.perf_counter() - start
+        chunks.append(chunk)
+    return first, "".join(chunks)
+
+
+def bench_repo(args):
+    rows = []
+    for file_count in args.repo_files:
+        with FakeGitHub(synthetic_repo(file_count, padding=args.padding), latency=args.github_latency) as fake:
+            for mode in args.fetch_modes:
+                row, descriptions = measure(
+                    lambda: analyze_github_repo(
+                        fake.repo_url, github_api_key="benchmark", fetch_mode=mode,
+                        max_workers=args.workers, base_url=fake.base_url, use_cache=False,
+                    ),
+                    args.repo_runs, items=file_count,
+                )
+                if not all(descriptions):
+                    raise SystemExit(f"analyze_github_repo ({mode}) failed on {file_count} files")
+                rows.append({"group": "repo", "scenario": f"{file_count} files, {mode}", "unit": "files/s", **row})
+    return rows, descriptions[0]
+
+
+def bench_generate(args, llm, description):
+    credentials = {provider: provider_args(provider, settings(llm)) for provider in PROVIDERS}
+    threat_model_prompt = create_threat_model_prompt(*APP_DETAILS, description)
+    prompts = {"threat_model": threat_model_prompt, **create_stage_prompts(
+        json.loads(threat_model_answer(args.threats)), *APP_DETAILS, description,
+    )}
+
+    rows = []
+    for stage, functions in GENERATORS.items():
+        for provider in PROVIDERS:
+            func = functions.get(provider)
+            if func is None:
+                continue
+            call_args = credentials[provider] + (prompts[stage],)
+            row, results = measure(lambda: func(*call_args, use_cache=False), args.runs, args.concurrency, warmup=True)
+            if not all(results):
+                raise SystemExit(f"{func.__name__} returned nothing")
+            rows.append({"group": "generate", "scenario": func.__name__, "unit": "calls/s", **row})
+
+    for stage, functions in STREAMS.items():
+        for provider, func in functions.items():
+            call_args = credentials[provider] + (prompts[stage],)
+            row, results = measure(
+                lambda: drain(func(*call_args, use_cache=False)), args.runs, args.concurrency, warmup=True,
+            )
+            if not all(text for _, text in results):
+                raise SystemExit(f"{func.__name__} streamed nothing")
+            row["ttft_p95"] = percentile([first for first, _ in results], 95)
+            rows.append({"group": "generate", "scenario": func.__name__, "unit": "calls/s", **row})
+    return rows
+
+
+def bench_render(args):
+    threat_model = json.loads(threat_model_answer(args.render_threats))
+    assessment = json.loads(dread_answer(args.render_threats))
+    scenarios = [
+        ("json_to_markdown", lambda: json_to_markdown(
+            threat_model["threat_model"], threat_model["improvement_suggestions"])),
+        ("dread_json_to_markdown", lambda: dread_json_to_markdown(assessment, sort=True)),
+        ("DreadTable.to_csv", lambda: DreadTable.from_assessment(assessment).sorted().to_csv()),
+        ("DreadTable.group_stats", lambda: DreadTable.from_assessment(assessment).group_stats()),
+    ]
+    rows = []
+    for name, call in scenarios:
+        row, _ = measure(call, args.render_runs, items=args.render_threats)
+        rows.append({"group": "render", "scenario": f"{name} ({args.render_threats} threats)",
+                     "unit": "threats/s", **row})
+    return rows
+
+
+def regressions(rows, baseline, tolerance):
+    """Return the scenarios whose p95 is more than `tolerance` (a fraction) above the baseline report."""
+    before = {(row["group"], row["scenario"]): row["p95"] for row in baseline["scenarios"]}
+    return [
+        (row["scenario"], before[row["group"], row["scenario"]], row["p95"])
+        for row in rows
+        if (row["group"], row["scenario"]) in before and row["p95"] > before[row["group"], row["scenario"]] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", nargs="+", default=["repo", "generate", "render"], choices=["repo", "generate", "render"])
+    parser.add_argument("--repo-files", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="sizes of the synthetic repositories, in source files")
+    parser.add_argument("--padding", type=int, default=2000, help="filler characters per synthetic file")
+    parser.add_argument("--fetch-modes", nargs="+", default=[FETCH_ARCHIVE, FETCH_CONCURRENT],
+                        choices=[FETCH_ARCHIVE, FETCH_CONCURRENT, FETCH_ASYNC])
+    parser.add_argument("--workers", type=int, default=8, help="GitHub fetch workers")
+    parser.add_argument("--github-latency", type=float, default=0.0, help="simulated seconds per GitHub request")
+    parser.add_argument("--repo-runs", type=int, default=3, help="analyses per repository size and fetch mode")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds before a model's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="simulated generation speed; 0 = instant")
+    parser.add_argument("--threats", type=int, default=12, help="threats in each simulated answer")
+    parser.add_argument("--runs", type=int, default=10, help="calls per generator")
+    parser.add_argument("--concurrency", type=int, default=4, help="generator calls in flight at once")
+    parser.add_argument("--render-threats", type=int, default=10000, help="threats in the rendered results")
+    parser.add_argument("--render-runs", type=int, default=5, help="runs per renderer")
+    parser.add_argument("--json", metavar="PATH", help="write the report to PATH as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="a previous --json report to compare p95 latencies to")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95 slowdown allowed over the baseline, as a fraction")
+    args = parser.parse_args()
+
+    # Keep the benchmark away from the user's real caches, and make every
+    # call reach the stand-ins rather than the response cache
+    os.environ["STRIDE_GPT_CACHE_DIR"] = tempfile.mkdtemp(prefix="stride-gpt-bench-")
+    os.environ["STRIDE_GPT_LLM_CACHE"] = "0"
+
+    rows = []
+    description = "A Flask web service with a login endpoint and a JSON API for user profiles."
+    if "repo" in args.groups:
+        repo_rows, description = bench_repo(args)
+        rows += repo_rows
+    if "generate" in args.groups:
+        with FakeLLM(threats=args.threats, latency=args.latency, tokens_per_second=args.tokens_per_second) as llm:
+            os.environ["OPENAI_BASE_URL"] = llm.base_url + "/v1"
+            os.environ["ANTHROPIC_BASE_URL"] = llm.base_url
+            os.environ["OLLAMA_HOST"] = llm.base_url
+            rows += bench_generate(args, llm, description)
+    if "render" in args.groups:
+        rows += bench_render(args)
+
+    print(f"{'scenario':<46}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'TTFT p95':>10}{'throughput':>22}{'peak MB':>9}")
+    for row in rows:
+        ttft = f"{row['ttft_p95']:.3f}" if "ttft_p95" in row else "-"
+        throughput = f"{row['per_second']:.1f} {row['unit']}"
+        print(f"{row['scenario']:<46}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}{ttft:>10}"
+              f"{throughput:>22}{row['peak_mb']:>9.1f}")
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak resident memory of the run: {peak_rss_mb:.0f} MB")
+
+    report = {"scenarios": rows, "peak_rss_mb": peak_rss_mb, "settings": vars(args)}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(rows, json.load(f), args.tolerance)
+        for scenario, before, after in slower:
+            print(f"Regression: {scenario} p95 {before:.3f}s -> {after:.3f}s", file=sys.stderr)
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""Load-test a Streamlit server of the app with many concurrent sessions against local stand-ins.
+
+    python -m benchmarks.bench_load --sessions 1 5 10 20 40 --latency 0.5 --tokens-per-second 60
+
+Starts `streamlit run app.py` with benchmarks/fake_github.py and
+benchmarks/fake_llm.py in place of GitHub and the model provider, then opens
+browser-like sessions over the Streamlit websocket protocol. Each session
+does what a user does: fill in the sidebar, enter a GitHub URL, generate the
+threat model, then "Run All" downstream analyses. For each concurrency level
+the sessions run at once, and the report gives their latency percentiles,
+the p95 of each step and the CPU use and peak resident memory of the server
+process. The first level whose p95 is more than --tolerance above that of
+the lowest level is where the worker degrades; size replicas for the level
+before it. Provider concurrency limits (STRIDE_GPT_<PROVIDER>_CONCURRENCY)
+apply as in the deployment. Every session analyses its own repository and
+the response cache is off, so no session is answered from another's work.
+Needs the websockets package (installed with Streamlit's server).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.proto.Alert_pb2 import Alert  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+
+from benchmarks.bench_e2e import percentile  # noqa: E402
+from benchmarks.fake_github import FakeGitHub, synthetic_repo  # noqa: E402
+from benchmarks.fake_llm import FakeLLM  # noqa: E402
+
+try:
+    import websockets
+except ImportError:  # optional: only this benchmark talks to a Streamlit server
+    websockets = None
+
+APP = os.path.join(ROOT, "app.py")
+
+STEPS = ("load", "repo", "threat_model", "downstream")
+
+# Sidebar text inputs each provider needs, by label; {llm} is the fake's URL
+PROVIDER_INPUTS = {
+    "OpenAI": {"OpenAI API Key": "benchmark"},
+    "Azure OpenAI": {"Azure API Endpoint": "{llm}", "Azure API Key": "benchmark", "Azure Deployment Name": "gpt-4o"},
+    "Anthropic": {"Anthropic API Key": "benchmark"},
+    "Ollama": {},
+}
+
+# How the value of each kind of widget travels in a WidgetState
+VALUE_FIELDS = {"text_input": "string_value", "selectbox": "string_value", "checkbox": "bool_value"}
+
+
+class Session:
+    """One browser tab: a websocket to the server, the widgets last drawn and the values set in them."""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.widgets = {}
+        self.values = {}
+        self.errors = []
+        self._websocket = None
+
+    async def __aenter__(self):
+        self._websocket = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._websocket.close()
+
+    def set(self, label, value):
+        kind, widget_id = self.widgets[label]
+        self.values[widget_id] = (VALUE_FIELDS[kind], value)
+
+    async def run(self, click=None):
+        """Rerun the script with the values set so far (and `click` pressed), and wait for it to finish."""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        for widget_id, (field, value) in self.values.items():
+            state = message.rerun_script.widget_states.widgets.add(id=widget_id)
+            setattr(state, field, value)
+        if click is not None:
+            message.rerun_script.widget_states.widgets.append(WidgetState(id=self.widgets[click][1], trigger_value=True))
+        self.widgets = {}
+        self.errors = []
+        await self._websocket.send(message.SerializeToString())
+        await asyncio.wait_for(self._read_until_finished(), self.timeout)
+
+    async def _read_until_finished(self):
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(await self._websocket.recv())
+            kind = message.WhichOneof("type")
+            if kind == "script_finished":
+                if message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                self._record(message.delta.new_element)
+
+    def _record(self, element):
+        kind = element.WhichOneof("type")
+        proto = getattr(element, kind)
+        if kind == "exception":
+            self.errors.append(f"{proto.type}: {proto.message}")
+        elif kind == "alert" and proto.format == Alert.ERROR:
+            self.errors.append(proto.body)
+        elif getattr(proto, "id", "") and getattr(proto, "label", ""):
+            self.widgets[proto.label] = (kind, proto.id)
+
+
+async def run_session(index, args, llm, url):
+    """Drive one session through the app and return its step timings in seconds, or raise on failure."""
+    timings = {}
+    async with Session(url, args.timeout) as session:
+        start = time.perf_counter()
+        await session.run()
+        session.set("Select Model Provider", args.provider)
+        await session.run()
+        for label, value in PROVIDER_INPUTS[args.provider].items():
+            session.set(label, value.format(llm=llm.base_url))
+        session.set("Reuse cached responses", False)
+        session.set("GitHub API Key (Optional)", "benchmark")
+        await session.run()
+        timings["load"] = time.perf_counter() - start
+
+        steps = [
+            ("repo", "Enter GitHub repository URL (optional)", f"https://github.com/acme/service-{index}"),
+            ("threat_model", "🔍 Generate Threat Model", None),
+            ("downstream", "🚀 Run All", None),
+        ]
+        for step, label, value in steps:
+            await asyncio.sleep(args.think)
+            if label not in session.widgets:
+                raise RuntimeError(f"{step}: no {label!r} on the page")
+            start = time.perf_counter()
+            if value is None:
+                await session.run(click=label)
+            else:
+                session.set(label, value)
+                await session.run()
+            timings[step] = time.perf_counter() - start
+            if session.errors:
+                raise RuntimeError(f"{step}: {session.errors[0]}")
+    return timings
+
+
+class ProcessSampler:
+    """Sample the CPU time and resident memory of a process in the background."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # utime and stime, after the parenthesised command name
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss(self):
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def __enter__(self):
+        self._start_cpu = self.cpu_seconds()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._start
+        self.cpu_percent = 100 * (self.cpu_seconds() - self._start_cpu) / self.seconds
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss())
+            self._stop.wait(self.interval)
+
+
+async def run_level(sessions, args, llm, url, server, first_index):
+    """Run `sessions` sessions at once and return the row reported for that concurrency level."""
+    async def timed(index):
+        start = time.perf_counter()
+        timings = await run_session(index, args, llm, url)
+        return time.perf_counter() - start, timings
+
+    with ProcessSampler(server.pid) as sampler:
+        outcomes = await asyncio.gather(
+            *(timed(index) for index in range(first_index, first_index + sessions)), return_exceptions=True,
+        )
+    results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    errors = [f"{type(outcome).__name__}: {outcome}" for outcome in outcomes if isinstance(outcome, BaseException)]
+
+    totals = [total for total, _ in results] or [0.0]
+    return {
+        "sessions": sessions,
+        "completed": len(results),
+        "errors": errors,
+        "p50": percentile(totals, 50),
+        "p95": percentile(totals, 95),
+        "max": max(totals),
+        "steps_p95": {step: percentile([timings[step] for _, timings in results] or [0.0], 95) for step in STEPS},
+        "sessions_per_minute": 60 * len(results) / sampler.seconds,
+        "cpu_percent": sampler.cpu_percent,
+        "peak_rss_mb": sampler.peak_rss / 2**20,
+    }
+
+
+def degradation_level(rows, tolerance):
+    """Return the first concurrency level that failed sessions or whose p95 is more than `tolerance` above the lowest level's."""
+    baseline = rows[0]["p95"]
+    for row in rows[1:]:
+        if row["errors"] or row["p95"] > baseline * (1 + tolerance):
+            return row["sessions"]
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port, timeout=60):
+    """Start `streamlit run app.py` on `port` and wait until it is healthy."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless=true", f"--server.port={port}",
+         "--server.address=127.0.0.1", "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"streamlit exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("streamlit did not become healthy in time")
+
+
+async def load_test(args, llm, url, server):
+    # One untimed session has the server import the app and the provider SDK first
+    await run_session(0, args, llm, url)
+    print(f"{'sessions':>8}{'done':>6}{'p50 s':>8}{'p95 s':>8}{'max s':>8}"
+          + "".join(f"{step + ' p95':>17}" for step in STEPS)
+          + f"{'per min':>9}{'CPU %':>7}{'RSS MB':>8}")
+    rows = []
+    first_index = 1
+    for sessions in args.sessions:
+        row = await run_level(sessions, args, llm, url, server, first_index)
+        first_index += sessions
+        rows.append(row)
+        print(f"{row['sessions']:>8}{row['completed']:>6}{row['p50']:>8.2f}{row['p95']:>8.2f}{row['max']:>8.2f}"
+              + "".join(f"{row['steps_p95'][step]:>17.2f}" for step in STEPS)
+              + f"{row['sessions_per_minute']:>9.1f}{row['cpu_percent']:>7.0f}{row['peak_rss_mb']:>8.0f}")
+        for error in sorted(set(row["errors"])):
+            print(f"    error: {error}", file=sys.stderr)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20, 30],
+                        help="concurrency levels: sessions running at once")
+    parser.add_argument("--provider", default="OpenAI", choices=list(PROVIDER_INPUTS))
+    parser.add_argument("--files", type=int, default=200, help="source files in each session's repository")
+    parser.add_argument("--github-latency", type=float, default=0.01, help="simulated seconds per GitHub request")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated seconds before a model's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="simulated generation speed; 0 = instant")
+    parser.add_argument("--threats", type=int, default=18, help="threats in each simulated answer")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user waits between steps")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds a single script run may take")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="p95 slowdown over the lowest level that counts as degraded, as a fraction")
+    parser.add_argument("--json", metavar="PATH", help="write the report to PATH as JSON")
+    args = parser.parse_args()
+    if websockets is None:
+        raise SystemExit("bench_load needs the websockets package: pip install websockets")
+
+    port = free_port()
+    with FakeGitHub(synthetic_repo(args.files), latency=args.github_latency) as github, \
+            FakeLLM(threats=args.threats, latency=args.latency, tokens_per_second=args.tokens_per_second) as llm:
+        # Keep the server away from the user's real caches and job service
+        env = dict(os.environ, PYTHONWARNINGS="ignore")
+        env.pop("STRIDE_GPT_API_URL", None)
+        env.update({
+            "STRIDE_GPT_CACHE_DIR": tempfile.mkdtemp(prefix="stride-gpt-bench-"),
+            "STRIDE_GPT_LLM_CACHE": "0",
+            "GITHUB_API_URL": github.base_url,
+            "OPENAI_BASE_URL": llm.base_url + "/v1",
+            "ANTHROPIC_BASE_URL": llm.base_url,
+            "OLLAMA_HOST": llm.base_url,
+        })
+        server = start_server(env, port)
+        try:
+            rows = asyncio.run(load_test(args, llm, f"ws://127.0.0.1:{port}/_stcore/stream", server))
+        finally:
+            server.terminate()
+            server.wait()
+
+    degraded = degradation_level(rows, args.tolerance)
+    if degraded is None:
+        print(f"p95 stayed within {args.tolerance:.0%} of {rows[0]['sessions']} session(s) up to {rows[-1]['sessions']} sessions.")
+    else:
+        previous = [row["sessions"] for row in rows if row["sessions"] < degraded]
+        sized = f"; size replicas for about {previous[-1]} concurrent sessions each" if previous else ""
+        print(f"p95 degrades at {degraded} concurrent sessions{sized}.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"levels": rows, "degraded_at": degraded, "settings": vars(args)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
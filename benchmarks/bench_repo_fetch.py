@@ -0,0 +1,76 @@
+"""Compare repository fetch modes against a local fake GitHub.
+
+    python -m benchmarks.bench_repo_fetch --files 300 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_github import FakeGitHub, synthetic_repo  # noqa: E402
+from utils.repo_analysis import FETCH_ARCHIVE, FETCH_ASYNC, FETCH_CONCURRENT, FETCH_SERIAL, analyze_github_repo  # noqa: E402
+
+
+def run(fake, fetch_mode, max_workers, use_cache=False):
+    fake.request_count = 0
+    start = time.perf_counter()
+    description = analyze_github_repo(
+        fake.repo_url, github_api_key="benchmark", fetch_mode=fetch_mode,
+        max_workers=max_workers, base_url=fake.base_url, use_cache=use_cache,
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, fake.request_count, description
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=300, help="number of source files in the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per API request")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+    # Keep the benchmark away from the user's real cache
+    os.environ["STRIDE_GPT_CACHE_DIR"] = tempfile.mkdtemp(prefix="stride-gpt-bench-")
+
+    with FakeGitHub(synthetic_repo(args.files), latency=args.latency) as fake:
+        baseline, requests_made, expected = run(fake, FETCH_SERIAL, 1)
+        print(f"{'mode':<16}{'workers':>8}{'requests':>10}{'seconds':>10}{'speedup':>9}")
+        print(f"{FETCH_SERIAL:<16}{1:>8}{requests_made:>10}{baseline:>10.2f}{1.0:>8.1f}x")
+        for workers in args.workers:
+            elapsed, requests_made, description = run(fake, FETCH_CONCURRENT, workers)
+            if description != expected:
+                raise SystemExit(f"{FETCH_CONCURRENT} with {workers} workers produced a different description")
+            print(f"{FETCH_CONCURRENT:<16}{workers:>8}{requests_made:>10}{elapsed:>10.2f}{baseline / elapsed:>8.1f}x")
+        for workers in args.workers:
+            elapsed, requests_made, description = run(fake, FETCH_ASYNC, workers)
+            if description != expected:
+                raise SystemExit(f"{FETCH_ASYNC} with {workers} workers produced a different description")
+            print(f"{FETCH_ASYNC:<16}{workers:>8}{requests_made:>10}{elapsed:>10.2f}{baseline / elapsed:>8.1f}x")
+        elapsed, requests_made, description = run(fake, FETCH_ARCHIVE, 1)
+        if description != expected:
+            raise SystemExit(f"{FETCH_ARCHIVE} produced a different description")
+        print(f"{FETCH_ARCHIVE:<16}{'-':>8}{requests_made:>10}{elapsed:>10.2f}{baseline / elapsed:>8.1f}x")
+
+        workers = max(args.workers)
+        for label in ("cache (cold)", "cache (warm)"):
+            elapsed, requests_made, description = run(fake, FETCH_CONCURRENT, workers, use_cache=True)
+            if description != expected:
+                raise SystemExit(f"{label} produced a different description")
+            print(f"{label:<16}{workers:>8}{requests_made:>10}{elapsed:>10.2f}{baseline / elapsed:>8.1f}x")
+
+        # Each incremental run sees a new commit touching 5% of the files
+        changed = [path for path in fake.files if path != "README.md"][::20]
+        for mode in (FETCH_CONCURRENT, FETCH_ARCHIVE):
+            for path in changed:
+                fake.files[path] += f"\ndef patched_for_{mode}():\n    pass\n".encode()
+            _, _, expected = run(fake, FETCH_ARCHIVE, 1)
+            elapsed, requests_made, description = run(fake, mode, workers, use_cache=True)
+            if description != expected:
+                raise SystemExit(f"incremental {mode} produced a different description")
+            label = f"incr. {mode}"
+            print(f"{label:<16}{workers:>8}{requests_made:>10}{elapsed:>10.2f}{baseline / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
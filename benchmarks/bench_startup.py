@@ -0,0 +1,119 @@
+"""Measure cold-start import time and memory of the app, per provider.
+
+    python -m benchmarks.bench_startup --repeat 3 --budget 2.5 --rss-budget 400
+
+Every measurement runs in a fresh interpreter with -X importtime: it imports
+app.py (as a Streamlit worker does) and then the SDK of one provider, as
+happens when that provider is first selected. "eager" imports every SDK up
+front, as the app did before SDKs were loaded lazily. The packages that took
+longest to import are listed for each run. With --budget or --rss-budget the
+command exits with status 1 when a provider goes over, for use in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.sdk import PROVIDER_SDKS  # noqa: E402
+
+# Runs in the child interpreter; prints one JSON line for the parent
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+app_seconds = time.perf_counter() - start
+from utils.sdk import PROVIDER_SDKS, load_sdk
+targets = {targets!r}
+for name in targets:
+    load_sdk(name)
+seconds = time.perf_counter() - start
+with open("/proc/self/statm") as f:
+    rss = int(f.read().split()[1]) * resource.getpagesize()
+print(json.dumps({{"app_seconds": app_seconds, "seconds": seconds, "rss_mb": rss / 2**20,
+                  "sdks": [name for name in sorted(set(PROVIDER_SDKS.values()) - {{None}}) if name in sys.modules]}}))
+"""
+
+
+def scenarios():
+    """Return [(label, SDK modules to import after the app)]."""
+    result = [("app only", [])]
+    for provider, name in PROVIDER_SDKS.items():
+        result.append((provider, [name] if name else []))
+    result.append(("eager", sorted(set(PROVIDER_SDKS.values()) - {None})))
+    return result
+
+
+def slowest_packages(importtime_output, count):
+    """Return the `count` top-level packages with the most import time in milliseconds, from -X importtime output."""
+    totals = Counter()
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us)
+    return [(name, us / 1000) for name, us in totals.most_common(count)]
+
+
+def measure(targets, top):
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(targets=targets)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result["slowest"] = slowest_packages(child.stderr, top)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the median is reported")
+    parser.add_argument("--top", type=int, default=4, help="slowest packages listed per scenario")
+    parser.add_argument("--budget", type=float, help="fail if a provider's import time exceeds this many seconds")
+    parser.add_argument("--rss-budget", type=float, help="fail if a provider's resident memory exceeds this many MB")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    report = []
+    for label, targets in scenarios():
+        runs = [measure(targets, args.top) for _ in range(max(1, args.repeat))]
+        median = sorted(runs, key=lambda run: run["seconds"])[len(runs) // 2]
+        report.append({
+            "scenario": label,
+            "app_seconds": statistics.median(run["app_seconds"] for run in runs),
+            "seconds": statistics.median(run["seconds"] for run in runs),
+            "rss_mb": statistics.median(run["rss_mb"] for run in runs),
+            "sdks": median["sdks"],
+            "slowest": median["slowest"],
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'scenario':<14}{'app s':>8}{'total s':>9}{'RSS MB':>9}  slowest packages (ms)")
+        for row in report:
+            slowest = ", ".join(f"{name} {ms:.0f}" for name, ms in row["slowest"])
+            print(f"{row['scenario']:<14}{row['app_seconds']:>8.2f}{row['seconds']:>9.2f}{row['rss_mb']:>9.0f}  {slowest}")
+
+    # The budgets apply to what a session actually loads, not the eager baseline
+    over = [
+        row["scenario"] for row in report
+        if row["scenario"] in PROVIDER_SDKS and (
+            (args.budget is not None and row["seconds"] > args.budget)
+            or (args.rss_budget is not None and row["rss_mb"] > args.rss_budget)
+        )
+    ]
+    if over:
+        print(f"Over budget: {', '.join(over)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
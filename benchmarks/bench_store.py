@@ -0,0 +1,101 @@
+"""Measure saving, searching and reloading threat models in the model store.
+
+    python -m benchmarks.bench_store --models 2000 --threats 18
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_llm import attack_tree_answer, mitigations_answer, test_cases_answer  # noqa: E402
+from utils.model_store import ModelStore, model_key  # noqa: E402
+
+THREAT_TYPES = ("Spoofing", "Tampering", "Repudiation", "Information Disclosure",
+                "Denial of Service", "Elevation of Privilege")
+
+# Words scenarios are made of, so that a search term matches a fraction of the threats
+WEAKNESSES = ("JWT signature", "session cookie", "S3 bucket policy", "SQL query", "admin API route",
+              "OAuth redirect", "rate limit", "audit log", "TLS certificate", "file upload")
+
+
+def synthetic_model(n, threat_count, rng):
+    """Return the artifacts of a stored model: a threat model, a DREAD assessment and the Markdown analyses."""
+    threats = [
+        {"Threat Type": rng.choice(THREAT_TYPES),
+         "Scenario": f"An attacker abuses the {rng.choice(WEAKNESSES)} of service {n} endpoint {i} to act as another user",
+         "Potential Impact": f"Loss of integrity of the records of service {n}."}
+        for i in range(threat_count)
+    ]
+    return {
+        "threat_model": {"threat_model": threats, "improvement_suggestions": []},
+        "dread_assessment": {"Risk Assessment": [
+            {"Threat Type": threat["Threat Type"], "Scenario": threat["Scenario"], "Damage Potential": rng.randint(1, 10),
+             "Reproducibility": rng.randint(1, 10), "Exploitability": rng.randint(1, 10),
+             "Affected Users": rng.randint(1, 10), "Discoverability": rng.randint(1, 10)}
+            for threat in threats
+        ]},
+        "mitigations": mitigations_answer(threat_count),
+        "test_cases": test_cases_answer(threat_count),
+        "attack_tree": attack_tree_answer(threat_count),
+    }
+
+
+def timed(label, function, runs=1):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = function()
+    print(f"{label:<36}{(time.perf_counter() - start) / runs * 1000:>12.2f}")
+    return result
+
+
+def scan_search(store, words, threat_type):
+    # What finding threats takes without the index: decode every stored threat model and compare
+    rows = store._connection().execute("SELECT content FROM artifacts WHERE kind = 'threat_model'").fetchall()
+    return [
+        threat for (content,) in rows for threat in json.loads(content)["threat_model"]
+        if threat["Threat Type"] == threat_type and all(word.lower() in threat["Scenario"].lower() for word in words)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", type=int, default=2000, help="number of stored threat models")
+    parser.add_argument("--threats", type=int, default=18, help="threats per threat model")
+    parser.add_argument("--runs", type=int, default=20, help="repetitions of each search and load")
+    args = parser.parse_args()
+
+    store = ModelStore(os.path.join(tempfile.mkdtemp(prefix="stride-gpt-bench-"), "models.sqlite3"))
+    rng = random.Random(0)
+    keys = []
+    start = time.perf_counter()
+    for n in range(args.models):
+        key = model_key(f"https://github.com/bench/service-{n}", f"{n:040x}", {"provider": "Ollama"})
+        for kind, content in synthetic_model(n, args.threats, rng).items():
+            store.save(key, kind, content, repo=f"https://github.com/bench/service-{n}", commit=f"{n:040x}")
+        keys.append(key)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(store.path) + os.path.getsize(store.path + "-wal")
+    print(f"{args.models} models, {args.models * args.threats} threats: saved in {elapsed:.2f}s "
+          f"({elapsed / args.models * 1000:.2f} ms per model), {size / 1024 / 1024:.1f} MB")
+    print(f"{'step':<36}{'ms':>12}")
+
+    hits = timed("search 'jwt' in EoP (scan)", lambda: scan_search(store, ["jwt"], "Elevation of Privilege"), args.runs)
+    found = timed("search 'jwt' in EoP (FTS5)",
+                  lambda: store.search("jwt", threat_type="Elevation of Privilege", kind="threat_model", limit=len(hits) + 1),
+                  args.runs)
+    if len(found) != len(hits):
+        raise SystemExit(f"the index found {len(found)} threats, the scan {len(hits)}")
+    timed("search 'jwt' in EoP, top 50", lambda: store.search("jwt", threat_type="Elevation of Privilege"), args.runs)
+    timed("search 'oauth redirect', top 50", lambda: store.search("oauth redirect"), args.runs)
+    timed("search 'sess*' in mitigations", lambda: store.search("sess*", kind="mitigations"), args.runs)
+    timed("newest 50 models", store.recent, args.runs)
+    timed("load one model", lambda: store.load(rng.choice(keys)), args.runs)
+
+
+if __name__ == "__main__":
+    main()
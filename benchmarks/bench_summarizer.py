@@ -0,0 +1,106 @@
+"""Measure file summarizer throughput in files/sec and MB/sec.
+
+    python -m benchmarks.bench_summarizer --files 2000 --processes 1 2 4
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.summarizer import summarize_many  # noqa: E402
+
+TEMPLATES = {
+    "py": (
+        "import os\nimport json\nfrom flask import Flask, request, jsonify\n\napp = Flask(__name__)\n\n",
+        "@app.route('/items/{i}', methods=['GET', 'POST'])\ndef handler_{i}(item_id: int, *, verbose=False) -> dict:\n"
+        "    data = request.get_json()\n    if not data:\n        return jsonify(error='missing'), 400\n"
+        "    return {{'id': item_id, 'value': data.get('value')}}\n\n\n"
+        "class Model{i}(Base):\n    def save(self):\n        pass\n\n    def delete(self):\n        pass\n\n\n",
+    ),
+    "js": (
+        "const express = require('express');\nimport jwt from 'jsonwebtoken';\nconst router = express.Router();\n\n",
+        "router.post('/items/{i}', async (req, res) => {{\n  res.json({{ id: {i} }});\n}});\n\n"
+        "export async function handler{i}(req, res, next) {{\n  const token = req.headers.authorization;\n  next();\n}}\n\n"
+        "class Model{i} extends Base {{\n  save() {{}}\n}}\n\n",
+    ),
+    "go": (
+        "package main\n\nimport (\n\t\"encoding/json\"\n\t\"net/http\"\n)\n\n",
+        "type Handler{i} struct {{\n\tstore Store\n}}\n\n"
+        "func (h *Handler{i}) ServeHTTP(w http.ResponseWriter, r *http.Request) {{\n"
+        "\tjson.NewEncoder(w).Encode(map[string]int{{\"id\": {i}}})\n}}\n\n",
+    ),
+    "java": (
+        "import java.util.List;\nimport org.springframework.web.bind.annotation.*;\n\n@RestController\npublic class Api {\n",
+        "    @GetMapping(\"/items/{i}\")\n    public ResponseEntity<Item> getItem{i}(@PathVariable Long id) {{\n"
+        "        return ResponseEntity.ok(repository.find(id));\n    }}\n\n",
+    ),
+    "rb": (
+        "require 'sinatra'\nrequire_relative 'lib/auth'\n\n",
+        "get '/items/{i}' do\n  json id: {i}\nend\n\nclass Model{i} < Base\n  def save\n  end\n\n  def self.find(id)\n  end\nend\n\n",
+    ),
+}
+
+
+def synthetic_sources(file_count, blocks):
+    """Return [(path, content)] for `file_count` files of `blocks` repeated definitions each."""
+    files = []
+    extensions = list(TEMPLATES)
+    for n in range(file_count):
+        ext = extensions[n % len(extensions)]
+        header, block = TEMPLATES[ext]
+        body = header + "".join(block.format(i=i) for i in range(blocks))
+        if ext == "java":
+            body += "}\n"
+        files.append((f"pkg{n // 100}/module_{n}.{ext}", body))
+    return files
+
+
+def legacy_summarize(file_path, content):
+    # The previous summarizer: three regexes compiled on every call
+    imports = re.findall(r'^import .*|^from .* import .*', content, re.MULTILINE)
+    functions = re.findall(r'def .*\\(.*\\):', content)
+    classes = re.findall(r'class .*:', content)
+    summary = ""
+    if imports:
+        summary += "Imports:\n" + "\n".join(imports[:5]) + "\n"
+    if functions:
+        summary += "Functions:\n" + "\n".join(functions[:5]) + "\n"
+    if classes:
+        summary += "Classes:\n" + "\n".join(classes[:5]) + "\n"
+    return summary
+
+
+def report(label, processes, elapsed, files, total_bytes):
+    print(f"{label:<12}{processes:>10}{elapsed:>10.2f}{len(files) / elapsed:>12.0f}"
+          f"{total_bytes / elapsed / 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000, help="number of synthetic source files")
+    parser.add_argument("--blocks", type=int, default=40, help="repeated definitions per file")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    files = synthetic_sources(args.files, args.blocks)
+    total_bytes = sum(len(content.encode()) for _, content in files)
+    print(f"{len(files)} files, {total_bytes / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+    print(f"{'summarizer':<12}{'processes':>10}{'seconds':>10}{'files/sec':>12}{'MB/sec':>10}")
+
+    start = time.perf_counter()
+    for path, content in files:
+        legacy_summarize(path, content)
+    report("regex", 1, time.perf_counter() - start, files, total_bytes)
+
+    for processes in sorted(set(args.processes)):
+        start = time.perf_counter()
+        summaries = summarize_many(files, processes)
+        report("ast", processes, time.perf_counter() - start, files, total_bytes)
+        assert len(summaries) == len(files)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""A minimal stand-in for the GitHub REST API, serving a synthetic repository.
+
+Only the endpoints used by utils/repo_analysis.py are implemented. Every
+request sleeps for `latency` seconds so that the effect of concurrent fetching
+can be measured without touching the real API. Any repository name under
+`owner` serves the same files, so distinct repositories can be analysed
+without sharing cache entries.
+"""
+import base64
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+LANGUAGES = {
+    "py": "import os\nfrom flask import Flask, request\n\napp = Flask(__name__)\n\n\n@app.route('/login', methods=['POST'])\ndef login():\n    token = request.form['token']\n    return check(token)\n\n\nclass Session:\n    pass\n",
+    "js": "const express = require('express');\nconst app = express();\n\napp.get('/api/user', (req, res) => res.json(req.user));\n\nfunction authenticate(req, res, next) {\n  next();\n}\n",
+    "go": "package main\n\nimport \"net/http\"\n\nfunc handler(w http.ResponseWriter, r *http.Request) {\n}\n",
+}
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def synthetic_repo(file_count, padding=2000):
+    """Return {path: bytes} for a repository with `file_count` source files and a README."""
+    files = {"README.md": b"# Synthetic repository\n\nA service used for benchmarking.\n"}
+    extensions = list(LANGUAGES)
+    for i in range(file_count):
+        ext = extensions[i % len(extensions)]
+        body = LANGUAGES[ext] + "\n" + ("# " if ext == "py" else "// ") + "x" * padding + "\n"
+        files[f"pkg{i // 100}/module_{i}.{ext}"] = body.encode()
+    return files
+
+
+class FakeGitHub:
+    def __init__(self, files, owner="acme", repo="service", branch="main", latency=0.05):
+        self.files = files
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._tarball = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def commit_sha(self):
+        # Derived from the file contents, so changing a file moves the head commit
+        digest = hashlib.sha1()
+        for path, data in sorted(self.files.items()):
+            digest.update(path.encode() + b"\0" + git_blob_sha(data).encode())
+        return digest.hexdigest()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def repo_url(self):
+        return f"https://github.com/{self.owner}/{self.repo}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                time.sleep(fake.latency)
+                status, body = fake.handle(urlparse(self.path).path, self.headers.get("Accept", ""))
+                headers = {}
+                if isinstance(body, bytes):
+                    payload = body
+                    headers["Content-Type"] = "application/octet-stream"
+                else:
+                    payload = json.dumps(body).encode()
+                    headers["Content-Type"] = "application/json"
+                    if status == 302:
+                        headers["Location"] = body["location"]
+                headers["Content-Length"] = str(len(payload))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def tarball(self):
+        """Build (once per commit) a gzipped tarball laid out like GitHub's codeload archives."""
+        if self._tarball is None or self._tarball[0] != self.commit_sha:
+            buffer = io.BytesIO()
+            root = f"{self.owner}-{self.repo}-{self.commit_sha[:7]}"
+            with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+                for path, data in self.files.items():
+                    info = tarfile.TarInfo(f"{root}/{path}")
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            self._tarball = (self.commit_sha, buffer.getvalue())
+        return self._tarball[1]
+
+    def handle(self, path, accept=""):
+        repo = self.repo
+        if path.startswith(f"/repos/{self.owner}/"):
+            repo = path.split("/")[3]
+        prefix = f"/repos/{self.owner}/{repo}"
+        repo_api_url = self.base_url + prefix
+        if path == prefix:
+            return 200, {
+                "name": repo,
+                "full_name": f"{self.owner}/{repo}",
+                "default_branch": self.branch,
+                "url": repo_api_url,
+            }
+        if path.startswith(prefix + "/commits/"):
+            return 200, {"sha": self.commit_sha, "url": f"{repo_api_url}/commits/{self.commit_sha}"}
+        if path.startswith(prefix + "/git/trees/"):
+            tree = [
+                {"path": p, "mode": "100644", "type": "blob", "sha": git_blob_sha(data),
+                 "size": len(data), "url": f"{repo_api_url}/git/blobs/{git_blob_sha(data)}"}
+                for p, data in self.files.items()
+            ]
+            return 200, {"sha": self.commit_sha, "tree": tree,
+                         "truncated": False, "url": repo_api_url + "/git/trees"}
+        if path.startswith(prefix + "/contents/"):
+            file_path = unquote(path[len(prefix + "/contents/"):])
+            data = self.files.get(file_path)
+            if data is None:
+                return 404, {"message": "Not Found"}
+            if accept == "application/vnd.github.raw":
+                return 200, data
+            return 200, {
+                "type": "file", "encoding": "base64", "path": file_path,
+                "name": file_path.rsplit("/", 1)[-1], "sha": git_blob_sha(data), "size": len(data),
+                "content": base64.b64encode(data).decode(),
+                "url": f"{repo_api_url}/contents/{file_path}",
+            }
+        if path.startswith(prefix + "/tarball"):
+            return 302, {"location": self.base_url + "/_codeload/tarball"}
+        if path == "/_codeload/tarball":
+            return 200, self.tarball()
+        return 404, {"message": "Not Found"}
@@ -0,0 +1,298 @@
+"""A minimal stand-in for the LLM APIs, answering like a model would for each stage.
+
+Implements the Ollama (/api/generate, /api/chat), OpenAI and Azure OpenAI
+(.../chat/completions) and Anthropic (/v1/messages) endpoints used by the
+generator modules, with and without streaming. The answer depends on the
+prompt: a threat model or DREAD assessment as JSON, mitigations and test
+cases as Markdown, an attack tree as a Mermaid block, each covering `threats`
+threats. Every request waits `latency` seconds before its first token and
+then produces `tokens_per_second` tokens (0 sends the whole answer at once),
+so the app can be measured end to end without network access or API keys.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+STRIDE = ("Spoofing", "Tampering", "Repudiation", "Information Disclosure",
+          "Denial of Service", "Elevation of Privilege")
+
+# Characters per token, as the answers are paced and their usage counted
+CHARS_PER_TOKEN = 4
+
+# Tokens sent in each streamed chunk
+CHUNK_TOKENS = 8
+
+
+def scenario(i):
+    return (f"An attacker abuses weakness {i} in the {STRIDE[i % len(STRIDE)].lower()} controls "
+            f"of endpoint /api/v1/resource/{i} to reach data of other tenants.")
+
+
+def threat_model_answer(threats):
+    return json.dumps({
+        "threat_model": [
+            {"Threat Type": STRIDE[i % len(STRIDE)], "Scenario": scenario(i),
+             "Potential Impact": f"Loss of confidentiality and integrity for the users of resource {i}."}
+            for i in range(threats)
+        ],
+        "improvement_suggestions": [f"Describe how component {i} authenticates its callers." for i in range(3)],
+    })
+
+
+def dread_answer(threats):
+    return json.dumps({
+        "Risk Assessment": [
+            {"Threat Type": STRIDE[i % len(STRIDE)], "Scenario": scenario(i),
+             "Damage Potential": 1 + i % 10, "Reproducibility": 1 + (i * 3) % 10,
+             "Exploitability": 1 + (i * 7) % 10, "Affected Users": 1 + (i * 5) % 10,
+             "Discoverability": 1 + (i * 9) % 10}
+            for i in range(threats)
+        ],
+    })
+
+
+def mitigations_answer(threats):
+    rows = "\n".join(
+        f"| {STRIDE[i % len(STRIDE)]} | {scenario(i)} | Validate the tenant of every request to resource {i} server side. |"
+        for i in range(threats)
+    )
+    return f"| Threat Type | Scenario | Suggested Mitigation(s) |\n|---|---|---|\n{rows}\n"
+
+
+def test_cases_answer(threats):
+    return "\n".join(
+        f"### {STRIDE[i % len(STRIDE)]}\n\n```gherkin\nFeature: Resource {i}\n"
+        f"  Scenario: Another tenant requests resource {i}\n"
+        f"    Given a user of tenant A\n    When they request resource {i} of tenant B\n"
+        f"    Then the request is rejected\n```\n"
+        for i in range(threats)
+    )
+
+
+def attack_tree_answer(threats):
+    nodes = "\n".join(
+        f"    A --> T{i}[\"{STRIDE[i % len(STRIDE)]} on resource {i}\"]\n    T{i} --> L{i}(Reach data of other tenants)"
+        for i in range(threats)
+    )
+    return f"```mermaid\ngraph TD\n    A[Compromise the application]\n{nodes}\n```"
+
+
+def answer_for(text, threats):
+    """Return the answer to a request whose system and user prompts are `text`, shaped by the stage it asks for."""
+    if "Mermaid" in text:
+        return attack_tree_answer(threats)
+    if "Gherkin" in text:
+        return test_cases_answer(threats)
+    if "mitigation" in text:
+        return mitigations_answer(threats)
+    if "DREAD" in text:
+        return dread_answer(threats)
+    return threat_model_answer(threats)
+
+
+def stage_of(text):
+    for stage, word in (("attack_tree", "Mermaid"), ("test_cases", "Gherkin"),
+                        ("mitigations", "mitigation"), ("dread_assessment", "DREAD")):
+        if word in text:
+            return stage
+    return "threat_model"
+
+
+def token_count(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class FakeLLM:
+    def __init__(self, threats=12, latency=0.05, tokens_per_second=0):
+        self.threats = threats
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def request_count(self):
+        return sum(self.requests.values())
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as the app's pooled clients expect
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                api, respond = fake.route(urlparse(self.path).path)
+                if respond is None:
+                    self.send_json(404, {"error": "not found"})
+                    return
+                text = fake.prompt_text(api, body)
+                with fake._lock:
+                    fake.requests[api, stage_of(text)] += 1
+                answer = answer_for(text, fake.threats)
+                time.sleep(fake.latency)
+                respond(self, body, answer, token_count(text))
+
+            def send_json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def start_stream(self, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def write_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def end_stream(self):
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, path):
+        if path == "/api/generate":
+            return "ollama", self.ollama_generate
+        if path == "/api/chat":
+            return "ollama", self.ollama_chat
+        if path.endswith("/chat/completions"):
+            # Azure OpenAI puts the deployment in the path: /openai/deployments/<name>/chat/completions
+            return ("azure" if "/deployments/" in path else "openai"), self.openai_chat
+        if path.endswith("/v1/messages"):
+            return "anthropic", self.anthropic_messages
+        return None, None
+
+    @staticmethod
+    def prompt_text(api, body):
+        if api == "ollama" and "prompt" in body:
+            return body["prompt"]
+        parts = [body.get("system") or ""] if api == "anthropic" else []
+        for message in body.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+            parts.append(content or "")
+        return "\n".join(parts)
+
+    def pieces(self, answer):
+        """Yield the answer in streamed chunks, paced at `tokens_per_second`."""
+        size = CHUNK_TOKENS * CHARS_PER_TOKEN
+        for start in range(0, len(answer), size):
+            if self.tokens_per_second:
+                time.sleep(CHUNK_TOKENS / self.tokens_per_second)
+            yield answer[start:start + size]
+
+    def generation_time(self, answer):
+        return token_count(answer) / self.tokens_per_second if self.tokens_per_second else 0
+
+    def ollama_generate(self, handler, body, answer, prompt_tokens):
+        self._ollama(handler, body, answer, prompt_tokens, lambda text: {"response": text})
+
+    def ollama_chat(self, handler, body, answer, prompt_tokens):
+        self._ollama(handler, body, answer, prompt_tokens,
+                     lambda text: {"message": {"role": "assistant", "content": text}})
+
+    def _ollama(self, handler, body, answer, prompt_tokens, content):
+        model = body.get("model", "")
+        final = {"model": model, "done": True, "done_reason": "stop",
+                 "prompt_eval_count": prompt_tokens, "eval_count": token_count(answer)}
+        if body.get("stream", True) is False:
+            time.sleep(self.generation_time(answer))
+            handler.send_json(200, {**content(answer), **final})
+            return
+        handler.start_stream("application/x-ndjson")
+        for piece in self.pieces(answer):
+            handler.write_chunk((json.dumps({"model": model, "done": False, **content(piece)}) + "\n").encode())
+        handler.write_chunk((json.dumps({**content(""), **final}) + "\n").encode())
+        handler.end_stream()
+
+    def openai_chat(self, handler, body, answer, prompt_tokens):
+        model = body.get("model", "")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": token_count(answer),
+                 "total_tokens": prompt_tokens + token_count(answer)}
+        if not body.get("stream"):
+            time.sleep(self.generation_time(answer))
+            handler.send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        def event(choices, **extra):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices, **extra}
+            handler.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        handler.start_stream("text/event-stream")
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for piece in self.pieces(answer):
+            event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event([], usage=usage)
+        handler.write_chunk(b"data: [DONE]\n\n")
+        handler.end_stream()
+
+    def anthropic_messages(self, handler, body, answer, prompt_tokens):
+        message = {"id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant",
+                   "model": body.get("model", ""), "stop_sequence": None}
+        if not body.get("stream"):
+            time.sleep(self.generation_time(answer))
+            handler.send_json(200, {
+                **message, "content": [{"type": "text", "text": answer}], "stop_reason": "end_turn",
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": token_count(answer)},
+            })
+            return
+
+        def event(name, data):
+            handler.write_chunk(f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode())
+
+        handler.start_stream("text/event-stream")
+        event("message_start", {"message": {**message, "content": [], "stop_reason": None,
+                                            "usage": {"input_tokens": prompt_tokens, "output_tokens": 1}}})
+        event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for piece in self.pieces(answer):
+            event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": piece}})
+        event("content_block_stop", {"index": 0})
+        event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": token_count(answer)}})
+        event("message_stop", {})
+        handler.end_stream()
@@ -1,39 +1,26 @@
 import json
-import requests
-import time
-from anthropic import Anthropic
-from mistralai import Mistral, UserMessage
-from openai import OpenAI, AzureOpenAI
-import streamlit as st
 
-import google.generativeai as genai
+from utils.dread_engine import DreadTable
+from utils.event_loop import run_sync
+from utils.generation import parse_json
+from utils.notify import show_message
+from utils.providers import achat, stream_chat
+from utils.telemetry import traced
 
-def dread_json_to_markdown(dread_assessment):
-    markdown_output = "| Threat Type | Scenario | Damage Potential | Reproducibility | Exploitability | Affected Users | Discoverability | Risk Score |\n"
-    markdown_output += "|-------------|----------|------------------|-----------------|----------------|----------------|-----------------|-------------|\n"
+DREAD_SYSTEM_PROMPT = "You are a helpful assistant designed to output JSON. Only provide the DREAD risk assessment in JSON format with no additional text."
+
+def dread_json_to_markdown(dread_assessment, sort=False):
     try:
-        # Access the list of threats under the "Risk Assessment" key
-        threats = dread_assessment.get("Risk Assessment", [])
-        for threat in threats:
-            # Check if threat is a dictionary
-            if isinstance(threat, dict):
-                damage_potential = threat.get('Damage Potential', 0)
-                reproducibility = threat.get('Reproducibility', 0)
-                exploitability = threat.get('Exploitability', 0)
-                affected_users = threat.get('Affected Users', 0)
-                discoverability = threat.get('Discoverability', 0)
-                
-                # Calculate the Risk Score
-                risk_score = (damage_potential + reproducibility + exploitability + affected_users + discoverability) / 5
-                
-                markdown_output += f"| {threat.get('Threat Type', 'N/A')} | {threat.get('Scenario', 'N/A')} | {damage_potential} | {reproducibility} | {exploitability} | {affected_users} | {discoverability} | {risk_score:.2f} |\n"
-            else:
-                raise TypeError(f"Expected a dictionary, got {type(threat)}: {threat}")
+        # Load the list of threats under the "Risk Assessment" key; risk
+        # scores are computed for all threats at once
+        table = DreadTable.from_assessment(dread_assessment)
+        if sort:
+            table = table.sorted()
+        return table.to_markdown()
     except Exception as e:
         # Print the error message and type for debugging
-        st.write(f"Error: {e}")
+        show_message(f"Error: {e}")
         raise
-    return markdown_output
 
 
 # Function to create a prompt to generate mitigating controls
@@ -81,182 +68,80 @@ Ensure the JSON response is correctly formatted and does not contain any additio
 """
     return prompt
 
+# The functions below are the entry points for each provider. They all go
+# through the async provider layer of utils/providers.py, which caches,
+# schedules and continues every request and repairs cut-off JSON.
+
 # Function to get DREAD risk assessment from the GPT response.
-def get_dread_assessment(api_key, model_name, prompt):
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model_name,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    
-    # Convert the JSON string in the 'content' field to a Python dictionary
-    try:
-        dread_assessment = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError as e:
-        st.write(f"JSON decoding error: {e}")
-        dread_assessment = {}
-    
-    return dread_assessment
+def get_dread_assessment(api_key, model_name, prompt, use_cache=True):
+    return run_sync(aget_dread_assessment("OpenAI", (api_key, model_name), prompt, use_cache=use_cache))
 
 # Function to get DREAD risk assessment from the Azure OpenAI response.
-def get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt):
-    client = AzureOpenAI(
-        azure_endpoint = azure_api_endpoint,
-        api_key = azure_api_key,
-        api_version = azure_api_version,
-    )
-
-    response = client.chat.completions.create(
-        model = azure_deployment_name,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Convert the JSON string in the 'content' field to a Python dictionary
-    try:
-        dread_assessment = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError as e:
-        st.write(f"JSON decoding error: {e}")
-        dread_assessment = {}
-    
-    return dread_assessment
+def get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return run_sync(aget_dread_assessment("Azure OpenAI", credentials, prompt, use_cache=use_cache))
 
 # Function to get DREAD risk assessment from the Google model's response.
-def get_dread_assessment_google(google_api_key, google_model, prompt):
-    genai.configure(api_key=google_api_key)
-    
-    model = genai.GenerativeModel(google_model)
-    
-    # Create the system message
-    system_message = "You are a helpful assistant designed to output JSON. Only provide the DREAD risk assessment in JSON format with no additional text. Do not wrap the output in a code block."
-    
-    # Start a chat session with the system message in the history
-    chat = model.start_chat(history=[
-        {"role": "user", "parts": [system_message]},
-        {"role": "model", "parts": ["Understood. I will provide DREAD risk assessments in JSON format only and will not wrap the output in a code block."]}
-    ])
-    
-    # Send the actual prompt
-    response = chat.send_message(
-        prompt, 
-        safety_settings={
-            'DANGEROUS': 'block_only_high' # Set safety filter to allow generation of DREAD risk assessments
-        })
-    print(response)
-    
-    try:
-        # Access the JSON content from the response
-        dread_assessment = json.loads(response.text)
-        return dread_assessment
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {str(e)}")
-        print("Raw JSON string:")
-        print(response.text)
-        return {}
+def get_dread_assessment_google(google_api_key, google_model, prompt, use_cache=True):
+    return run_sync(aget_dread_assessment("Google", (google_api_key, google_model), prompt, use_cache=use_cache))
 
 # Function to get DREAD risk assessment from the Mistral model's response.
-def get_dread_assessment_mistral(mistral_api_key, mistral_model, prompt):
-    client = Mistral(api_key=mistral_api_key)
+def get_dread_assessment_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return run_sync(aget_dread_assessment("Mistral", (mistral_api_key, mistral_model), prompt, use_cache=use_cache))
 
-    response = client.chat.complete(
-        model=mistral_model,
-        response_format={"type": "json_object"},
-        messages=[
-            UserMessage(content=prompt)
-        ]
-    )
+# Function to get DREAD risk assessment from Ollama hosted LLM.
+def get_dread_assessment_ollama(ollama_model, prompt, use_cache=True):
+    return run_sync(aget_dread_assessment("Ollama", (ollama_model,), prompt, use_cache=use_cache))
 
-    try:
-        # Convert the JSON string in the 'content' field to a Python dictionary
-        dread_assessment = json.loads(response.choices[0].message.content)
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {str(e)}")
-        print("Raw JSON string:")
-        print(response.choices[0].message.content)
-        dread_assessment = {}
+# Function to get DREAD risk assessment from the Anthropic model's response.
+def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return run_sync(aget_dread_assessment("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache=use_cache))
 
-    return dread_assessment
+# Streaming variants of the functions above. They yield the response text as
+# it is generated; feed the chunks to a JSONArrayStreamParser("Risk Assessment")
+# to score each threat as soon as it is complete.
 
-# Function to get DREAD risk assessment from Ollama hosted LLM.
-def get_dread_assessment_ollama(ollama_model, prompt):
-    url = "http://localhost:11434/api/chat"
-    max_retries = 3
-    retry_delay = 2  # seconds
+def _stream_dread_assessment(provider, credentials, prompt, use_cache):
+    return stream_chat(provider, credentials, prompt, system=DREAD_SYSTEM_PROMPT, json_mode=True,
+                       use_cache=use_cache, stage="dread_assessment")
 
-    for attempt in range(1, max_retries + 1):
-        data = {
-            "model": ollama_model,
-            "stream": False,
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": "You are a helpful assistant designed to output JSON. Only provide the DREAD risk assessment in JSON format with no additional text."
-                },
-                {
-                    "role": "user",
-                    "content": prompt,
-                    "format": "json"
-                }
-            ]
-        }
-        
-        try:
-            response = requests.post(url, json=data)
-            outer_json = response.json()
-            response_content = outer_json["message"]["content"]
+# Function to stream the DREAD risk assessment from the GPT response.
+def stream_dread_assessment(api_key, model_name, prompt, use_cache=True):
+    return _stream_dread_assessment("OpenAI", (api_key, model_name), prompt, use_cache)
 
-            # Attempt to parse JSON
-            dread_assessment = json.loads(response_content)
-            return dread_assessment
+# Function to stream the DREAD risk assessment from the Azure OpenAI response.
+def stream_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return _stream_dread_assessment("Azure OpenAI", credentials, prompt, use_cache)
 
-        except json.JSONDecodeError as e:
-            st.error(f"Attempt {attempt}: Error decoding JSON. Retrying...")
-            print(f"Error decoding JSON: {str(e)}")
-            print("Raw JSON string:")
-            print(response_content)
-            
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-            else:
-                st.error("Max retries reached. Unable to generate valid JSON response.")
-                return {}
+# Function to stream the DREAD risk assessment from the Google model's response.
+def stream_dread_assessment_google(google_api_key, google_model, prompt, use_cache=True):
+    return _stream_dread_assessment("Google", (google_api_key, google_model), prompt, use_cache)
 
-    # This line should never be reached due to the return statements above,
-    # but it's here as a fallback
-    return {}
+# Function to stream the DREAD risk assessment from the Mistral model's response.
+def stream_dread_assessment_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return _stream_dread_assessment("Mistral", (mistral_api_key, mistral_model), prompt, use_cache)
 
-# Function to get DREAD risk assessment from the Anthropic model's response.
-def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt):
-    client = Anthropic(api_key=anthropic_api_key)
-    response = client.messages.create(
-        model=anthropic_model,
-        max_tokens=4096,
-        system="You are a helpful assistant designed to output JSON.",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
+# Function to stream the DREAD risk assessment from Ollama hosted LLM.
+def stream_dread_assessment_ollama(ollama_model, prompt, use_cache=True):
+    return _stream_dread_assessment("Ollama", (ollama_model,), prompt, use_cache)
+
+# Function to stream the DREAD risk assessment from the Anthropic model's response.
+def stream_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return _stream_dread_assessment("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache)
+
+
+# Function to get a DREAD risk assessment from any provider through the async provider layer.
+@traced("generate", stage="dread_assessment")
+async def aget_dread_assessment(provider, credentials, prompt, use_cache=True):
+    response_text = await achat(
+        provider, credentials, prompt,
+        system=DREAD_SYSTEM_PROMPT, json_mode=True, use_cache=use_cache,
     )
-    
     try:
-        # Extract the text content from the first content block
-        response_text = response.content[0].text
-        
-        # Check if the JSON is complete (should end with a closing brace)
-        if not response_text.strip().endswith('}'):
-            raise json.JSONDecodeError("Incomplete JSON response", response_text, len(response_text))
-            
-        # Parse the JSON string
-        dread_assessment = json.loads(response_text)
-        return dread_assessment
-    except (json.JSONDecodeError, IndexError, AttributeError) as e:
-        print(f"Error processing response: {str(e)}")
-        print("Raw response:")
-        print(response)
-        return {}
\ No newline at end of file
+        return parse_json(response_text)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON: {str(e)}")
+        print("Raw JSON string:")
+        print(response_text)
+        return {}
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from attack_tree import aget_attack_tree, create_attack_tree_prompt, get_attack_tree, get_attack_tree_anthropic, get_attack_tree_azure, get_attack_tree_mistral, get_attack_tree_ollama
+from dread import aget_dread_assessment, create_dread_assessment_prompt, get_dread_assessment, get_dread_assessment_anthropic, get_dread_assessment_azure, get_dread_assessment_google, get_dread_assessment_mistral, get_dread_assessment_ollama, stream_dread_assessment, stream_dread_assessment_anthropic, stream_dread_assessment_azure, stream_dread_assessment_google, stream_dread_assessment_mistral, stream_dread_assessment_ollama
+from mitigations import aget_mitigations, create_mitigations_prompt, get_mitigations, get_mitigations_anthropic, get_mitigations_azure, get_mitigations_google, get_mitigations_mistral, get_mitigations_ollama, stream_mitigations, stream_mitigations_anthropic, stream_mitigations_azure, stream_mitigations_google, stream_mitigations_mistral, stream_mitigations_ollama
+from test_cases import aget_test_cases, create_test_cases_prompt, get_test_cases, get_test_cases_anthropic, get_test_cases_azure, get_test_cases_google, get_test_cases_mistral, get_test_cases_ollama, stream_test_cases, stream_test_cases_anthropic, stream_test_cases_azure, stream_test_cases_google, stream_test_cases_mistral, stream_test_cases_ollama
+from threat_model import json_to_markdown
+from utils.generation import parse_json
+from utils.telemetry import traced
+
+DEFAULT_STAGE_TIMEOUT = 300
+
+# How often a running pipeline checks for cancellation while it waits
+POLL_INTERVAL = 0.2
+
+STAGE_RUNNING = "running"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_TIMEOUT = "timeout"
+STAGE_CANCELLED = "cancelled"
+STAGE_UNSUPPORTED = "unsupported"
+
+# Session state keys holding the credentials and model of each provider, in
+# the order the generator functions take them (before the prompt).
+PROVIDER_ARGS = {
+    "OpenAI": ("openai_api_key", "model_name"),
+    "Azure OpenAI": ("azure_api_endpoint", "azure_api_key", "azure_api_version", "azure_deployment_name"),
+    "Google": ("google_api_key", "google_model"),
+    "Anthropic": ("anthropic_api_key", "anthropic_model"),
+    "Mistral": ("mistral_api_key", "mistral_model"),
+    "Ollama": ("ollama_model",),
+}
+
+# The downstream stages run once a threat model exists, with the generator
+# function of each provider. A provider missing from a stage does not support it.
+STAGES = {
+    "mitigations": {
+        "OpenAI": get_mitigations,
+        "Azure OpenAI": get_mitigations_azure,
+        "Google": get_mitigations_google,
+        "Anthropic": get_mitigations_anthropic,
+        "Mistral": get_mitigations_mistral,
+        "Ollama": get_mitigations_ollama,
+    },
+    "attack_tree": {
+        "OpenAI": get_attack_tree,
+        "Azure OpenAI": get_attack_tree_azure,
+        "Anthropic": get_attack_tree_anthropic,
+        "Mistral": get_attack_tree_mistral,
+        "Ollama": get_attack_tree_ollama,
+    },
+    "test_cases": {
+        "OpenAI": get_test_cases,
+        "Azure OpenAI": get_test_cases_azure,
+        "Google": get_test_cases_google,
+        "Anthropic": get_test_cases_anthropic,
+        "Mistral": get_test_cases_mistral,
+        "Ollama": get_test_cases_ollama,
+    },
+    "dread_assessment": {
+        "OpenAI": get_dread_assessment,
+        "Azure OpenAI": get_dread_assessment_azure,
+        "Google": get_dread_assessment_google,
+        "Anthropic": get_dread_assessment_anthropic,
+        "Mistral": get_dread_assessment_mistral,
+        "Ollama": get_dread_assessment_ollama,
+    },
+}
+
+# The streaming generator functions of the stages that have them. With
+# `stream` set the pipeline reports their text as it arrives; the attack tree
+# is only drawn once complete, so it is always generated whole.
+STREAM_STAGES = {
+    "mitigations": {
+        "OpenAI": stream_mitigations,
+        "Azure OpenAI": stream_mitigations_azure,
+        "Google": stream_mitigations_google,
+        "Anthropic": stream_mitigations_anthropic,
+        "Mistral": stream_mitigations_mistral,
+        "Ollama": stream_mitigations_ollama,
+    },
+    "test_cases": {
+        "OpenAI": stream_test_cases,
+        "Azure OpenAI": stream_test_cases_azure,
+        "Google": stream_test_cases_google,
+        "Anthropic": stream_test_cases_anthropic,
+        "Mistral": stream_test_cases_mistral,
+        "Ollama": stream_test_cases_ollama,
+    },
+    "dread_assessment": {
+        "OpenAI": stream_dread_assessment,
+        "Azure OpenAI": stream_dread_assessment_azure,
+        "Google": stream_dread_assessment_google,
+        "Anthropic": stream_dread_assessment_anthropic,
+        "Mistral": stream_dread_assessment_mistral,
+        "Ollama": stream_dread_assessment_ollama,
+    },
+}
+
+# Turns the streamed text of a stage into the result its get_* function returns
+STREAM_RESULTS = {
+    "dread_assessment": parse_json,
+}
+
+# The same stages through the async provider layer; these take
+# (provider, credentials, prompt) and work with every provider.
+ASYNC_STAGES = {
+    "mitigations": aget_mitigations,
+    "attack_tree": aget_attack_tree,
+    "test_cases": aget_test_cases,
+    "dread_assessment": aget_dread_assessment,
+}
+
+StageResult = namedtuple("StageResult", ["stage", "status", "result", "error", "seconds"])
+
+
+def stage_timeout():
+    return float(os.getenv('STRIDE_GPT_STAGE_TIMEOUT', DEFAULT_STAGE_TIMEOUT))
+
+
+def provider_args(provider, settings):
+    """Return the arguments `provider` needs from `settings` (e.g. st.session_state), or None if any is missing."""
+    names = PROVIDER_ARGS.get(provider)
+    if names is None or any(name not in settings for name in names):
+        return None
+    return tuple(settings[name] for name in names)
+
+
+@traced("prompt_build")
+def create_stage_prompts(threat_model, app_type, authentication, internet_facing, sensitive_data, app_input):
+    """Build the prompt of every downstream stage from a generated threat model."""
+    threats_markdown = json_to_markdown(
+        threat_model.get('threat_model', []), threat_model.get('improvement_suggestions', [])
+    )
+    return {
+        "mitigations": create_mitigations_prompt(threats_markdown),
+        "attack_tree": create_attack_tree_prompt(app_type, authentication, internet_facing, sensitive_data, app_input),
+        "test_cases": create_test_cases_prompt(threats_markdown),
+        "dread_assessment": create_dread_assessment_prompt(threats_markdown),
+    }
+
+
+class DownstreamPipeline:
+    """Run the downstream stages of one threat model concurrently.
+
+    Every stage gets its own thread and deadline, so a full report takes
+    about as long as the slowest stage. `results()` yields a StageResult for
+    each stage as it finishes, fails, times out or is cancelled. A provider
+    call cannot be interrupted once it has been sent: a stage that times out
+    or is cancelled while running is abandoned and its late result dropped
+    (the HTTP timeouts in utils/clients.py still bound the thread).
+
+    With `stream` set, the stages in STREAM_STAGES are streamed: while they
+    run, `results()` also yields STAGE_RUNNING results holding the text
+    received so far, and a streamed stage stops reading as soon as it is
+    cancelled or times out.
+    """
+
+    def __init__(self, provider, credentials, prompts, timeout=None, use_cache=True, stream=False):
+        self.provider = provider
+        self.credentials = tuple(credentials)
+        self.prompts = dict(prompts)
+        self.timeout = stage_timeout() if timeout is None else timeout
+        self.use_cache = use_cache
+        self.stream = stream
+        self._futures = {}
+        self._deadlines = {}
+        self._started = {}
+        self._cancelled = set()
+        # Chunks received so far by each streamed stage
+        self._chunks = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.prompts)), thread_name_prefix="stride-gpt-stage"
+        )
+        for stage, prompt in self.prompts.items():
+            func = STAGES[stage].get(self.provider)
+            stream_func = STREAM_STAGES.get(stage, {}).get(self.provider) if self.stream else None
+            if func is None:
+                continue
+            self._started[stage] = time.monotonic()
+            self._deadlines[stage] = self._started[stage] + self.timeout
+            if stream_func is not None:
+                self._chunks[stage] = []
+                self._futures[stage] = self._executor.submit(self._read_stream, stage, stream_func, prompt)
+            else:
+                self._futures[stage] = self._executor.submit(
+                    func, *self.credentials, prompt, use_cache=self.use_cache
+                )
+        return self
+
+    def _read_stream(self, stage, func, prompt):
+        chunks = self._chunks[stage]
+        stream = func(*self.credentials, prompt, use_cache=self.use_cache)
+        try:
+            for chunk in stream:
+                with self._lock:
+                    # Nobody waits for the rest; closing the stream ends the request
+                    if stage in self._cancelled:
+                        return None
+                    if time.monotonic() > self._deadlines[stage]:
+                        raise TimeoutError(f"No response within {self.timeout:g} seconds")
+                    chunks.append(chunk)
+        finally:
+            stream.close()
+        return STREAM_RESULTS.get(stage, str)("".join(chunks))
+
+    def _progress(self, stage, reported):
+        """Return the text streamed by `stage` if it grew since `reported` chunks, else None."""
+        chunks = self._chunks.get(stage)
+        if chunks is None:
+            return None
+        with self._lock:
+            if len(chunks) == reported.get(stage, 0):
+                return None
+            reported[stage] = len(chunks)
+            return "".join(chunks)
+
+    def cancel(self, stage=None):
+        """Cancel one stage, or every stage still running when `stage` is None."""
+        with self._lock:
+            stages = list(self.prompts) if stage is None else [stage]
+            for name in stages:
+                self._cancelled.add(name)
+                future = self._futures.get(name)
+                if future is not None:
+                    future.cancel()
+
+    def results(self):
+        if self._executor is None:
+            self.start()
+        pending = {future: stage for stage, future in self._futures.items()}
+        reported = {}
+        try:
+            for stage in self.prompts:
+                if stage not in self._futures:
+                    yield StageResult(stage, STAGE_UNSUPPORTED, None,
+                                      f"{self.provider} does not support this stage", 0.0)
+
+            while pending:
+                now = time.monotonic()
+                with self._lock:
+                    cancelled = [future for future, stage in pending.items() if stage in self._cancelled]
+                for future in cancelled:
+                    stage = pending.pop(future)
+                    yield StageResult(stage, STAGE_CANCELLED, None, None, now - self._started[stage])
+                expired = [future for future, stage in pending.items() if self._deadlines[stage] <= now]
+                for future in expired:
+                    stage = pending.pop(future)
+                    future.cancel()
+                    yield StageResult(stage, STAGE_TIMEOUT, None,
+                                      f"No response within {self.timeout:g} seconds", now - self._started[stage])
+                if not pending:
+                    break
+
+                next_deadline = min(self._deadlines[stage] for stage in pending.values())
+                done, _ = wait(pending, timeout=max(0.0, min(next_deadline - now, POLL_INTERVAL)),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = pending.pop(future)
+                    yield self._stage_result(stage, future)
+                for stage in pending.values():
+                    text = self._progress(stage, reported)
+                    if text is not None:
+                        yield StageResult(stage, STAGE_RUNNING, text, None, time.monotonic() - self._started[stage])
+        finally:
+            # Also reached when the caller stops iterating, e.g. on a Streamlit rerun
+            for future in pending:
+                future.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _stage_result(self, stage, future):
+        seconds = time.monotonic() - self._started[stage]
+        if future.cancelled():
+            return StageResult(stage, STAGE_CANCELLED, None, None, seconds)
+        error = future.exception()
+        if isinstance(error, TimeoutError):
+            return StageResult(stage, STAGE_TIMEOUT, None, str(error), seconds)
+        if error is not None:
+            return StageResult(stage, STAGE_FAILED, None, str(error), seconds)
+        result = future.result()
+        if not result:
+            return StageResult(stage, STAGE_FAILED, None, "The model returned an empty response", seconds)
+        return StageResult(stage, STAGE_DONE, result, None, seconds)
+
+
+def run_downstream(provider, credentials, prompts, timeout=None, use_cache=True, stream=False):
+    """Start the stages in `prompts` and yield their StageResults as they complete."""
+    return DownstreamPipeline(
+        provider, credentials, prompts, timeout=timeout, use_cache=use_cache, stream=stream
+    ).results()
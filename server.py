@@ -0,0 +1,417 @@
+"""HTTP job service for threat-model generation.
+
+    python server.py --port 8600 --workers 4
+
+Jobs are kept in a SQLite queue (utils/job_queue.py) and run by a pool of
+worker threads, so a browser refresh or a Streamlit rerun no longer loses
+in-flight generations: the client just looks the job up again. Submitting a
+job identical to one that is queued, running or recently finished returns
+that job instead of calling the provider a second time.
+
+    POST   /jobs              {"kind", "params", "credentials"} -> the job
+    GET    /jobs/<id>         the job, with its result once finished
+    GET    /jobs/<id>/events  server-sent events, one per status change
+    DELETE /jobs/<id>         cancel a queued or running job
+    GET    /health            job counts per status
+    GET    /metrics           stage and provider metrics, Prometheus text format
+    GET    /traces?limit=N    the most recent spans, as JSON
+
+`kind` is "threat_model", "mitigations", "attack_tree", "test_cases" or
+"dread_assessment". `params` holds "provider", "model" and either a ready
+"prompt" or the application fields ("app_type", "authentication",
+"internet_facing", "sensitive_data", "app_input", optionally "repo"), plus
+"threat_model" for the downstream kinds. A threat_model job with "sharded"
+set, or with one prompt per STRIDE category in "prompts", generates the
+categories concurrently and merges them. Credentials are optional, in the
+order the provider's generator functions take them; they are held in memory
+only and never written to the queue. Without them the service uses its own
+environment, as batch.py does. Set STRIDE_GPT_API_TOKEN to require a bearer
+token on every request.
+
+"repo" must be a GitHub repository URL. Local repositories can only be
+analysed from under the directory given with --repo-root (or
+STRIDE_GPT_REPO_ROOT), with "repo" a path relative to it.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from batch import analyze_repo, is_repo_url, provider_settings
+from pipeline import ASYNC_STAGES, create_stage_prompts, provider_args, stage_timeout
+from threat_model import aget_threat_model, aget_threat_model_sharded, create_sharded_threat_model_prompts, create_threat_model_prompt
+from utils.event_loop import submit
+from utils.job_queue import FINISHED_STATUSES, JOB_CANCELLED, JOB_QUEUED, JobQueue, credentials_fingerprint
+from utils.load_env import load_env
+from utils.providers import PROVIDERS
+from utils.repo_analysis import github_api_url
+from utils.telemetry import get_telemetry
+
+DEFAULT_PORT = 8600
+DEFAULT_WORKERS = 4
+
+# Seconds between checks of the queue by idle workers, of the job status by
+# busy workers (for cancellation) and of a job by the event stream
+POLL_INTERVAL = 0.5
+
+# Seconds between keep-alive comments on an otherwise idle event stream
+KEEPALIVE_INTERVAL = 15
+
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+JOB_KINDS = ("threat_model", *ASYNC_STAGES)
+
+JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(/events)?$")
+
+# The path of a repository URL: /<owner>/<repo>, nothing below it
+REPO_URL_PATH = re.compile(r"^/[\w.-]+/[\w.-]+/?$")
+
+
+def github_hosts():
+    """Return the hosts whose repositories jobs may name: github.com and the GITHUB_API_URL server."""
+    hosts = {"github.com", "www.github.com"}
+    if os.getenv('GITHUB_API_URL'):
+        hosts.add(urlsplit(github_api_url()).hostname)
+    return hosts
+
+
+def _app_fields(params):
+    return (
+        params.get("app_type", ""),
+        params.get("authentication", []),
+        params.get("internet_facing", ""),
+        params.get("sensitive_data", []),
+        params.get("app_input", ""),
+    )
+
+
+async def execute_job(kind, params, credentials):
+    """Run one job and return its result."""
+    provider = params["provider"]
+    use_cache = params.get("use_cache", True)
+    prompt = params.get("prompt")
+
+    if kind == "threat_model":
+        prompts = params.get("prompts")
+        if prompt is None and prompts is None:
+            app_type, authentication, internet_facing, sensitive_data, app_input = _app_fields(params)
+            repo_index = None
+            if params.get("repo"):
+                system_description, repo_index = await asyncio.to_thread(
+                    analyze_repo, params["repo"], params["model"], use_cache
+                )
+                if not system_description:
+                    raise RuntimeError("repository analysis returned no description")
+                app_input = system_description + "\n\n" + app_input
+            if params.get("sharded"):
+                prompts = create_sharded_threat_model_prompts(
+                    app_type, authentication, internet_facing, sensitive_data, app_input, repo_index=repo_index,
+                )
+            else:
+                prompt = create_threat_model_prompt(
+                    app_type, authentication, internet_facing, sensitive_data, app_input, repo_index=repo_index,
+                )
+        if prompts is not None:
+            result = await aget_threat_model_sharded(provider, credentials, prompts, use_cache=use_cache)
+        else:
+            result = await aget_threat_model(provider, credentials, prompt, use_cache=use_cache)
+    else:
+        if prompt is None:
+            prompt = create_stage_prompts(params["threat_model"], *_app_fields(params))[kind]
+        result = await ASYNC_STAGES[kind](provider, credentials, prompt, use_cache=use_cache)
+
+    if not result:
+        raise RuntimeError("the model returned an empty response")
+    return result
+
+
+class JobService:
+    """Accept jobs into a JobQueue and run them on a pool of worker threads."""
+
+    def __init__(self, queue, workers=DEFAULT_WORKERS, timeout=None, repo_root=None):
+        self.queue = queue
+        self.workers = workers
+        self.timeout = stage_timeout() if timeout is None else timeout
+        # Local repositories are only read from under this directory
+        repo_root = repo_root or os.getenv('STRIDE_GPT_REPO_ROOT')
+        self.repo_root = os.path.realpath(os.path.expanduser(repo_root)) if repo_root else None
+        # Per-request credentials, by job id. Kept in memory only: after a
+        # restart the queued jobs run with the service's own credentials.
+        self._credentials = {}
+        self._credentials_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def validate(self, kind, params):
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}; expected one of {', '.join(JOB_KINDS)}")
+        if not isinstance(params, dict):
+            raise ValueError("params must be an object")
+        if params.get("provider") not in PROVIDERS:
+            raise ValueError(f"params.provider must be one of {', '.join(PROVIDERS)}")
+        if not params.get("model"):
+            raise ValueError("params.model is required")
+        if kind != "threat_model" and "prompt" not in params and "threat_model" not in params:
+            raise ValueError(f"A {kind} job needs params.prompt or params.threat_model")
+        if params.get("repo"):
+            params["repo"] = self.check_repo(params["repo"])
+
+    def check_repo(self, repo):
+        """Return `repo` as analyze_repo should read it, or raise ValueError if a job may not name it.
+
+        Anyone who can reach the service submits jobs, so it must not read
+        arbitrary directories of the host or spend its GitHub token on any URL.
+        """
+        if not isinstance(repo, str):
+            raise ValueError("params.repo must be a string")
+        if is_repo_url(repo):
+            parts = urlsplit(repo)
+            if parts.hostname not in github_hosts() or not REPO_URL_PATH.match(parts.path) or parts.query:
+                raise ValueError("params.repo must be the URL of a GitHub repository")
+            return repo
+        if self.repo_root is None:
+            raise ValueError("params.repo must be the URL of a GitHub repository")
+        path = os.path.realpath(os.path.join(self.repo_root, repo))
+        if os.path.commonpath([self.repo_root, path]) != self.repo_root:
+            raise ValueError("params.repo must be a path under the service's repository root")
+        return path
+
+    def submit(self, kind, params, credentials=None):
+        self.validate(kind, params)
+        # Callers with different credentials never share a job: another key
+        # may be invalid, or belong to someone who should not see the result
+        principal = credentials_fingerprint(params["provider"], credentials)
+        job = self.queue.submit(kind, params, reuse_done=params.get("use_cache", True), principal=principal)
+        # A running or finished job is never claimed again, so its caller's
+        # credentials would stay in memory for good
+        if credentials and job["status"] == JOB_QUEUED:
+            with self._credentials_lock:
+                self._credentials.setdefault(job["id"], tuple(credentials))
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job_id):
+        with self._credentials_lock:
+            self._credentials.pop(job_id, None)
+        return self.queue.cancel(job_id)
+
+    def credentials_for(self, job):
+        with self._credentials_lock:
+            credentials = self._credentials.pop(job["id"], None)
+        if credentials is None:
+            params = job["params"]
+            credentials = provider_args(params["provider"], provider_settings(params["provider"], params["model"]))
+        if credentials is None:
+            raise RuntimeError(f"No {job['params']['provider']} credentials were given and none are configured")
+        return credentials
+
+    def start(self):
+        # Jobs this database shows as running were left behind by a stopped service
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"Requeued {requeued} interrupted jobs", file=sys.stderr)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{self.name}-{number}",),
+                                      name=f"stride-gpt-job-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _work(self, worker):
+        while not self._stopping.is_set():
+            job = self.queue.claim(worker)
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.run(job)
+
+    def run(self, job):
+        try:
+            credentials = self.credentials_for(job)
+        except Exception as e:
+            self.queue.fail(job["id"], str(e))
+            return
+
+        future = submit(execute_job(job["kind"], job["params"], credentials))
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                result = future.result(timeout=POLL_INTERVAL)
+            except TimeoutError:
+                if self.queue.status(job["id"]) == JOB_CANCELLED or self._stopping.is_set():
+                    # Cancelling the task aborts the request in flight
+                    future.cancel()
+                    return
+                if time.monotonic() > deadline:
+                    future.cancel()
+                    self.queue.fail(job["id"], f"No result within {self.timeout:g} seconds")
+                    return
+                continue
+            except Exception as e:
+                self.queue.fail(job["id"], f"{type(e).__name__}: {e}")
+                return
+            self.queue.complete(job["id"], result)
+            return
+
+
+def public_job(job):
+    return {name: value for name, value in job.items() if name not in ("key", "worker")}
+
+
+def make_handler(service, token=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _authorized(self):
+            if not token:
+                return True
+            header = self.headers.get("Authorization", "")
+            if hmac.compare_digest(header, f"Bearer {token}"):
+                return True
+            self._send_json(401, {"error": "missing or invalid bearer token"})
+            return False
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_text(self, status, text, content_type):
+            payload = text.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urlsplit(self.path)
+            path, query = url.path, url.query
+            if path == "/health":
+                self._send_json(200, {"status": "ok", "jobs": service.queue.counts()})
+                return
+            if path == "/metrics":
+                self._send_text(200, get_telemetry().prometheus_text(), PROMETHEUS_CONTENT_TYPE)
+                return
+            if path == "/traces":
+                limit = parse_qs(query).get("limit", [None])[0]
+                self._send_text(200, get_telemetry().traces_json(int(limit) if limit else None), "application/json")
+                return
+            match = JOB_PATH.match(path)
+            job = service.queue.get(match.group(1)) if match else None
+            if job is None:
+                self._send_json(404, {"error": "not found"})
+            elif match.group(2):
+                self._stream_events(job)
+            else:
+                self._send_json(200, public_job(job))
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if urlsplit(self.path).path != "/jobs":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_REQUEST_BYTES:
+                self._send_json(413, {"error": "request too large"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                job = service.submit(body.get("kind"), body.get("params"), body.get("credentials"))
+            except (ValueError, AttributeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(200 if job["status"] in FINISHED_STATUSES else 202, public_job(job))
+
+        def do_DELETE(self):
+            if not self._authorized():
+                return
+            match = JOB_PATH.match(urlsplit(self.path).path)
+            if not match or match.group(2) or service.queue.get(match.group(1)) is None:
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, {"cancelled": service.cancel(match.group(1))})
+
+        def _stream_events(self, job):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            last_update = None
+            last_write = time.monotonic()
+            try:
+                while True:
+                    if job["updated"] != last_update:
+                        last_update = job["updated"]
+                        self.wfile.write(f"event: {job['status']}\ndata: {json.dumps(public_job(job))}\n\n".encode())
+                        self.wfile.flush()
+                        last_write = time.monotonic()
+                        if job["status"] in FINISHED_STATUSES:
+                            return
+                    elif time.monotonic() - last_write > KEEPALIVE_INTERVAL:
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                        last_write = time.monotonic()
+                    time.sleep(POLL_INTERVAL)
+                    job = service.queue.get(job["id"])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="jobs run at once")
+    parser.add_argument("--db", help="SQLite job database (default: jobs.sqlite3 in STRIDE_GPT_CACHE_DIR)")
+    parser.add_argument("--repo-root", help="directory local repositories may be analysed from (default: "
+                                            "STRIDE_GPT_REPO_ROOT; without it only GitHub URLs are accepted)")
+    args = parser.parse_args(argv)
+    load_env()
+
+    service = JobService(JobQueue(args.db), workers=args.workers, repo_root=args.repo_root).start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, os.getenv('STRIDE_GPT_API_TOKEN')))
+    server.daemon_threads = True
+    print(f"Serving jobs on http://{args.host}:{server.server_address[1]} with {args.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,8 @@
-import requests
-from anthropic import Anthropic
-from mistralai import Mistral
-from openai import OpenAI, AzureOpenAI
+from utils.event_loop import run_sync
+from utils.providers import achat, stream_chat
+from utils.telemetry import traced
 
-import google.generativeai as genai
+TEST_CASES_SYSTEM_PROMPT = "You are a helpful assistant that provides Gherkin test cases in Markdown format."
 
 # Function to create a prompt to generate mitigating controls
 def create_test_cases_prompt(threats):
@@ -30,115 +29,70 @@ YOUR RESPONSE (do not add introductory text, just provide the Gherkin test cases
     return prompt
 
 
+# The functions below are the entry points for each provider. They all go
+# through the async provider layer of utils/providers.py, which caches,
+# schedules and continues every request.
+
 # Function to get test cases from the GPT response.
-def get_test_cases(api_key, model_name, prompt):
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model = model_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the content directly as the response will be in text format
-    test_cases = response.choices[0].message.content
-
-    return test_cases
-
-# Function to get mitigations from the Azure OpenAI response.
-def get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt):
-    client = AzureOpenAI(
-        azure_endpoint = azure_api_endpoint,
-        api_key = azure_api_key,
-        api_version = azure_api_version,
-    )
-
-    response = client.chat.completions.create(
-        model = azure_deployment_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the content directly as the response will be in text format
-    test_cases = response.choices[0].message.content
-
-    return test_cases
+def get_test_cases(api_key, model_name, prompt, use_cache=True):
+    return run_sync(aget_test_cases("OpenAI", (api_key, model_name), prompt, use_cache=use_cache))
+
+# Function to get test cases from the Azure OpenAI response.
+def get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return run_sync(aget_test_cases("Azure OpenAI", credentials, prompt, use_cache=use_cache))
 
 # Function to get test cases from the Google model's response.
-def get_test_cases_google(google_api_key, google_model, prompt):
-    genai.configure(api_key=google_api_key)
-    model = genai.GenerativeModel(
-        google_model,
-        system_instruction="You are a helpful assistant that provides Gherkin test cases in Markdown format.",
-    )
-    response = model.generate_content(prompt)
-    
-    # Access the content directly as the response will be in text format
-    test_cases = response.candidates[0].content.parts[0].text
-
-    return test_cases
+def get_test_cases_google(google_api_key, google_model, prompt, use_cache=True):
+    return run_sync(aget_test_cases("Google", (google_api_key, google_model), prompt, use_cache=use_cache))
 
 # Function to get test cases from the Mistral model's response.
-def get_test_cases_mistral(mistral_api_key, mistral_model, prompt):
-    client = Mistral(api_key=mistral_api_key)
+def get_test_cases_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return run_sync(aget_test_cases("Mistral", (mistral_api_key, mistral_model), prompt, use_cache=use_cache))
 
-    response = client.chat.complete(
-        model = mistral_model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
-    )
+# Function to get test cases from Ollama hosted LLM.
+def get_test_cases_ollama(ollama_model, prompt, use_cache=True):
+    return run_sync(aget_test_cases("Ollama", (ollama_model,), prompt, use_cache=use_cache))
 
-    # Access the content directly as the response will be in text format
-    test_cases = response.choices[0].message.content
+# Function to get test cases from the Anthropic model's response.
+def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return run_sync(aget_test_cases("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache=use_cache))
 
-    return test_cases
 
-# Function to get test cases from Ollama hosted LLM.
-def get_test_cases_ollama(ollama_model, prompt):
-    
-    url = "http://localhost:11434/api/chat"
-
-    data = {
-        "model": ollama_model,
-        "stream": False,
-        "messages": [
-            {
-                "role": "system", 
-                "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    }
-    response = requests.post(url, json=data)
-
-    outer_json = response.json()
-    
-    # Access the 'content' attribute of the 'message' dictionary
-    mitigations = outer_json["message"]["content"]
-
-    return mitigations
+# Streaming variants of the functions above. They yield the Markdown as it
+# is generated so it can be shown while the model is still writing.
 
-# Function to get test cases from the Anthropic model's response.
-def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt):
-    client = Anthropic(api_key=anthropic_api_key)
-    response = client.messages.create(
-        model=anthropic_model,
-        max_tokens=4096,
-        system="You are a helpful assistant that provides Gherkin test cases in Markdown format.",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Access the text content from the first content block
-    test_cases = response.content[0].text
-
-    return test_cases
\ No newline at end of file
+def _stream_test_cases(provider, credentials, prompt, use_cache):
+    return stream_chat(provider, credentials, prompt, system=TEST_CASES_SYSTEM_PROMPT,
+                       use_cache=use_cache, stage="test_cases")
+
+# Function to stream test cases from the GPT response.
+def stream_test_cases(api_key, model_name, prompt, use_cache=True):
+    return _stream_test_cases("OpenAI", (api_key, model_name), prompt, use_cache)
+
+# Function to stream test cases from the Azure OpenAI response.
+def stream_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return _stream_test_cases("Azure OpenAI", credentials, prompt, use_cache)
+
+# Function to stream test cases from the Google model's response.
+def stream_test_cases_google(google_api_key, google_model, prompt, use_cache=True):
+    return _stream_test_cases("Google", (google_api_key, google_model), prompt, use_cache)
+
+# Function to stream test cases from the Mistral model's response.
+def stream_test_cases_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return _stream_test_cases("Mistral", (mistral_api_key, mistral_model), prompt, use_cache)
+
+# Function to stream test cases from Ollama hosted LLM.
+def stream_test_cases_ollama(ollama_model, prompt, use_cache=True):
+    return _stream_test_cases("Ollama", (ollama_model,), prompt, use_cache)
+
+# Function to stream test cases from the Anthropic model's response.
+def stream_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return _stream_test_cases("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache)
+
+
+# Function to get test cases from any provider through the async provider layer.
+@traced("generate", stage="test_cases")
+async def aget_test_cases(provider, credentials, prompt, use_cache=True):
+    return await achat(provider, credentials, prompt, system=TEST_CASES_SYSTEM_PROMPT, use_cache=use_cache)
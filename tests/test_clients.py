@@ -0,0 +1,50 @@
+import asyncio
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+from utils import clients
+
+
+class Client:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(clients, "MAX_CLIENTS", 2)
+    monkeypatch.setattr(clients, "_clients", OrderedDict())
+
+
+def test_clients_are_shared_per_key():
+    first = clients._get_or_create("a", Client)
+    assert clients._get_or_create("a", Client) is first
+    assert clients._get_or_create("b", Client) is not first
+
+
+def test_the_least_recently_used_client_is_dropped_but_left_open():
+    a = clients._get_or_create("a", Client)
+    b = clients._get_or_create("b", Client)
+    clients._get_or_create("a", Client)
+    clients._get_or_create("c", Client)
+    assert list(clients._clients) == ["a", "c"]
+    # Another session may still be using it, so only the registry lets go
+    assert not b.closed and not a.closed
+    assert clients._get_or_create("b", Client) is not b
+
+
+def test_async_clients_are_dropped_per_loop():
+    async def run():
+        created = [clients._get_or_create_async(key, httpx.AsyncClient) for key in "abc"]
+        registry = clients._async_clients[asyncio.get_running_loop()]
+        assert list(registry) == ["b", "c"]
+        assert not created[0].is_closed
+        for client in created:
+            await client.aclose()
+
+    asyncio.run(run())
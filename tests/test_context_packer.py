@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from utils import context_packer
+from utils.context_packer import PACK_GREEDY, PACK_KNAPSACK, PackItem, TokenCounter, pack, pack_greedy, pack_knapsack
+
+
+@pytest.fixture
+def without_tiktoken(monkeypatch):
+    monkeypatch.setattr(context_packer, "tiktoken", None)
+
+
+def test_the_fallback_counter_estimates_per_provider(without_tiktoken):
+    gpt = TokenCounter("gpt-4o")
+    assert gpt.name == "chars/4.0"
+    assert gpt.count("x" * 10) == 3
+    assert TokenCounter("claude-3-5-sonnet").count("x" * 7) == 2
+    assert TokenCounter("unknown-model").name == "chars/3.5"
+    assert gpt.count("") == 0
+
+
+def test_knapsack_finds_the_better_pair_greedy_misses():
+    # Greedy takes the best score per token first and then nothing else fits
+    items = [PackItem("a", 6, 7.0), PackItem("b", 5, 5.0), PackItem("c", 5, 5.0)]
+    assert pack_greedy(items, 10) == ["a"]
+    assert sorted(pack_knapsack(items, 10)) == ["b", "c"]
+
+
+def test_items_larger_than_the_budget_are_never_packed():
+    assert pack_knapsack([PackItem("big", 11, 100.0)], 10) == []
+    assert pack_greedy([PackItem("big", 11, 100.0)], 10) == []
+
+
+@pytest.mark.parametrize("budget", [50, 1000, 20000])
+def test_packing_never_exceeds_the_budget(without_tiktoken, budget):
+    rng = random.Random(budget)
+    counter = TokenCounter("gpt-4o")
+    for _ in range(20):
+        summaries = {f"file{index}.py": "x" * rng.randint(1, budget) for index in range(30)}
+        items = [PackItem(path, counter.count(summary), rng.uniform(0.25, 10))
+                 for path, summary in summaries.items()]
+        scores = {item.key: item.score for item in items}
+        greedy = pack(items, budget, PACK_GREEDY)
+        knapsack = pack(items, budget, PACK_KNAPSACK)
+        for chosen in (greedy, knapsack):
+            assert len(set(chosen)) == len(chosen)
+            assert sum(counter.count(summaries[path]) for path in chosen) <= budget
+        assert sum(scores[key] for key in knapsack) >= sum(scores[key] for key in greedy)
+
+
+def test_unknown_strategies_are_rejected():
+    with pytest.raises(ValueError):
+        pack([], 10, "random")
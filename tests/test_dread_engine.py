@@ -0,0 +1,63 @@
+import csv
+import io
+
+from utils.dread_engine import CSV_COLUMNS, DreadTable
+
+
+def threat(scenario, *scores, threat_type="Spoofing"):
+    factors = ("Damage Potential", "Reproducibility", "Exploitability", "Affected Users", "Discoverability")
+    return {"Threat Type": threat_type, "Scenario": scenario, **dict(zip(factors, scores))}
+
+
+ASSESSMENT = {"Risk Assessment": [
+    threat("low", 1, 2, 3, 2, 2),
+    threat("high", 9, 8, 7, 9, 7, threat_type="Tampering"),
+    threat("medium", 5, 5, 5, 5, 5),
+    threat("also high", 9, 7, 8, 9, 7),
+]}
+
+
+def test_threats_are_ranked_by_risk_and_ties_share_a_rank():
+    table = DreadTable.from_assessment(ASSESSMENT)
+    assert table.risk.tolist() == [2.0, 8.0, 5.0, 8.0]
+    assert table.ranks().tolist() == [4, 1, 3, 1]
+    assert table.sorted().scenarios.tolist() == ["high", "also high", "medium", "low"]
+    assert table.top(2).scenarios.tolist() == ["high", "also high"]
+
+
+def test_buckets_start_at_their_edge():
+    table = DreadTable.from_assessment({"Risk Assessment": [
+        threat("below medium", 3, 4, 4, 4, 4),
+        threat("medium", 4, 4, 4, 4, 4),
+        threat("below high", 6, 7, 7, 7, 7),
+        threat("high", 7, 7, 7, 7, 7),
+    ]})
+    assert table.buckets().tolist() == ["Low", "Medium", "Medium", "High"]
+    assert table.bucket_counts() == {"Low": 1, "Medium": 2, "High": 1}
+
+
+def test_scores_that_are_not_numbers_count_as_zero():
+    table = DreadTable.from_assessment({"Risk Assessment": [
+        {"Threat Type": "Spoofing", "Scenario": "s", "Damage Potential": "10", "Reproducibility": "high",
+         "Exploitability": None, "Affected Users": float("nan")},
+    ]})
+    assert table.scores.tolist() == [[10.0, 0.0, 0.0, 0.0, 0.0]]
+
+
+def test_csv_export_has_one_row_per_threat():
+    table = DreadTable.from_assessments({"o/app": ASSESSMENT})
+    rows = list(csv.reader(io.StringIO(table.to_csv())))
+    assert rows[0] == list(CSV_COLUMNS)
+    assert rows[2] == ["o/app", "Tampering", "high", "9", "8", "7", "9", "7", "8.00", "High", "1"]
+    assert len(rows) == 1 + len(ASSESSMENT["Risk Assessment"])
+
+
+def test_an_empty_assessment_gives_an_empty_table():
+    table = DreadTable.from_assessment({})
+    assert len(table) == 0
+    assert table.ranks().tolist() == []
+    assert table.top(3).scenarios.tolist() == []
+    assert table.bucket_counts() == {"Low": 0, "Medium": 0, "High": 0}
+    assert table.group_stats() == {}
+    assert table.to_csv().splitlines() == [",".join(CSV_COLUMNS)]
+    assert table.to_markdown().count("\n") == 2
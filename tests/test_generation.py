@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+import threat_model
+from threat_model import failed_shards_warning, iter_threat_model_shards, merge_threat_models
+from utils.generation import (
+    CONTINUE_PROMPT,
+    DEFAULT_MAX_OUTPUT_TOKENS,
+    continuation_messages,
+    output_token_limit,
+    parse_json,
+    repair_json,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Valid JSON, and JSON wrapped in prose or a code fence
+    ('{"threat_model": [{"a": 1}]}', {"threat_model": [{"a": 1}]}),
+    ('Here you go:\n```json\n{"a": 1}\n```', {"a": 1}),
+    ('[1, 2, 3]', [1, 2, 3]),
+    ('{"a": 1} and then {"b": 2}', {"a": 1}),
+    # Trailing commas
+    ('{"t": [1, 2,]}', {"t": [1, 2]}),
+    ('{"t": [{"a": 1},\n  ],\n}', {"t": [{"a": 1}]}),
+    ('{"t": ["x,]", "y,}",]}', {"t": ["x,]", "y,}"]}),
+    ('{"a": [1,], "b": [2, 3, 4', {"a": [1], "b": [2, 3]}),
+    # Cut off inside an element: the half-written element is dropped
+    ('{"threat_model": [{"a": 1}, {"a": 2, "b": "cut', {"threat_model": [{"a": 1}]}),
+    ('{"threat_model": [{"a": 1}, {"a', {"threat_model": [{"a": 1}]}),
+    ('{"threat_model": [{"a": 1}, {"a": 2}, ', {"threat_model": [{"a": 1}, {"a": 2}]}),
+    # Cut off inside a string, with brackets and escapes in earlier strings
+    ('{"threat_model": [{"a": "x}\\"y"}, {"a', {"threat_model": [{"a": 'x}"y'}]}),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('{"threat_model": [], "improvement_suggestions": ["one", "tw',
+     {"threat_model": [], "improvement_suggestions": ["one"]}),
+    # Nested arrays cut off
+    ('{"t": [[1, 2], [3, 4], [5,', {"t": [[1, 2], [3, 4], [5]]}),
+    ('[1, 2, 3', [1, 2]),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", None, "no JSON here", '{"a":'])
+def test_repair_json_raises_when_nothing_can_be_recovered(text):
+    with pytest.raises(json.JSONDecodeError):
+        repair_json(text)
+
+
+def test_parse_json_prefers_plain_json():
+    assert parse_json('{"a": [1, 2]}') == {"a": [1, 2]}
+    assert parse_json('```json\n{"a": [1, 2,]}\n```') == {"a": [1, 2]}
+
+
+@pytest.mark.parametrize("model, expected", [
+    ("gpt-4o-mini", 16384),
+    ("gpt-4", 4096),
+    ("claude-3-5-sonnet-20241022", 8192),
+    ("claude-3-opus-20240229", 4096),
+    ("unknown-model", DEFAULT_MAX_OUTPUT_TOKENS),
+    (None, DEFAULT_MAX_OUTPUT_TOKENS),
+])
+def test_output_token_limit_matches_the_longest_prefix(model, expected):
+    assert output_token_limit(model) == expected
+
+
+def test_continuation_messages():
+    assert continuation_messages(None, "prompt", "") == [{"role": "user", "content": "prompt"}]
+    assert continuation_messages("system", "prompt", "partial") == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "prompt"},
+        {"role": "assistant", "content": "partial"},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+
+def test_near_duplicate_threats_across_shards_are_merged():
+    shards = {
+        "Spoofing": {"threat_model": [
+            {"Scenario": "An attacker steals the session cookie of a logged in user",
+             "Potential Impact": "Account takeover"},
+        ], "improvement_suggestions": ["Describe how sessions are stored."]},
+        "Elevation of Privilege": {"threat_model": [
+            # The same threat in other words is dropped, a distinct one kept
+            {"Scenario": "An attacker steals the session cookie of a logged in admin user",
+             "Potential Impact": "Account takeover"},
+            {"Scenario": "A user edits the role field of their profile request",
+             "Potential Impact": "Administrator access"},
+        ], "improvement_suggestions": ["Describe how sessions are stored.", "List the user roles."]},
+    }
+    merged = merge_threat_models(shards)
+    assert [(threat["Threat Type"], threat["Potential Impact"]) for threat in merged["threat_model"]] == [
+        ("Spoofing", "Account takeover"),
+        ("Elevation of Privilege", "Administrator access"),
+    ]
+    assert merged["improvement_suggestions"] == ["Describe how sessions are stored.", "List the user roles."]
+
+
+def test_a_failing_shard_is_named_in_the_warning(monkeypatch):
+    async def aget_threat_model(provider, credentials, prompt, use_cache=True):
+        if prompt == "tampering":
+            raise TimeoutError("request timed out")
+        return {"threat_model": [{"Scenario": prompt, "Potential Impact": "impact"}]}
+
+    monkeypatch.setattr(threat_model, "aget_threat_model", aget_threat_model)
+    prompts = {"Spoofing": "spoofing", "Tampering": "tampering"}
+    shards, failed = {}, {}
+    for category, result, error in iter_threat_model_shards("OpenAI", ("sk-test", "gpt-4o"), prompts):
+        if result:
+            shards[category] = result
+        else:
+            failed[category] = error
+    assert list(shards) == ["Spoofing"]
+    assert failed_shards_warning(failed) == "No threats could be generated for: Tampering (request timed out)"
@@ -0,0 +1,235 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import pytest
+
+from server import JobService, make_handler
+from utils import job_queue
+from utils.job_queue import (
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JobQueue,
+    credentials_fingerprint,
+)
+
+PARAMS = {"provider": "OpenAI", "model": "gpt-4o", "prompt": "Describe the threats"}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_jobs_are_claimed_oldest_first(queue):
+    first = queue.submit("threat_model", PARAMS)
+    second = queue.submit("mitigations", PARAMS)
+    assert first["status"] == JOB_QUEUED
+    claimed = queue.claim("worker-1")
+    assert (claimed["id"], claimed["status"], claimed["worker"]) == (first["id"], JOB_RUNNING, "worker-1")
+    assert queue.claim("worker-2")["id"] == second["id"]
+    assert queue.claim("worker-3") is None
+
+
+def test_identical_jobs_are_deduplicated_while_pending(queue):
+    job = queue.submit("threat_model", PARAMS)
+    assert queue.submit("threat_model", dict(PARAMS))["id"] == job["id"]
+    queue.claim("worker")
+    assert queue.submit("threat_model", PARAMS)["id"] == job["id"]
+    assert queue.submit("threat_model", {**PARAMS, "model": "gpt-4o-mini"})["id"] != job["id"]
+    assert queue.submit("mitigations", PARAMS)["id"] != job["id"]
+
+
+def test_finished_jobs_are_reused_only_when_asked_and_recent(queue, monkeypatch):
+    job = queue.submit("threat_model", PARAMS)
+    queue.claim("worker")
+    queue.complete(job["id"], {"threat_model": []})
+    assert queue.submit("threat_model", PARAMS)["id"] == job["id"]
+    assert queue.submit("threat_model", PARAMS, reuse_done=False)["id"] != job["id"]
+
+    later = job_queue.time.time() + queue.dedupe_seconds + 1
+    monkeypatch.setattr(job_queue.time, "time", lambda: later)
+    fresh = queue.submit("threat_model", {**PARAMS, "prompt": "other"})
+    queue.claim("worker")
+    queue.complete(fresh["id"], {})
+    # The first job has aged out of the dedupe window by now
+    assert queue.submit("threat_model", PARAMS)["id"] not in (job["id"], fresh["id"])
+
+
+def test_failed_and_cancelled_jobs_are_not_reused(queue):
+    failed = queue.submit("threat_model", PARAMS)
+    queue.claim("worker")
+    queue.fail(failed["id"], "invalid key")
+    assert queue.get(failed["id"])["error"] == "invalid key"
+    cancelled = queue.submit("threat_model", PARAMS)
+    assert cancelled["id"] != failed["id"]
+    assert queue.cancel(cancelled["id"])
+    assert queue.submit("threat_model", PARAMS)["id"] not in (failed["id"], cancelled["id"])
+
+
+def test_principals_never_share_jobs(queue):
+    alice = credentials_fingerprint("OpenAI", ("sk-alice", "gpt-4o"))
+    mallory = credentials_fingerprint("OpenAI", ("sk-invalid", "gpt-4o"))
+    job = queue.submit("threat_model", PARAMS, principal=alice)
+    queue.claim("worker")
+    queue.complete(job["id"], {"threat_model": ["secret"]})
+    assert queue.submit("threat_model", PARAMS, principal=alice)["id"] == job["id"]
+    assert queue.submit("threat_model", PARAMS, principal=mallory)["id"] != job["id"]
+    assert queue.submit("threat_model", PARAMS)["id"] != job["id"]
+
+
+def test_credentials_fingerprint():
+    assert credentials_fingerprint("OpenAI", None) is None
+    assert credentials_fingerprint("OpenAI", ["k", "m"]) == credentials_fingerprint("OpenAI", ("k", "m"))
+    assert credentials_fingerprint("OpenAI", ["k", "m"]) != credentials_fingerprint("Azure OpenAI", ["k", "m"])
+    assert "sk-secret" not in credentials_fingerprint("OpenAI", ["sk-secret"])
+
+
+def test_a_job_cancelled_while_running_keeps_its_status(queue):
+    job = queue.submit("threat_model", PARAMS)
+    queue.claim("worker")
+    assert queue.cancel(job["id"])
+    assert not queue.complete(job["id"], {"late": True})
+    assert queue.get(job["id"])["status"] == JOB_CANCELLED
+    assert queue.get(job["id"])["result"] is None
+    assert not queue.cancel(job["id"])
+
+
+def test_running_jobs_of_a_dead_worker_are_requeued(queue):
+    first = queue.submit("threat_model", PARAMS)
+    second = queue.submit("mitigations", PARAMS)
+    queue.claim("service-a-0")
+    queue.claim("service-b-0")
+    assert queue.requeue_running("service-a") == 1
+    assert queue.status(first["id"]) == JOB_QUEUED
+    assert queue.status(second["id"]) == JOB_RUNNING
+    assert queue.requeue_running() == 1
+    assert queue.counts() == {JOB_QUEUED: 2}
+
+
+def test_counts_and_missing_jobs(queue):
+    done = queue.submit("threat_model", PARAMS)
+    queue.claim("worker")
+    queue.complete(done["id"], {})
+    failed = queue.submit("mitigations", PARAMS)
+    queue.claim("worker")
+    queue.fail(failed["id"], "boom")
+    queue.submit("attack_tree", PARAMS)
+    assert queue.counts() == {JOB_DONE: 1, JOB_FAILED: 1, JOB_QUEUED: 1}
+    assert queue.get("missing") is None
+    assert queue.status("missing") is None
+
+
+def test_concurrent_claims_never_hand_out_a_job_twice(queue):
+    for n in range(40):
+        queue.submit("threat_model", {**PARAMS, "prompt": str(n)})
+    claimed = []
+
+    def work(worker):
+        other = JobQueue(queue.path)
+        while (job := other.claim(worker)) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=work, args=(f"worker-{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == len(set(claimed)) == 40
+
+
+def test_service_keeps_each_callers_credentials_with_their_own_job(queue):
+    service = JobService(queue, workers=0)
+    first = service.submit("threat_model", PARAMS, ["sk-first", "gpt-4o"])
+    second = service.submit("threat_model", PARAMS, ["sk-second", "gpt-4o"])
+    assert first["id"] != second["id"]
+    assert service.credentials_for(first) == ("sk-first", "gpt-4o")
+    assert service.credentials_for(second) == ("sk-second", "gpt-4o")
+
+
+@pytest.mark.parametrize("repo", [
+    "https://github.com/owner/app",
+    "https://github.com/owner/app.git",
+    "http://www.github.com/owner/app/",
+])
+def test_service_accepts_github_repositories(queue, repo):
+    service = JobService(queue, workers=0)
+    job = service.submit("threat_model", {**PARAMS, "repo": repo})
+    assert job["params"]["repo"] == repo
+
+
+@pytest.mark.parametrize("repo", [
+    "/etc",
+    "../secrets",
+    "file:///etc/passwd",
+    "https://evil.example.com/owner/app",
+    "https://github.com/owner/app/blob/main/a.py",
+    "https://github.com.evil.example.com/owner/app",
+    ["https://github.com/owner/app"],
+])
+def test_service_rejects_other_repositories(queue, repo, monkeypatch):
+    monkeypatch.delenv("STRIDE_GPT_REPO_ROOT", raising=False)
+    service = JobService(queue, workers=0)
+    with pytest.raises(ValueError):
+        service.submit("threat_model", {**PARAMS, "repo": repo})
+    assert queue.counts() == {}
+
+
+def test_service_reads_local_repositories_only_under_its_root(queue, tmp_path):
+    root = tmp_path / "repos"
+    (root / "app").mkdir(parents=True)
+    service = JobService(queue, workers=0, repo_root=str(root))
+    job = service.submit("threat_model", {**PARAMS, "repo": "app"})
+    assert job["params"]["repo"] == str(root / "app")
+    for repo in ("../", str(tmp_path), "app/../../repos-other"):
+        with pytest.raises(ValueError):
+            service.submit("threat_model", {**PARAMS, "repo": repo})
+
+
+def test_github_enterprise_hosts_are_accepted(queue, monkeypatch):
+    monkeypatch.setenv("GITHUB_API_URL", "https://ghe.example.com/api/v3")
+    service = JobService(queue, workers=0)
+    assert service.check_repo("https://ghe.example.com/owner/app") == "https://ghe.example.com/owner/app"
+
+
+def test_service_only_keeps_credentials_for_jobs_it_will_run(queue):
+    service = JobService(queue, workers=0)
+    done = service.submit("threat_model", PARAMS, ["sk-first", "gpt-4o"])
+    service.credentials_for(queue.claim("worker"))
+    queue.complete(done["id"], {"threat_model": []})
+    assert service.submit("threat_model", PARAMS, ["sk-first", "gpt-4o"])["id"] == done["id"]
+    assert service._credentials == {}
+
+    queued = service.submit("mitigations", PARAMS, ["sk-first", "gpt-4o"])
+    assert list(service._credentials) == [queued["id"]]
+    assert service.cancel(queued["id"])
+    assert service._credentials == {}
+
+
+@pytest.fixture
+def server(queue):
+    service = JobService(queue, workers=0)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(url, method="GET", body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    with urlopen(Request(url, data=data, method=method)) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_job_urls_may_carry_a_query_string(server):
+    service, base = server
+    status, job = request(f"{base}/jobs?wait=0", "POST", {"kind": "threat_model", "params": PARAMS})
+    assert status == 202
+    assert request(f"{base}/jobs/{job['id']}?fields=all")[1]["id"] == job["id"]
+    assert request(f"{base}/jobs/{job['id']}?reason=user", "DELETE")[1] == {"cancelled": True}
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from utils import llm_cache, providers
+from utils.llm_cache import LLMCache, cached_response
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path))
+    monkeypatch.setattr(llm_cache, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(providers, "get_llm_cache", lambda: cache)
+    monkeypatch.delenv("STRIDE_GPT_LLM_CACHE", raising=False)
+    return cache
+
+
+def test_responses_are_cached_per_model_and_prompt(cache):
+    calls = []
+
+    @cached_response("openai", "model_name")
+    def generate(api_key, model_name, prompt):
+        calls.append((api_key, model_name, prompt))
+        return {"answer": len(calls)}
+
+    assert generate("sk-alice", "gpt-4o", "prompt") == {"answer": 1}
+    assert generate("sk-alice", "gpt-4o", "prompt") == {"answer": 1}
+    assert generate("sk-alice", "gpt-4o-mini", "prompt") == {"answer": 2}
+    assert generate("sk-alice", "gpt-4o", "other") == {"answer": 3}
+    assert generate("sk-alice", "gpt-4o", "prompt", use_cache=False) == {"answer": 4}
+
+
+def test_different_keys_do_not_share_an_entry(cache):
+    calls = []
+
+    @cached_response("openai", "model_name")
+    def generate(api_key, model_name, prompt):
+        calls.append(api_key)
+        return f"answer for {api_key}"
+
+    assert generate("sk-alice", "gpt-4o", "prompt") == "answer for sk-alice"
+    assert generate("sk-invalid", "gpt-4o", "prompt") == "answer for sk-invalid"
+    assert calls == ["sk-alice", "sk-invalid"]
+
+
+def test_empty_responses_are_not_cached(cache):
+    calls = []
+
+    @cached_response("ollama", "ollama_model")
+    def generate(ollama_model, prompt):
+        calls.append(prompt)
+        return ""
+
+    generate("llama3", "prompt")
+    generate("llama3", "prompt")
+    assert len(calls) == 2
+
+
+def test_achat_does_not_share_answers_between_keys(cache, monkeypatch):
+    calls = []
+
+    async def complete(provider, credentials, prompt, system, json_mode, max_tokens):
+        calls.append(credentials)
+        return f"answer for {credentials[0]}"
+
+    monkeypatch.setattr(providers, "_complete", complete)
+
+    async def run():
+        return [
+            await providers.achat("OpenAI", ("sk-alice", "gpt-4o"), "prompt"),
+            await providers.achat("OpenAI", ("sk-alice", "gpt-4o"), "prompt"),
+            await providers.achat("OpenAI", ("sk-invalid", "gpt-4o"), "prompt"),
+        ]
+
+    assert asyncio.run(run()) == ["answer for sk-alice", "answer for sk-alice", "answer for sk-invalid"]
+    assert calls == [("sk-alice", "gpt-4o"), ("sk-invalid", "gpt-4o")]
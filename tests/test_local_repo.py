@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from utils.local_repo import GitIgnore, _translate, is_bare_repo, iter_git_contents, iter_local_paths, list_git_blobs
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+@pytest.mark.parametrize("pattern, regex", [
+    ("*.py", r"[^/]*\.py"),
+    ("file?.txt", r"file[^/]\.txt"),
+    ("**/build", r"(?:.*/)?build"),
+    ("logs/**", r"logs/.*"),
+    ("a/**/b", r"a/(?:.*/)?b"),
+    ("[abc].py", r"[abc]\.py"),
+    ("[!abc].py", r"[^abc]\.py"),
+    ("\\*literal", r"\*literal"),
+    ("[unclosed", r"\[unclosed"),
+])
+def test_translate(pattern, regex):
+    assert _translate(pattern) == regex
+
+
+@pytest.mark.parametrize("rules, path, is_dir, expected", [
+    # Unanchored patterns match at any depth
+    (["*.log"], "debug.log", False, True),
+    (["*.log"], "logs/deep/debug.log", False, True),
+    (["*.log"], "debug.log.txt", False, None),
+    # A slash anchors the pattern to the .gitignore's directory
+    (["/build"], "build", True, True),
+    (["/build"], "src/build", True, None),
+    (["docs/*.md"], "docs/a.md", False, True),
+    (["docs/*.md"], "docs/sub/a.md", False, None),
+    (["docs/*.md"], "other/docs/a.md", False, None),
+    # A trailing slash only matches directories
+    (["node_modules/"], "node_modules", True, True),
+    (["node_modules/"], "node_modules", False, None),
+    (["node_modules/"], "pkg/node_modules", True, True),
+    # ** spans directories
+    (["**/fixtures"], "fixtures", True, True),
+    (["**/fixtures"], "a/b/fixtures", True, True),
+    (["a/**/b"], "a/b", False, True),
+    (["a/**/b"], "a/x/y/b", False, True),
+    (["logs/**"], "logs/x/y.txt", False, True),
+    (["logs/**"], "logs", True, None),
+    # The last matching rule wins, and ! negates
+    (["*.py", "!keep.py"], "keep.py", False, False),
+    (["!keep.py", "*.py"], "keep.py", False, True),
+    # Comments, blank lines, escapes and trailing spaces
+    (["# comment", "", "   "], "# comment", False, None),
+    (["\\#hash"], "#hash", False, True),
+    (["\\!bang"], "!bang", False, True),
+    (["trailing   "], "trailing", False, True),
+    (["space\\ "], "space ", False, True),
+    # Character classes
+    (["file[0-9].txt"], "file7.txt", False, True),
+    (["file[!0-9].txt"], "file7.txt", False, None),
+    (["file[!0-9].txt"], "filex.txt", False, True),
+])
+def test_gitignore_rules(rules, path, is_dir, expected):
+    assert GitIgnore(rules).match(path, is_dir) is expected
+
+
+def write(root, files):
+    for path, content in files.items():
+        full = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w") as f:
+            f.write(content)
+
+
+TREE = {
+    ".gitignore": "*.log\n/build/\nsecrets/\n!important.log\n",
+    "app.py": "print('app')\n",
+    "debug.log": "",
+    "important.log": "",
+    "build/out.py": "",
+    "src/build/keep.py": "",
+    "src/secrets/key.py": "",
+    "src/.gitignore": "*.tmp\n!/keep.tmp\n",
+    "src/a.tmp": "",
+    "src/keep.tmp": "",
+    "src/deep/keep.tmp": "",
+    "src/main.py": "",
+}
+
+
+def test_iter_local_paths_honours_nested_gitignores(tmp_path):
+    write(tmp_path, TREE)
+    os.makedirs(tmp_path / ".git" / "info")
+    (tmp_path / ".git" / "info" / "exclude").write_text("main.py\n")
+    assert list(iter_local_paths(str(tmp_path))) == [
+        ".gitignore", "app.py", "important.log", "src/.gitignore", "src/build/keep.py", "src/keep.tmp",
+    ]
+
+
+@requires_git
+def test_iter_local_paths_agrees_with_git(tmp_path):
+    write(tmp_path, TREE)
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    listed = subprocess.run(
+        ["git", "-C", str(tmp_path), "ls-files", "--others", "--exclude-standard"],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert list(iter_local_paths(str(tmp_path))) == sorted(listed)
+
+
+@requires_git
+def test_bare_repository_is_read_at_head(tmp_path):
+    work = tmp_path / "work"
+    write(work, {"README.md": "# Demo\n", "app.py": "print('v1')\n", "image.png": "not analysed",
+                 "data.py": "binary\0content"})
+    git = ["git", "-C", str(work), "-c", "user.name=t", "-c", "user.email=t@t"]
+    subprocess.run(["git", "init", "-q", str(work)], check=True)
+    subprocess.run([*git, "add", "."], check=True)
+    subprocess.run([*git, "commit", "-q", "-m", "v1"], check=True)
+    bare = tmp_path / "bare.git"
+    subprocess.run(["git", "clone", "-q", "--bare", str(work), str(bare)], check=True)
+
+    assert is_bare_repo(str(bare)) and not is_bare_repo(str(work))
+    blobs = list_git_blobs(str(bare))
+    assert [path for path, _ in blobs] == ["README.md", "app.py", "data.py"]
+    contents = list(iter_git_contents(str(bare), blobs, skip={"README.md"}))
+    # Skipped paths come back without content; binary blobs are left out
+    assert [(path, content) for path, _, content in contents] == [("README.md", None), ("app.py", "print('v1')\n")]
@@ -0,0 +1,137 @@
+import pytest
+
+from utils.model_store import ModelStore, fts_query, model_key, search_entries
+
+THREAT_MODEL = {
+    "threat_model": [
+        {"Threat Type": "Spoofing", "Scenario": "An attacker forges JWTs signed with the none algorithm.",
+         "Potential Impact": "Account takeover."},
+        {"Threat Type": "Elevation of Privilege", "Scenario": "A user edits the role claim of their JWT.",
+         "Potential Impact": "Admin access."},
+        {"Threat Type": "Elevation of Privilege", "Scenario": "The admin API has no authorization check.",
+         "Potential Impact": "Admin access."},
+    ],
+    "improvement_suggestions": [],
+}
+DREAD = {"Risk Assessment": [{"Threat Type": "Tampering", "Scenario": "Orders are edited in transit.",
+                              "Damage Potential": 8}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModelStore(str(tmp_path / "models.sqlite3"))
+
+
+def save_model(store, repo, commit="abc123", params=None, threat_model=THREAT_MODEL):
+    params = params or {"provider": "OpenAI", "model": "gpt-4o"}
+    key = model_key(repo, commit, params)
+    store.save(key, "threat_model", threat_model, repo=repo, commit=commit, params=params)
+    return key
+
+
+@pytest.mark.parametrize("text, query", [
+    ("jwt", '"jwt"'),
+    ("JWT token", '"JWT" "token"'),
+    ("auth*", '"auth"*'),
+    ('AND OR "(', '"AND" "OR"'),
+    ("role-claim", '"role" "claim"'),
+    ("", ""),
+])
+def test_fts_query_quotes_every_word(text, query):
+    assert fts_query(text) == query
+
+
+def test_model_key_depends_on_repo_commit_and_params():
+    params = {"provider": "OpenAI", "model": "gpt-4o"}
+    key = model_key("repo", "abc", params)
+    assert key == model_key("repo", "abc", {"model": "gpt-4o", "provider": "OpenAI"})
+    assert key != model_key("repo", "def", params)
+    assert key != model_key("fork", "abc", params)
+    assert key != model_key("repo", "abc", {**params, "model": "gpt-4o-mini"})
+
+
+@pytest.mark.parametrize("kind, content, entries", [
+    ("threat_model", {"threat_model": [{"Threat Type": "Spoofing", "Scenario": "S", "Potential Impact": "I"}]},
+     [("Spoofing", "S\nI")]),
+    ("threat_model", "not a dict", []),
+    ("dread_assessment", {"Risk Assessment": [{"Threat Type": "Tampering", "Scenario": "S"}, "junk"]},
+     [("Tampering", "S")]),
+    ("mitigations", "| table |", [("", "| table |")]),
+    ("attack_tree", {"nodes": 1}, [("", '{"nodes": 1}')]),
+])
+def test_search_entries(kind, content, entries):
+    assert search_entries(kind, content) == entries
+
+
+def test_saved_artifacts_load_back(store):
+    key = save_model(store, "https://github.com/o/app")
+    store.save(key, "dread_assessment", DREAD)
+    store.save(key, "mitigations", "| Threat | Mitigation |")
+    model = store.load(key)
+    assert (model["repo"], model["commit_sha"]) == ("https://github.com/o/app", "abc123")
+    assert model["params"] == {"provider": "OpenAI", "model": "gpt-4o"}
+    assert model["artifacts"] == {"threat_model": THREAT_MODEL, "dread_assessment": DREAD,
+                                  "mitigations": "| Threat | Mitigation |"}
+    assert store.load("missing") is None
+
+
+def test_unknown_artifact_kinds_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.save("key", "summary", "text")
+
+
+def test_search_by_text_and_stride_category(store):
+    save_model(store, "https://github.com/o/app")
+    hits = store.search("jwt", threat_type="Elevation of Privilege")
+    assert [(hit["threat_type"], hit["position"]) for hit in hits] == [("Elevation of Privilege", 1)]
+    assert "[JWT]" in hits[0]["snippet"]
+    # Porter stemming matches "JWTs" as well as "JWT"
+    assert {hit["position"] for hit in store.search("jwt")} == {0, 1}
+    assert store.search("admin", threat_type="Spoofing") == []
+
+
+def test_search_by_kind_and_repo(store):
+    first = save_model(store, "https://github.com/o/app")
+    save_model(store, "https://github.com/o/other")
+    store.save(first, "dread_assessment", DREAD)
+    assert [hit["kind"] for hit in store.search("orders")] == ["dread_assessment"]
+    assert store.search("orders", kind="threat_model") == []
+    assert {hit["repo"] for hit in store.search("admin", repo="https://github.com/o/other")} == {"https://github.com/o/other"}
+
+
+def test_search_without_a_query_returns_the_newest_entries(store):
+    save_model(store, "https://github.com/o/old")
+    save_model(store, "https://github.com/o/new")
+    hits = store.search(threat_type="Spoofing")
+    assert [hit["repo"] for hit in hits] == ["https://github.com/o/new", "https://github.com/o/old"]
+
+
+def test_hostile_queries_do_not_raise(store):
+    save_model(store, "https://github.com/o/app")
+    assert store.search('AND OR NOT "(') == []
+    assert store.search("* ) ^") == store.search()
+
+
+def test_saving_again_replaces_the_artifact_and_its_index(store):
+    key = save_model(store, "https://github.com/o/app")
+    store.save(key, "threat_model", {"threat_model": [
+        {"Threat Type": "Repudiation", "Scenario": "Nothing is logged.", "Potential Impact": "Denial."}]})
+    assert store.search("jwt") == []
+    assert [hit["threat_type"] for hit in store.search("logged")] == ["Repudiation"]
+    assert store.count() == 1
+
+
+def test_recent_lists_the_stored_kinds(store):
+    key = save_model(store, "https://github.com/o/app")
+    store.save(key, "attack_tree", "graph TD")
+    (model,) = store.recent()
+    assert sorted(model["kinds"]) == ["attack_tree", "threat_model"]
+
+
+def test_delete_removes_the_model_and_its_index(store):
+    key = save_model(store, "https://github.com/o/app")
+    assert store.delete(key)
+    assert not store.delete(key)
+    assert store.load(key) is None
+    assert store.search("jwt") == []
+    assert store.count() == 0
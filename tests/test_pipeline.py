@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+import pipeline
+from pipeline import STAGE_CANCELLED, STAGE_DONE, STAGE_FAILED, STAGE_RUNNING, STAGE_TIMEOUT, DownstreamPipeline
+
+CREDENTIALS = ("sk-test", "gpt-4o")
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Replace the OpenAI generator functions of every stage with fakes registered by the test."""
+    monkeypatch.setattr(pipeline, "STAGES", {})
+    monkeypatch.setattr(pipeline, "STREAM_STAGES", {})
+
+    def register(stage, func=None, stream=None):
+        pipeline.STAGES[stage] = {"OpenAI": func or (lambda *args, use_cache=True: "blocking")}
+        if stream is not None:
+            pipeline.STREAM_STAGES[stage] = {"OpenAI": stream}
+
+    return register
+
+
+def streaming(*chunks):
+    def stream(api_key, model, prompt, use_cache=True):
+        yield from chunks
+    return stream
+
+
+def by_status(results):
+    return [(result.stage, result.status, result.result) for result in results]
+
+
+def test_streamed_stages_report_their_text_as_it_arrives(stages, monkeypatch):
+    monkeypatch.setattr(pipeline, "POLL_INTERVAL", 0.01)
+    release = [threading.Event() for _ in range(3)]
+
+    def stream(api_key, model, prompt, use_cache=True):
+        for number, event in enumerate(release):
+            yield f"part {number}. "
+            event.wait(5)
+
+    stages("mitigations", stream=stream)
+    results = DownstreamPipeline("OpenAI", CREDENTIALS, {"mitigations": "prompt"}, timeout=5, stream=True).results()
+    progress = []
+    for result in results:
+        progress.append((result.status, result.result))
+        if result.status == STAGE_RUNNING:
+            release[len(progress) - 1].set()
+    assert progress == [
+        (STAGE_RUNNING, "part 0. "),
+        (STAGE_RUNNING, "part 0. part 1. "),
+        (STAGE_RUNNING, "part 0. part 1. part 2. "),
+        (STAGE_DONE, "part 0. part 1. part 2. "),
+    ]
+
+
+def test_streamed_dread_assessments_are_parsed(stages):
+    def stream(api_key, model, prompt, use_cache=True):
+        yield '{"Risk Assessment": [{"Threat Type": "Spoofing",'
+        yield ' "Scenario": "S"}]}'
+
+    stages("dread_assessment", stream=stream)
+    results = by_status(DownstreamPipeline("OpenAI", CREDENTIALS, {"dread_assessment": "p"}, stream=True).results())
+    assert results[-1] == ("dread_assessment", STAGE_DONE,
+                           {"Risk Assessment": [{"Threat Type": "Spoofing", "Scenario": "S"}]})
+
+
+def test_an_unparseable_streamed_dread_assessment_fails(stages):
+    stages("dread_assessment", stream=streaming("I cannot score these threats."))
+    results = by_status(DownstreamPipeline("OpenAI", CREDENTIALS, {"dread_assessment": "p"}, stream=True).results())
+    assert results[-1][:2] == ("dread_assessment", STAGE_FAILED)
+
+
+def test_stages_without_a_stream_are_generated_whole(stages):
+    stages("attack_tree", func=lambda *args, use_cache=True: "graph TD")
+    stages("mitigations", stream=streaming("streamed"))
+    results = dict((stage, result) for stage, status, result in by_status(
+        DownstreamPipeline("OpenAI", CREDENTIALS, {"attack_tree": "p", "mitigations": "p"}, stream=True).results()
+    ) if status == STAGE_DONE)
+    assert results == {"attack_tree": "graph TD", "mitigations": "streamed"}
+
+
+def test_without_stream_the_blocking_functions_are_used(stages):
+    stages("mitigations", stream=streaming("streamed"))
+    results = by_status(DownstreamPipeline("OpenAI", CREDENTIALS, {"mitigations": "p"}).results())
+    assert results == [("mitigations", STAGE_DONE, "blocking")]
+
+
+def test_a_cancelled_stream_stops_reading(stages, monkeypatch):
+    monkeypatch.setattr(pipeline, "POLL_INTERVAL", 0.01)
+    closed = threading.Event()
+
+    def stream(api_key, model, prompt, use_cache=True):
+        try:
+            while True:
+                yield "chunk "
+        finally:
+            closed.set()
+
+    stages("test_cases", stream=stream)
+    run = DownstreamPipeline("OpenAI", CREDENTIALS, {"test_cases": "p"}, timeout=5, stream=True)
+    statuses = []
+    for result in run.results():
+        statuses.append(result.status)
+        if result.status == STAGE_RUNNING:
+            run.cancel("test_cases")
+    assert statuses[-1] == STAGE_CANCELLED
+    assert closed.wait(5)
+
+
+def test_a_stream_past_its_deadline_stops_reading(stages):
+    closed = threading.Event()
+
+    def stream(api_key, model, prompt, use_cache=True):
+        try:
+            while True:
+                yield "chunk "
+        finally:
+            closed.set()
+
+    stages("test_cases", stream=stream)
+    results = by_status(DownstreamPipeline("OpenAI", CREDENTIALS, {"test_cases": "p"}, timeout=0.3, stream=True).results())
+    assert results[-1][:2] == ("test_cases", STAGE_TIMEOUT)
+    assert closed.wait(5)
+
+
+def test_a_hung_stage_times_out_without_holding_up_the_others(stages):
+    hung = threading.Event()
+    stages("attack_tree", func=lambda *args, use_cache=True: hung.wait(5))
+    stages("mitigations", func=lambda *args, use_cache=True: "mitigations")
+    try:
+        results = by_status(DownstreamPipeline(
+            "OpenAI", CREDENTIALS, {"attack_tree": "p", "mitigations": "p"}, timeout=0.3
+        ).results())
+    finally:
+        hung.set()
+    assert results == [
+        ("mitigations", STAGE_DONE, "mitigations"),
+        ("attack_tree", STAGE_TIMEOUT, None),
+    ]
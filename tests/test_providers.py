@@ -0,0 +1,212 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils import llm_cache, providers
+from utils.generation import CONTINUE_PROMPT, MAX_CONTINUATIONS
+from utils.llm_cache import LLMCache
+
+
+class Stream:
+    """An SDK event stream: async iterable and closed by `async with`."""
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+class OpenAIClient:
+    """Answers chat completions, streamed or not, from a list of (chunks, finish_reason)."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, stream=False, **kwargs):
+        self.requests.append(kwargs)
+        chunks, finish_reason = self.answers.pop(0)
+        if not stream:
+            message = SimpleNamespace(content="".join(chunks))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)])
+        deltas = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk), finish_reason=None)])
+                  for chunk in chunks]
+        # The last event carries the finish reason, and Azure sends events without choices
+        return Stream([SimpleNamespace(choices=[]), *deltas,
+                       SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None),
+                                                                finish_reason=finish_reason)])])
+
+
+class AnthropicStream(Stream):
+    def __init__(self, chunks, stop_reason):
+        super().__init__(chunks)
+        self.stop_reason = stop_reason
+
+    @property
+    def text_stream(self):
+        return self.__aiter__()
+
+    async def get_final_message(self):
+        return SimpleNamespace(stop_reason=self.stop_reason)
+
+
+class AnthropicClient:
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = []
+        self.messages = SimpleNamespace(create=self.create, stream=self.stream)
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        chunks, stop_reason = self.answers.pop(0)
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text="".join(chunks))], stop_reason=stop_reason)
+
+    def stream(self, **kwargs):
+        self.requests.append(kwargs)
+        return AnthropicStream(*self.answers.pop(0))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Send every request to the fake client the test installs."""
+    installed = {}
+    monkeypatch.setattr(providers, "_target", lambda provider, credentials: (installed["client"], credentials[-1]))
+
+    def install(fake):
+        installed["client"] = fake
+        return fake
+
+    return install
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path))
+    monkeypatch.setattr(llm_cache, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(providers, "get_llm_cache", lambda: cache)
+    monkeypatch.delenv("STRIDE_GPT_LLM_CACHE", raising=False)
+    return cache
+
+
+def complete(provider, credentials, prompt, system=None, json_mode=False, max_tokens=100):
+    return asyncio.run(providers._complete(provider, credentials, prompt, system, json_mode, max_tokens))
+
+
+def test_a_truncated_answer_is_continued(client):
+    fake = client(OpenAIClient([(['{"threat_model": [{"a"'], "length"), ([': 1}]}'], "stop")]))
+    text = complete("OpenAI", ("sk-test", "gpt-4o"), "prompt", json_mode=True)
+    assert json.loads(text) == {"threat_model": [{"a": 1}]}
+    first, second = fake.requests
+    assert first["response_format"] == {"type": "json_object"}
+    # JSON mode would start a new object, so the continuation goes without it
+    assert "response_format" not in second
+    assert second["messages"][-2:] == [
+        {"role": "assistant", "content": '{"threat_model": [{"a"'},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+    assert all(request["max_tokens"] == 100 for request in fake.requests)
+
+
+def test_continuations_stop_after_max_continuations(client):
+    fake = client(OpenAIClient([(["a"], "length")] * 10))
+    assert complete("OpenAI", ("sk-test", "gpt-4o"), "p") == "a" * (MAX_CONTINUATIONS + 1)
+    assert len(fake.requests) == MAX_CONTINUATIONS + 1
+
+
+def test_claude_continues_its_own_turn(client):
+    fake = client(AnthropicClient([(["Part one "], "max_tokens"), (["part two"], "end_turn")]))
+    text = complete("Anthropic", ("sk-test", "claude-3-5-sonnet"), "prompt", system="system")
+    assert text == "Part onepart two"
+    second = fake.requests[1]
+    assert second["system"] == "system"
+    # Trailing whitespace is stripped: the API rejects it in an assistant turn
+    assert second["messages"] == [
+        {"role": "user", "content": "prompt"},
+        {"role": "assistant", "content": "Part one"},
+    ]
+
+
+def test_streams_are_continued_like_whole_answers(client):
+    fake = client(OpenAIClient([(['{"threat_model": ', '[{"a"'], "length"), ([': 1}]}'], "stop")]))
+    chunks = list(providers.stream_chat("OpenAI", ("sk-test", "gpt-4o"), "prompt", system="JSON",
+                                        json_mode=True, use_cache=False))
+    assert chunks == ['{"threat_model": ', '[{"a"', ': 1}]}']
+    first, second = fake.requests
+    assert first["response_format"] == {"type": "json_object"}
+    assert "response_format" not in second
+    assert second["messages"] == [
+        {"role": "system", "content": "JSON"},
+        {"role": "user", "content": "prompt"},
+        {"role": "assistant", "content": '{"threat_model": [{"a"'},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+def test_claude_streams_are_continued(client):
+    fake = client(AnthropicClient([(["Part ", "one "], "max_tokens"), (["part two"], "end_turn")]))
+    chunks = list(providers.stream_chat("Anthropic", ("sk-test", "claude-3-5-sonnet"), "prompt", use_cache=False))
+    assert chunks == ["Part ", "one ", "part two"]
+    assert fake.requests[1]["messages"][-1] == {"role": "assistant", "content": "Part one"}
+    assert "system" not in fake.requests[0]
+
+
+def test_ollama_streams_are_read_line_by_line(client):
+    lines = [{"message": {"content": "Hello, "}}, {"message": {"content": "world"}},
+             {"done": True, "done_reason": "stop"}]
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+
+    client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    chunks = list(providers.stream_chat("Ollama", ("llama3",), "prompt", json_mode=True, use_cache=False))
+    assert chunks == ["Hello, ", "world"]
+    assert requests[0]["stream"] is True and requests[0]["format"] == "json"
+
+
+def test_a_stream_read_to_the_end_is_cached_for_both_entry_points(client, cache):
+    fake = client(OpenAIClient([(["Hello, ", "world"], "stop")]))
+    assert list(providers.stream_chat("OpenAI", ("sk-alice", "gpt-4o"), "prompt")) == ["Hello, ", "world"]
+    assert list(providers.stream_chat("OpenAI", ("sk-alice", "gpt-4o"), "prompt")) == ["Hello, world"]
+    assert providers.chat("OpenAI", ("sk-alice", "gpt-4o"), "prompt") == "Hello, world"
+    assert len(fake.requests) == 1
+
+
+class StalledStream(Stream):
+    """Sends its first event, then waits for a model that never finishes."""
+
+    async def __aiter__(self):
+        yield self.events[0]
+        await asyncio.sleep(3600)
+
+
+def test_an_abandoned_stream_is_closed_and_not_cached(client, cache):
+    fake = client(OpenAIClient([(["Hello, ", "world"], "stop"), (["Hello, ", "world"], "stop")]))
+    stalled = StalledStream([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Hello, "),
+                                                                      finish_reason=None)])])
+
+    async def create(stream=False, **kwargs):
+        fake.chat.completions.create = fake.create
+        return stalled
+
+    fake.chat.completions.create = create
+    stream = providers.stream_chat("OpenAI", ("sk-alice", "gpt-4o"), "prompt")
+    assert next(stream) == "Hello, "
+    stream.close()
+    assert list(providers.stream_chat("OpenAI", ("sk-alice", "gpt-4o"), "prompt")) == ["Hello, ", "world"]
+    assert stalled.closed
+    assert len(fake.requests) == 1
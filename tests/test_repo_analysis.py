@@ -0,0 +1,205 @@
+import base64
+import io
+import tarfile
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from github import GithubException
+
+from utils import repo_analysis
+from utils.repo_analysis import (
+    FETCH_ARCHIVE, analyze_and_index_github_repo, analyze_github_repo, diff_trees, git_blob_sha, iter_archive_contents,
+    iter_file_contents,
+)
+from utils.repo_cache import RepoCache
+
+REPO_URL = "https://github.com/o/app"
+FILES = {
+    "README.md": "# App\nAn order service.\n",
+    "app.py": "def index():\n    return 'home'\n",
+    "auth/login.py": "def login(user, password):\n    return check_password(user, password)\n",
+}
+
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    """Serve FILES as the archive of a fake repository and record the requests made for it."""
+    requests = []
+    cache = RepoCache(str(tmp_path))
+    monkeypatch.setattr(repo_analysis, "get_repo_cache", lambda: cache)
+
+    def open_github_repo(*args, **kwargs):
+        requests.append("open")
+        return "repo", "abc123"
+
+    monkeypatch.setattr(repo_analysis, "open_github_repo", open_github_repo)
+
+    def iter_archive_contents(repo, ref):
+        requests.append(ref)
+        for path, content in FILES.items():
+            yield path, git_blob_sha(content.encode()), content
+
+    monkeypatch.setattr(repo_analysis, "iter_archive_contents", iter_archive_contents)
+    return requests
+
+
+def test_the_repository_is_downloaded_once_for_both(github):
+    description, index, commit = analyze_and_index_github_repo(REPO_URL, "token", model="gpt-4o")
+    assert github == ["open", "abc123"]
+    assert commit == "abc123"
+    assert "An order service." in description
+    assert "File: auth/login.py" in description
+    assert index.search("password")[0].path == "auth/login.py"
+
+
+def test_a_cached_repository_is_not_downloaded_again(github):
+    first = analyze_and_index_github_repo(REPO_URL, "token", model="gpt-4o")
+    description, index, commit = analyze_and_index_github_repo(REPO_URL, "token", model="gpt-4o")
+    # The second call only resolves the head commit, once
+    assert github == ["open", "abc123", "open"]
+    assert (description, commit) == (first[0], "abc123")
+    assert index.chunks == first[1].chunks
+
+
+def test_without_the_cache_every_call_downloads_once(github):
+    analyze_and_index_github_repo(REPO_URL, "token", use_cache=False, model="gpt-4o")
+    analyze_and_index_github_repo(REPO_URL, "token", use_cache=False, model="gpt-4o")
+    assert github == ["open", "abc123", "open", "abc123"]
+
+
+def test_diff_trees_sorts_paths_by_change():
+    changes = diff_trees({"a.py": "1", "b.py": "2", "c.py": "3"}, {"a.py": "1", "b.py": "9", "d.py": "4"})
+    assert changes.added == ["d.py"]
+    assert changes.modified == ["b.py"]
+    assert changes.removed == ["c.py"]
+    assert changes.unchanged == ["a.py"]
+
+
+def test_files_past_the_budget_are_not_diffed_as_added(github, monkeypatch):
+    modules = {f"{name}.py": f"def {name}():\n    return '{name}'\n" for name in "abcde"}
+    commit = {"sha": "abc123", "files": {"README.md": "# App\n", **modules}}
+    monkeypatch.setattr(repo_analysis, "open_github_repo", lambda *args, **kwargs: ("repo", commit["sha"]))
+    monkeypatch.setattr(repo_analysis, "_list_blobs", lambda repo, ref: [
+        (path, git_blob_sha(content.encode())) for path, content in commit["files"].items()
+    ])
+
+    def iter_archive_contents(repo, ref):
+        github.append(ref)
+        for path, content in commit["files"].items():
+            yield path, git_blob_sha(content.encode()), content
+
+    fetched = []
+
+    def iter_file_contents(repo, paths, ref, max_workers=1):
+        fetched.extend(paths)
+        for path in paths:
+            yield path, commit["files"][path]
+
+    monkeypatch.setattr(repo_analysis, "iter_archive_contents", iter_archive_contents)
+    monkeypatch.setattr(repo_analysis, "iter_file_contents", iter_file_contents)
+    monkeypatch.setattr(repo_analysis, "INCREMENTAL_FETCH_LIMIT", 1)
+
+    # The budget runs out after the first module, so b.py to e.py are not analysed
+    analyze_github_repo(REPO_URL, "token", fetch_mode=FETCH_ARCHIVE, char_limit=1)
+    commit["sha"] = "def456"
+    commit["files"]["d.py"] = "def d():\n    return 'changed'\n"
+    analyze_github_repo(REPO_URL, "token", fetch_mode=FETCH_ARCHIVE, char_limit=1)
+
+    # Only d.py changed, which is within the limit for fetching it on its own
+    assert github == ["abc123"]
+    assert fetched == ["d.py"]
+
+
+class RateLimitedRepo:
+    """Answers get_contents, sending a 429 with Retry-After for the first request of `limited`."""
+
+    def __init__(self, limited, retry_after):
+        self.limited = limited
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = []
+        self.limited_at = None
+
+    def get_contents(self, path, ref):
+        with self.lock:
+            self.requests.append((path, time.monotonic()))
+            if path == self.limited and self.limited_at is None:
+                self.limited_at = time.monotonic()
+                raise GithubException(429, {"message": "slow down"}, {"Retry-After": str(self.retry_after)})
+        return SimpleNamespace(content=base64.b64encode(f"# {path}".encode()))
+
+
+def test_retry_after_holds_back_every_fetch_worker():
+    paths = [f"file{index}.py" for index in range(20)]
+    repo = RateLimitedRepo(paths[1], retry_after=0.2)
+    contents = list(iter_file_contents(repo, paths, "abc123", max_workers=4))
+    assert contents == [(path, f"# {path}") for path in paths]
+    retries = [started for path, started in repo.requests if path == repo.limited]
+    assert len(retries) == 2 and retries[1] >= repo.limited_at + 0.2
+    # Only the workers already past the gate sent a request before the delay was over
+    held = [started for _, started in repo.requests if repo.limited_at < started < repo.limited_at + 0.2]
+    assert len(held) < 4
+
+
+class ArchiveRepo:
+    def __init__(self):
+        self.refs = []
+
+    def get_archive_link(self, archive_format, ref):
+        self.refs.append((archive_format, ref))
+        return "https://codeload.github.com/o/app/legacy.tar.gz/" + ref
+
+
+class ArchiveResponse:
+    """A streamed response whose body is `data`."""
+
+    def __init__(self, data):
+        self.raw = io.BytesIO(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.raw.close()
+
+    def raise_for_status(self):
+        pass
+
+
+def tarball(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        directory = tarfile.TarInfo("o-app-abc123/auth")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for path, data in files.items():
+            member = tarfile.TarInfo("o-app-abc123/" + path)
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_an_archive_is_read_without_its_top_directory(monkeypatch):
+    data = tarball({
+        "README.md": b"# App\n",
+        "logo.png": b"\x89PNG",
+        "auth/login.py": b"hello\n",
+    })
+    fetched = []
+
+    def get(url, stream=False, timeout=None):
+        fetched.append((url, stream))
+        return ArchiveResponse(data)
+
+    monkeypatch.setattr(repo_analysis.requests, "get", get)
+    repo = ArchiveRepo()
+    files = list(iter_archive_contents(repo, "abc123"))
+    # Only the analysed files, in archive order, with the SHA git gives their blobs
+    assert files == [
+        ("README.md", git_blob_sha(b"# App\n"), "# App\n"),
+        ("auth/login.py", "ce013625030ba8dba906f756967f9e9ca394464a", "hello\n"),
+    ]
+    assert repo.refs == [("tarball", "abc123")]
+    assert fetched == [("https://codeload.github.com/o/app/legacy.tar.gz/abc123", True)]
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from utils import repo_cache
+from utils.repo_cache import RepoCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the cache's wall clock with one that advances an hour per reading."""
+    now = [1_000_000.0]
+
+    def time():
+        now[0] += 3600
+        return now[0]
+
+    monkeypatch.setattr(repo_cache.time, "time", time)
+    return now
+
+
+def total_size(cache):
+    (total,) = cache._connection().execute("SELECT total_size FROM stats WHERE id = 0").fetchone()
+    return total
+
+
+def test_values_round_trip_as_json(tmp_path):
+    cache = RepoCache(str(tmp_path))
+    cache.put("summary", "blob1", {"path": "app.py", "lines": [1, 2]})
+    assert cache.get("summary", "blob1") == {"path": "app.py", "lines": [1, 2]}
+    assert cache.get("summary", "missing") is None
+    # Kinds are separate namespaces
+    assert cache.get("description", "blob1") is None
+
+
+def test_get_many_returns_only_cached_keys(tmp_path):
+    cache = RepoCache(str(tmp_path))
+    for n in range(1200):
+        cache.put("summary", f"blob{n}", n)
+    keys = [f"blob{n}" for n in range(0, 1500, 3)] + ["blob0"]
+    assert cache.get_many("summary", keys) == {f"blob{n}": n for n in range(0, 1200, 3)}
+
+
+def test_put_replaces_and_tracks_the_total_size(tmp_path):
+    cache = RepoCache(str(tmp_path))
+    cache.put("summary", "a", "x" * 100)
+    cache.put("summary", "a", "x" * 10)
+    cache.put("summary", "b", "y")
+    assert total_size(cache) == len('"' + "x" * 10 + '"') + len('"y"')
+    cache.delete("summary", "a")
+    assert total_size(cache) == len('"y"')
+    cache.clear()
+    assert total_size(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    # 100 entries of 20 bytes fill the cache exactly
+    cache = RepoCache(str(tmp_path), max_bytes=2000)
+    for n in range(100):
+        cache.put("summary", f"k{n}", "x" * 18)
+    assert total_size(cache) == 2000
+    # Reading k0 refreshes it, so k1 is now the least recently used
+    assert cache.get("summary", "k0") is not None
+    cache.put("summary", "k100", "x" * 18)
+    assert total_size(cache) <= 2000 * repo_cache.EVICTION_TARGET
+    remaining = cache.get_many("summary", [f"k{n}" for n in range(101)])
+    assert "k0" in remaining and "k100" in remaining
+    assert "k1" not in remaining
+    evicted = {f"k{n}" for n in range(101)} - set(remaining)
+    assert max(int(key[1:]) for key in evicted) < min(int(key[1:]) for key in set(remaining) - {"k0"})
+
+
+def test_oversized_values_are_not_stored(tmp_path):
+    cache = RepoCache(str(tmp_path), max_bytes=1000)
+    cache.put("summary", "big", "x" * 300)
+    assert cache.get("summary", "big") is None
+
+
+def test_cache_is_shared_between_instances(tmp_path):
+    RepoCache(str(tmp_path)).put("description", "commit", "text")
+    assert RepoCache(str(tmp_path)).get("description", "commit") == "text"
+
+
+def test_cache_dir_expands_the_home_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("STRIDE_GPT_CACHE_DIR", "~/cache")
+    cache = RepoCache()
+    assert cache.path == os.path.join(str(tmp_path), "cache", "repo_cache.sqlite3")
+    assert os.path.exists(cache.path)
@@ -0,0 +1,17 @@
+import pytest
+
+from utils.results_view import page_bounds
+
+
+@pytest.mark.parametrize("total, page_size, page, expected", [
+    (60, 25, 1, (1, 3, 0, 25)),
+    # The last page is short
+    (60, 25, 3, (3, 3, 50, 60)),
+    (50, 25, 2, (2, 2, 25, 50)),
+    # A page past the end, e.g. after a filter, becomes the last one
+    (30, 25, 4, (2, 2, 25, 30)),
+    (0, 25, 3, (1, 1, 0, 0)),
+    (10, 25, 0, (1, 1, 0, 10)),
+])
+def test_page_bounds(total, page_size, page, expected):
+    assert page_bounds(total, page_size, page) == expected
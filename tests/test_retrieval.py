@@ -0,0 +1,120 @@
+import pytest
+
+from utils.retrieval import (
+    MAX_EXCERPT_CHARS,
+    MAX_INDEXED_FILE_BYTES,
+    STRIDE_QUERIES,
+    Chunk,
+    RepoIndex,
+    chunk_file,
+    format_retrieved_context,
+    retrieve_for_stride,
+    tokenize,
+)
+
+
+@pytest.mark.parametrize("text, terms", [
+    ("verify_jwt_token", ["verify_jwt_token", "verify", "jwt", "token"]),
+    ("getUserSession", ["getusersession", "get", "user", "session"]),
+    ("HTTPServer", ["httpserver", "http", "server"]),
+    ("parseJSON2Dict", ["parsejson2dict", "parse", "json", "dict"]),
+    ("a = b + c", []),
+    ("x.password", ["password"]),
+    ("", []),
+])
+def test_tokenize(text, terms):
+    assert tokenize(text) == terms
+
+
+def lines(count):
+    return "\n".join(f"line {n}" for n in range(1, count + 1))
+
+
+@pytest.mark.parametrize("line_count, windows", [
+    (0, []),
+    (1, [(1, 1)]),
+    (40, [(1, 40)]),
+    (41, [(1, 40), (31, 41)]),
+    (100, [(1, 40), (31, 70), (61, 100)]),
+])
+def test_chunk_file_windows_overlap(line_count, windows):
+    chunks = chunk_file("a.py", lines(line_count))
+    assert [(chunk.start_line, chunk.end_line) for chunk in chunks] == windows
+    for chunk in chunks:
+        assert chunk.text.splitlines()[0] == f"line {chunk.start_line}"
+
+
+def test_chunk_file_skips_blank_windows():
+    assert chunk_file("a.py", "\n" * 50 + "code") == [Chunk("a.py", 31, 51, "\n" * 20 + "code")]
+
+
+@pytest.fixture
+def index():
+    index = RepoIndex()
+    index.add_file("auth/session.py", "def login(user, password):\n    return create_session(user)\n")
+    index.add_file("api/orders.py", "def update_order(order_id, body):\n    db.execute(sql, body)\n")
+    index.add_file("util/log.py", "logger = logging.getLogger(__name__)\nlogger.info('audit event')\n")
+    index.add_file("README.md", "An order management service.\n")
+    return index
+
+
+def test_search_ranks_matching_chunks_first(index):
+    assert [chunk.path for chunk in index.search("password login", top_k=2)] == ["auth/session.py"]
+    assert index.search("sql update")[0].path == "api/orders.py"
+    assert index.search("audit logging")[0].path == "util/log.py"
+
+
+def test_search_matches_file_paths(index):
+    assert index.search("session")[0].path == "auth/session.py"
+
+
+def test_search_without_matches(index):
+    assert index.search("kubernetes") == []
+    assert RepoIndex().search("anything") == []
+
+
+def test_rarer_terms_weigh_more():
+    index = RepoIndex()
+    for n in range(5):
+        index.add_file(f"common{n}.py", "request handler")
+    index.add_file("rare.py", "request eval")
+    index.add_file("other.py", "request handler handler")
+    assert index.search("handler eval", top_k=1)[0].path == "rare.py"
+
+
+def test_search_is_deterministic_for_ties():
+    index = RepoIndex()
+    for name in ("b.py", "a.py", "c.py"):
+        index.add_file(name, "token")
+    assert [chunk.path for chunk in index.search("token", top_k=3)] == ["b.py", "a.py", "c.py"]
+
+
+def test_large_files_are_not_indexed():
+    index = RepoIndex()
+    index.add_file("bundle.min.js", "token " * (MAX_INDEXED_FILE_BYTES // 6 + 1))
+    assert len(index) == 0
+
+
+def test_index_round_trips_through_a_dict(index):
+    restored = RepoIndex.from_dict(index.to_dict())
+    assert restored.chunks == index.chunks
+    for query in STRIDE_QUERIES.values():
+        assert restored.search(query) == index.search(query)
+
+
+def test_retrieve_for_stride_covers_every_category(index):
+    results = retrieve_for_stride(index, top_k=1)
+    assert list(results) == list(STRIDE_QUERIES)
+    assert results["Spoofing"][0].path == "auth/session.py"
+    assert results["Repudiation"][0].path == "util/log.py"
+
+
+def test_format_retrieved_context_prints_each_chunk_once():
+    chunk = Chunk("auth.py", 1, 2, "check_password()")
+    long_chunk = Chunk("big.py", 1, 400, "x" * (MAX_EXCERPT_CHARS + 100))
+    text = format_retrieved_context({"Spoofing": [chunk], "Tampering": [], "Elevation of Privilege": [chunk, long_chunk]})
+    assert text.count("check_password()") == 1
+    assert "(see auth.py:1-2 above)" in text
+    assert "### Tampering" not in text
+    assert "x" * MAX_EXCERPT_CHARS + "\n..." in text
+    assert "x" * (MAX_EXCERPT_CHARS + 1) not in text
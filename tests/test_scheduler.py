@@ -0,0 +1,288 @@
+import asyncio
+import email.utils
+import time
+
+import pytest
+
+from utils.scheduler import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderLimits,
+    ProviderScheduler,
+    Slots,
+    TokenBucket,
+    call_tokens,
+    estimate_tokens,
+    retry_after,
+)
+
+
+class Clock:
+    """A monotonic clock that only moves when told to; its `sleep` advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = Response(headers or {})
+
+
+def scheduler(clock, rpm=0, tpm=0, concurrency=4):
+    return ProviderScheduler("test", ProviderLimits(rpm, tpm, concurrency), clock=clock, sleep=clock.sleep)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_jitter(monkeypatch):
+    monkeypatch.setattr("utils.scheduler.random.uniform", lambda low, high: high)
+    monkeypatch.setenv("STRIDE_GPT_MAX_ATTEMPTS", "3")
+
+
+def test_bucket_serves_a_full_minute_at_once():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+
+
+@pytest.mark.parametrize("reserved, expected_wait", [
+    (61, 1.0),
+    (65, 5.0),
+    (120, 60.0),
+])
+def test_bucket_waits_for_the_shortfall(reserved, expected_wait):
+    bucket = TokenBucket(60, Clock())
+    waits = [bucket.reserve(1) for _ in range(reserved)]
+    assert waits[-1] == pytest.approx(expected_wait)
+
+
+def test_bucket_refills_over_time_up_to_its_capacity():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)
+    bucket.reserve(60)
+    clock.now += 30
+    assert bucket.reserve(30) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 3600
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_bucket_charges_an_oversized_request_a_full_bucket():
+    bucket = TokenBucket(600, Clock())
+    assert bucket.reserve(10_000) == 0.0
+    assert bucket.reserve(600) == pytest.approx(60.0)
+
+
+def test_slots_are_handed_to_waiters_in_order():
+    slots = Slots(1)
+    woken = []
+    slots.acquire()
+    assert not slots._take_or_wait(lambda: woken.append("first"))
+    assert not slots._take_or_wait(lambda: woken.append("second"))
+    slots.release()
+    assert woken == ["first"]
+    slots.release()
+    assert woken == ["first", "second"]
+    slots.release()
+    assert slots._used == 0
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=3, reset_seconds=30, clock=clock)
+    for _ in range(2):
+        breaker.failure()
+    breaker.check("provider")
+    breaker.failure()
+    with pytest.raises(CircuitOpenError, match="30 more seconds"):
+        breaker.check("provider")
+
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.check("provider")
+    clock.now += 1
+    # Half open: one trial request goes through, the next is held back
+    breaker.check("provider")
+    with pytest.raises(CircuitOpenError):
+        breaker.check("provider")
+    breaker.success()
+    breaker.check("provider")
+    breaker.check("provider")
+
+
+def test_failed_trial_reopens_the_breaker_for_another_period():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset_seconds=30, clock=clock)
+    breaker.failure()
+    clock.now += 30
+    breaker.check("provider")
+    breaker.failure()
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.check("provider")
+    clock.now += 1
+    breaker.check("provider")
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=2, clock=Clock())
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.check("provider")
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "7"}, 7.0),
+    ({"retry-after": "1.5"}, 1.5),
+    ({"retry-after-ms": "250", "retry-after": "9"}, 0.25),
+    ({}, None),
+    ({"retry-after": "soon"}, None),
+])
+def test_retry_after_reads_the_response_headers(headers, expected):
+    assert retry_after(APIError(429, headers)) == expected
+
+
+def test_retry_after_accepts_an_http_date():
+    date = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert retry_after(APIError(429, {"retry-after": date})) == pytest.approx(120, abs=2)
+
+
+def test_retry_after_is_honoured_by_every_request_to_the_provider():
+    clock = Clock()
+    provider = scheduler(clock)
+    answers = iter([APIError(429, {"retry-after": "7"}), "done"])
+
+    def request():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    start = clock.now
+    assert provider.call(request) == "done"
+    assert clock.now - start == pytest.approx(7.0)
+    # The pause applies to requests that did not see the 429 too
+    provider.back_off(5)
+    assert provider._admission_delay(1) == pytest.approx(5.0)
+
+
+def test_transient_failures_back_off_exponentially_then_give_up():
+    clock = Clock()
+    provider = scheduler(clock)
+    calls = []
+
+    def request():
+        calls.append(clock.now)
+        raise APIError(503)
+
+    with pytest.raises(APIError):
+        provider.call(request)
+    assert len(calls) == 3
+    assert [sleep for sleep in clock.sleeps if sleep] == [1.0, 2.0]
+
+
+def test_client_errors_are_not_retried_and_do_not_open_the_breaker():
+    clock = Clock()
+    provider = scheduler(clock)
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise APIError(401)
+
+    for _ in range(10):
+        with pytest.raises(APIError):
+            provider.call(request)
+    assert len(calls) == 10
+    provider.breaker.check(provider.key)
+
+
+@pytest.mark.parametrize("error", [APIError(400), APIError(503), ValueError("bad")])
+def test_slot_is_released_when_the_request_raises(error):
+    provider = scheduler(Clock(), concurrency=1)
+
+    def request():
+        raise error
+
+    with pytest.raises(type(error)):
+        provider.call(request)
+    assert provider.slots._used == 0
+
+
+def read(stream):
+    async def run():
+        return [chunk async for chunk in stream]
+    return asyncio.run(run())
+
+
+def test_slot_is_released_when_a_stream_fails_midway():
+    provider = scheduler(Clock(), concurrency=1)
+    received = []
+
+    async def chunks():
+        yield "partial"
+        raise APIError(503)
+
+    async def run():
+        async for chunk in provider.astream(chunks):
+            received.append(chunk)
+
+    with pytest.raises(APIError):
+        asyncio.run(run())
+    # Part of the answer was shown, so the stream is not started over
+    assert received == ["partial"]
+    assert provider.slots._used == 0
+
+
+def test_a_stream_that_fails_before_its_first_chunk_is_retried():
+    provider = scheduler(Clock(), concurrency=1)
+    attempts = []
+
+    async def chunks():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise APIError(429, {"retry-after": "0"})
+        yield "whole answer"
+
+    assert read(provider.astream(chunks)) == ["whole answer"]
+    assert len(attempts) == 2
+    assert provider.slots._used == 0
+
+
+def test_requests_wait_for_the_token_budget():
+    clock = Clock()
+    provider = scheduler(clock, tpm=6000)
+    provider.call(lambda: None, tokens=6000)
+    provider.call(lambda: None, tokens=1000)
+    assert clock.sleeps[-1] == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize("budget, expected_output", [
+    ({"max_tokens": 100}, 100),
+    ({"max_output_tokens": 16384}, 16384),
+    ({}, None),
+], ids=["max_tokens", "max_output_tokens", "no model"])
+def test_call_tokens_charges_the_output_budget(budget, expected_output):
+    prompt = "x" * 400
+    assert call_tokens({"prompt": prompt, **budget}, prompt) == estimate_tokens(prompt, expected_output)
+
+
+def test_call_tokens_sizes_output_by_the_model():
+    assert call_tokens({"model_name": "gpt-4o", "prompt": "x"}, "x") > estimate_tokens("x")
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from utils.streaming import JSONArrayStreamParser
+
+THREAT_MODEL = {
+    "threat_model": [
+        {"Threat Type": "Spoofing", "Scenario": "Forged {JWT} with \"alg\": none", "Potential Impact": "Takeover"},
+        {"Threat Type": "Tampering", "Scenario": "Edits [orders] in transit", "Potential Impact": "Fraud, \\ loss"},
+        {"Threat Type": "Repudiation", "Scenario": "No audit log", "Potential Impact": "Denied actions",
+         "Steps": [["a", "b"], ["c"]]},
+    ],
+    "improvement_suggestions": ["Describe the auth flow", "List the data stores"],
+}
+TEXT = "```json\n" + json.dumps(THREAT_MODEL, indent=2) + "\n```"
+
+
+def feed_in_chunks(parser, text, size):
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_items_are_reported_whatever_the_chunk_boundaries(size):
+    parser = JSONArrayStreamParser("threat_model")
+    assert feed_in_chunks(parser, TEXT, size) == THREAT_MODEL["threat_model"]
+    assert parser.items == THREAT_MODEL["threat_model"]
+    assert parser.result() == THREAT_MODEL
+    assert (parser.text, parser.length) == (TEXT, len(TEXT))
+
+
+def test_text_before_the_open_item_is_not_kept_for_scanning():
+    threats = [{"Threat Type": "Spoofing", "Scenario": f"Scenario {number}"} for number in range(500)]
+    text = json.dumps({"threat_model": threats})
+    parser = JSONArrayStreamParser("threat_model")
+    item = len(json.dumps(threats[0]))
+    longest = 0
+    for start in range(0, len(text), 5):
+        parser.feed(text[start:start + 5])
+        longest = max(longest, len(parser._buffer))
+    assert parser.items == threats
+    assert longest < 2 * item
+
+
+def test_each_item_is_reported_by_the_chunk_that_closes_it():
+    parser = JSONArrayStreamParser("threat_model")
+    assert parser.feed('{"threat_model": [{"a": 1}, {"a"') == [{"a": 1}]
+    assert parser.feed(': 2') == []
+    assert parser.feed('}]}') == [{"a": 2}]
+
+
+def test_arrays_of_strings():
+    parser = JSONArrayStreamParser("improvement_suggestions")
+    assert feed_in_chunks(parser, TEXT, 5) == THREAT_MODEL["improvement_suggestions"]
+
+
+@pytest.mark.parametrize("text", [
+    # The key only counts at the top level of the object
+    '{"other": {"threat_model": [{"a": 1}]}, "threat_model": [{"a": 2}]}',
+    # A string value equal to the key is not the key
+    '{"note": "threat_model", "list": [{"a": 9}], "threat_model": [{"a": 2}]}',
+])
+def test_only_the_top_level_array_is_reported(text):
+    parser = JSONArrayStreamParser("threat_model")
+    assert feed_in_chunks(parser, text, 4) == [{"a": 2}]
+
+
+def test_missing_key_reports_nothing():
+    parser = JSONArrayStreamParser("threat_model")
+    assert parser.feed('{"improvement_suggestions": ["x"]}') == []
+    assert parser.result() == {"improvement_suggestions": ["x"]}
+
+
+def test_truncated_stream_is_repaired():
+    parser = JSONArrayStreamParser("threat_model")
+    cut = '{"threat_model": [{"a": 1}, {"a": 2, "b": "half'
+    assert feed_in_chunks(parser, cut, 3) == [{"a": 1}]
+    assert parser.result() == {"threat_model": [{"a": 1}]}
+
+
+def test_result_raises_without_json():
+    parser = JSONArrayStreamParser("threat_model")
+    parser.feed("I cannot help with that.")
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
+
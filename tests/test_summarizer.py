@@ -0,0 +1,47 @@
+from utils.summarizer import summarize_content, summarize_many
+
+MODULE = '''\
+import os
+from .db import query
+
+class Store(Base, metaclass=Meta):
+    def get(self, key):
+        return query(key)
+
+def helper(x):
+    return x
+
+@app.route("/login", methods=["POST"])
+async def login(user: str, password: str = "") -> bool:
+    return os.environ.get(user) == password
+'''
+
+
+def test_a_python_module_is_summarised_from_its_syntax_tree():
+    assert summarize_content("app/views.py", MODULE) == (
+        "Imports:\n"
+        "import os\n"
+        "from .db import query\n"
+        "Functions:\n"
+        "@app.route('/login', methods=['POST']) async def login(user: str, password: str='') -> bool\n"
+        "def helper(x)\n"
+        "Classes:\n"
+        "class Store(Base, metaclass=Meta): get\n"
+    )
+
+
+def test_python_that_does_not_parse_falls_back_to_patterns():
+    summary = summarize_content("legacy.py", "import urllib2\n\ndef fetch(url):\n    print url\n")
+    assert summary == "Imports:\nimport urllib2\nFunctions:\ndef fetch(url):\n"
+
+
+def test_javascript_routes_are_listed():
+    content = "const express = require('express');\napp.post('/upload', handler);\nfunction handler(req, res) {}\n"
+    summary = summarize_content("server.js", content)
+    assert "Routes:\napp.post('/upload'\n" in summary
+    assert "Functions:\nfunction handler(req, res)\n" in summary
+
+
+def test_files_are_summarised_in_order_across_processes():
+    files = [("a.py", "def a():\n    pass\n"), ("b.txt", "text"), ("c.py", "import c\n")]
+    assert summarize_many(files, processes=2) == ["Functions:\ndef a()\n", "", "Imports:\nimport c\n"]
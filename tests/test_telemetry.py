@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from utils.telemetry import PROVIDER_SPAN, Span, Telemetry, estimate_cost
+
+
+def provider_span(model, duration, prompt_tokens, completion_tokens, error=None, **attributes):
+    span = Span(PROVIDER_SPAN, attributes=dict(
+        provider="OpenAI", model=model, stage="threat_model", prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens, cost_usd=estimate_cost(model, prompt_tokens, completion_tokens),
+        **attributes,
+    ))
+    span.finish(error)
+    span.attributes["duration"] = duration
+    return span
+
+
+def test_costs_follow_the_longest_model_prefix():
+    # gpt-4o-mini, not gpt-4o
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert estimate_cost("gpt-4o", 2000, 1000) == pytest.approx(0.015)
+    assert estimate_cost("llama3", 1_000_000, 1_000_000) == 0.0
+
+
+def test_provider_spans_add_up_per_provider_model_and_stage(tmp_path):
+    trace_file = tmp_path / "traces.jsonl"
+    telemetry = Telemetry(trace_file=str(trace_file))
+    telemetry.record(provider_span("gpt-4o", 0.2, 2000, 1000, ttft=0.05))
+    telemetry.record(provider_span("gpt-4o", 0.4, 1000, 500, error=TimeoutError("late")))
+    stage = Span("threat_model")
+    stage.finish()
+    telemetry.record(stage)
+
+    stages, providers = telemetry.summary()
+    assert [(row["stage"], row["count"], row["errors"]) for row in stages] == [("threat_model", 1, 0)]
+    [row] = providers
+    assert (row["requests"], row["errors"]) == (2, 1)
+    assert row["total_s"] == pytest.approx(0.6)
+    assert (row["prompt_tokens"], row["completion_tokens"]) == (3000, 1500)
+    assert row["cost_usd"] == pytest.approx(0.0225)
+
+    text = telemetry.prometheus_text()
+    labels = 'model="gpt-4o",provider="OpenAI",stage="threat_model"'
+    assert f'stride_gpt_tokens_total{{kind="prompt",{labels}}} 3000' in text
+    assert f"stride_gpt_time_to_first_token_seconds_count{{{labels}}} 1" in text
+    assert f'stride_gpt_provider_request_seconds_count{{{labels},status="error"}} 1' in text
+    assert [json.loads(line)["name"] for line in trace_file.read_text().splitlines()] == [
+        PROVIDER_SPAN, PROVIDER_SPAN, "threat_model",
+    ]
@@ -1,42 +1,87 @@
+import asyncio
 import json
+import re
 import requests
-from anthropic import Anthropic
-from mistralai import Mistral, UserMessage
-from openai import OpenAI, AzureOpenAI
-import streamlit as st
+from concurrent.futures import as_completed
 
-import google.generativeai as genai
+from utils.clients import get_http_session, http_timeout, openai_url
+from utils.event_loop import run_sync, submit
+from utils.generation import parse_json
+from utils.llm_cache import cached_response
+from utils.providers import achat, stream_chat
+from utils.scheduler import scheduled
+from utils.retrieval import DEFAULT_TOP_K, STRIDE_QUERIES, format_retrieved_context, retrieve_for_stride
+from utils.telemetry import traced
+
+THREAT_MODEL_SYSTEM_PROMPT = "You are a helpful assistant designed to output JSON."
+
+STRIDE_CATEGORIES = tuple(STRIDE_QUERIES)
+
+# Threats (and suggestions) of a sharded threat model that share at least
+# this fraction of their words with one kept before are dropped as repeats
+DEDUPE_THRESHOLD = 0.6
 
 # Function to convert JSON to Markdown for display.    
 def json_to_markdown(threat_model, improvement_suggestions):
-    markdown_output = "## Threat Model\n\n"
-    
-    # Start the markdown table with headers
-    markdown_output += "| Threat Type | Scenario | Potential Impact |\n"
-    markdown_output += "|-------------|----------|------------------|\n"
-    
+    # Collect the lines and join them once, so large threat models render in linear time
+    lines = [
+        "## Threat Model",
+        "",
+        # Start the markdown table with headers
+        "| Threat Type | Scenario | Potential Impact |",
+        "|-------------|----------|------------------|",
+    ]
+
     # Fill the table rows with the threat model data
-    for threat in threat_model:
-        markdown_output += f"| {threat['Threat Type']} | {threat['Scenario']} | {threat['Potential Impact']} |\n"
-    
-    markdown_output += "\n\n## Improvement Suggestions\n\n"
-    for suggestion in improvement_suggestions:
-        markdown_output += f"- {suggestion}\n"
-    
-    return markdown_output
+    lines.extend(
+        f"| {threat.get('Threat Type', 'N/A')} | {threat.get('Scenario', 'N/A')} | {threat.get('Potential Impact', 'N/A')} |"
+        for threat in threat_model
+    )
+
+    lines += ["", "", "## Improvement Suggestions", ""]
+    lines.extend(f"- {suggestion}" for suggestion in improvement_suggestions)
+
+    return "\n".join(lines) + "\n"
+
+# Function to create a prompt for generating a threat model. When a repository
+# index is given, the code excerpts most relevant to each STRIDE category are
+# retrieved from it and added to the prompt. With a `category`, the prompt
+# asks for the threats of that STRIDE category only (see create_sharded_threat_model_prompts).
+@traced("prompt_build")
+def create_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, app_input,
+                               repo_index=None, top_k=DEFAULT_TOP_K, category=None):
+    code_excerpts = ""
+    if repo_index:
+        extra_terms = " ".join([*authentication, *sensitive_data])
+        if category:
+            results = {category: repo_index.search(f"{STRIDE_QUERIES[category]} {extra_terms}", top_k)}
+        else:
+            results = retrieve_for_stride(repo_index, extra_terms, top_k)
+        retrieved = format_retrieved_context(results)
+        if retrieved:
+            code_excerpts = f"""
+RELEVANT CODE EXCERPTS (retrieved from the repository for each STRIDE category):
+{retrieved}"""
+
+    if category:
+        categories_instruction = f"""Consider only the {category} category of STRIDE; the other categories are covered separately. List multiple (3 or 4) credible {category} threats if applicable, each with "Threat Type" set to "{category}". Each threat scenario should provide a credible scenario in which the threat could occur in the context of the application. It is very important that your responses are tailored to reflect the details you are given."""
+        suggestions_scope = f" against {category} threats"
+        example_type = category
+    else:
+        categories_instruction = """For each of the STRIDE categories (Spoofing, Tampering, Repudiation, Information Disclosure, Denial of Service, and Elevation of Privilege), list multiple (3 or 4) credible threats if applicable. Each threat scenario should provide a credible scenario in which the threat could occur in the context of the application. It is very important that your responses are tailored to reflect the details you are given."""
+        suggestions_scope = ""
+        example_type = "Spoofing"
 
-# Function to create a prompt for generating a threat model
-def create_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, app_input):
     prompt = f"""
 Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to analyze the provided code summary, README content, and application description to produce a list of specific threats for the application.
 
 Pay special attention to the README content as it often provides valuable context about the project's purpose, architecture, and potential security considerations.
 
-For each of the STRIDE categories (Spoofing, Tampering, Repudiation, Information Disclosure, Denial of Service, and Elevation of Privilege), list multiple (3 or 4) credible threats if applicable. Each threat scenario should provide a credible scenario in which the threat could occur in the context of the application. It is very important that your responses are tailored to reflect the details you are given.
+{categories_instruction}
 
 When providing the threat model, use a JSON formatted response with the keys "threat_model" and "improvement_suggestions". Under "threat_model", include an array of objects with the keys "Threat Type", "Scenario", and "Potential Impact". 
 
-Under "improvement_suggestions", include an array of strings with suggestions on how the developers can improve their code or application description to enhance security.
+Under "improvement_suggestions", include an array of strings with suggestions on how the developers can improve their code or application description to enhance security{suggestions_scope}.
 
 APPLICATION TYPE: {app_type}
 AUTHENTICATION METHODS: {authentication}
@@ -44,18 +89,19 @@ INTERNET FACING: {internet_facing}
 SENSITIVE DATA: {sensitive_data}
 CODE SUMMARY, README CONTENT, AND APPLICATION DESCRIPTION:
 {app_input}
+{code_excerpts}
 
 Example of expected JSON response format:
   
     {{
       "threat_model": [
         {{
-          "Threat Type": "Spoofing",
+          "Threat Type": "{example_type}",
           "Scenario": "Example Scenario 1",
           "Potential Impact": "Example Potential Impact 1"
         }},
         {{
-          "Threat Type": "Spoofing",
+          "Threat Type": "{example_type}",
           "Scenario": "Example Scenario 2",
           "Potential Impact": "Example Potential Impact 2"
         }},
@@ -70,6 +116,60 @@ Example of expected JSON response format:
 """
     return prompt
 
+# Function to create one threat model prompt per STRIDE category. The shards
+# share the application description and repository context; they can be
+# generated concurrently and combined with merge_threat_models.
+def create_sharded_threat_model_prompts(app_type, authentication, internet_facing, sensitive_data, app_input,
+                                        repo_index=None, top_k=DEFAULT_TOP_K):
+    return {
+        category: create_threat_model_prompt(
+            app_type, authentication, internet_facing, sensitive_data, app_input,
+            repo_index=repo_index, top_k=top_k, category=category,
+        )
+        for category in STRIDE_CATEGORIES
+    }
+
+def _terms(text):
+    return set(re.findall(r"[a-z0-9]{3,}", str(text).lower()))
+
+def _similarity(a, b):
+    # Jaccard similarity of two term sets
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _dedupe(items, text_of, threshold):
+    kept = []
+    kept_terms = []
+    for item in items:
+        terms = _terms(text_of(item))
+        if any(_similarity(terms, other) >= threshold for other in kept_terms):
+            continue
+        kept.append(item)
+        kept_terms.append(terms)
+    return kept
+
+# Function to combine the threat models of several shards into one. Threats
+# are kept in STRIDE order, and a threat or suggestion whose wording mostly
+# repeats one already kept is dropped.
+def merge_threat_models(shards, threshold=DEDUPE_THRESHOLD):
+    threats = []
+    suggestions = []
+    for category in STRIDE_CATEGORIES:
+        shard = shards.get(category) or {}
+        threats.extend({"Threat Type": category, **threat} for threat in shard.get("threat_model", []) if isinstance(threat, dict))
+        suggestions.extend(suggestion for suggestion in shard.get("improvement_suggestions", []) if isinstance(suggestion, str))
+    return {
+        "threat_model": _dedupe(threats, lambda threat: f"{threat.get('Scenario', '')} {threat.get('Potential Impact', '')}", threshold),
+        "improvement_suggestions": _dedupe(suggestions, lambda suggestion: suggestion, threshold),
+    }
+
+# Function to describe the shards that failed, as {category: error}, for
+# the warning shown next to a sharded threat model.
+def failed_shards_warning(failed):
+    reasons = "; ".join(f"{category} ({error})" for category, error in failed.items())
+    return f"No threats could be generated for: {reasons}"
+
 def create_image_analysis_prompt():
     prompt = """
     You are a Senior Solution Architect tasked with explaining the following architecture diagram to 
@@ -94,6 +194,8 @@ def create_image_analysis_prompt():
     return prompt
 
 # Function to get analyse uploaded architecture diagrams.
+@cached_response("openai", "model_name", "base64_image")
+@scheduled("openai")
 def get_image_analysis(api_key, model_name, prompt, base64_image):
     headers = {
         "Content-Type": "application/json",
@@ -122,7 +224,7 @@ def get_image_analysis(api_key, model_name, prompt, base64_image):
         "max_tokens": 4000
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+    response = get_http_session().post(openai_url("/chat/completions"), headers=headers, json=payload, timeout=http_timeout())
 
     # Log the response for debugging
     try:
@@ -138,123 +240,124 @@ def get_image_analysis(api_key, model_name, prompt, base64_image):
     return None
 
 
+# The functions below are the entry points for each provider. They all go
+# through the async provider layer of utils/providers.py, which caches,
+# schedules and continues every request and repairs cut-off JSON.
+
 # Function to get threat model from the GPT response.
-def get_threat_model(api_key, model_name, prompt):
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model=model_name,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=4000,
-    )
+def get_threat_model(api_key, model_name, prompt, use_cache=True):
+    return run_sync(aget_threat_model("OpenAI", (api_key, model_name), prompt, use_cache=use_cache))
 
-    # Convert the JSON string in the 'content' field to a Python dictionary
-    response_content = json.loads(response.choices[0].message.content)
 
-    return response_content
+# Function to get threat model from the Azure OpenAI response.
+def get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return run_sync(aget_threat_model("Azure OpenAI", credentials, prompt, use_cache=use_cache))
 
 
-# Function to get threat model from the Azure OpenAI response.
-def get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt):
-    client = AzureOpenAI(
-        azure_endpoint = azure_api_endpoint,
-        api_key = azure_api_key,
-        api_version = azure_api_version,
-    )
+# Function to get threat model from the Google response.
+def get_threat_model_google(google_api_key, google_model, prompt, use_cache=True):
+    return run_sync(aget_threat_model("Google", (google_api_key, google_model), prompt, use_cache=use_cache))
 
-    response = client.chat.completions.create(
-        model = azure_deployment_name,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
-    )
+# Function to get threat model from the Mistral response.
+def get_threat_model_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return run_sync(aget_threat_model("Mistral", (mistral_api_key, mistral_model), prompt, use_cache=use_cache))
 
-    # Convert the JSON string in the 'content' field to a Python dictionary
-    response_content = json.loads(response.choices[0].message.content)
+# Function to get threat model from Ollama hosted LLM.
+def get_threat_model_ollama(ollama_model, prompt, use_cache=True):
+    return run_sync(aget_threat_model("Ollama", (ollama_model,), prompt, use_cache=use_cache))
 
-    return response_content
+# Function to get threat model from the Claude response.
+def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return run_sync(aget_threat_model("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache=use_cache))
 
+# Streaming variants of the functions above. They yield the response text as
+# it is generated; feed the chunks to a JSONArrayStreamParser("threat_model")
+# to show each threat as soon as it is complete.
 
-# Function to get threat model from the Google response.
-def get_threat_model_google(google_api_key, google_model, prompt):
-    genai.configure(api_key=google_api_key)
-    model = genai.GenerativeModel(
-        google_model,
-        generation_config={"response_mime_type": "application/json"})
-    response = model.generate_content(
-        prompt,
-        safety_settings={
-            'DANGEROUS': 'block_only_high' # Set safety filter to allow generation of threat models
-        })
-    try:
-        # Access the JSON content from the 'parts' attribute of the 'content' object
-        response_content = json.loads(response.candidates[0].content.parts[0].text)
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {str(e)}")
-        print("Raw JSON string:")
-        print(response.candidates[0].content.parts[0].text)
-        return None
+def _stream_threat_model(provider, credentials, prompt, use_cache):
+    return stream_chat(provider, credentials, prompt, system=THREAT_MODEL_SYSTEM_PROMPT, json_mode=True,
+                       use_cache=use_cache, stage="threat_model")
 
-    return response_content
+# Function to stream the threat model from the GPT response.
+def stream_threat_model(api_key, model_name, prompt, use_cache=True):
+    return _stream_threat_model("OpenAI", (api_key, model_name), prompt, use_cache)
 
-# Function to get threat model from the Mistral response.
-def get_threat_model_mistral(mistral_api_key, mistral_model, prompt):
-    client = Mistral(api_key=mistral_api_key)
-
-    response = client.chat.complete(
-        model = mistral_model,
-        response_format={"type": "json_object"},
-        messages=[
-            UserMessage(content=prompt)
-        ]
-    )
 
-    # Convert the JSON string in the 'content' field to a Python dictionary
-    response_content = json.loads(response.choices[0].message.content)
+# Function to stream the threat model from the Azure OpenAI response.
+def stream_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, use_cache=True):
+    credentials = (azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name)
+    return _stream_threat_model("Azure OpenAI", credentials, prompt, use_cache)
 
-    return response_content
 
-# Function to get threat model from Ollama hosted LLM.
-def get_threat_model_ollama(ollama_model, prompt):
+# Function to stream the threat model from the Google response.
+def stream_threat_model_google(google_api_key, google_model, prompt, use_cache=True):
+    return _stream_threat_model("Google", (google_api_key, google_model), prompt, use_cache)
 
-    url = "http://localhost:11434/api/generate"
+# Function to stream the threat model from the Mistral response.
+def stream_threat_model_mistral(mistral_api_key, mistral_model, prompt, use_cache=True):
+    return _stream_threat_model("Mistral", (mistral_api_key, mistral_model), prompt, use_cache)
 
-    data = {
-        "model": ollama_model,
-        "prompt": prompt,
-        "format": "json",
-        "stream": False
-    }
+# Function to stream the threat model from Ollama hosted LLM.
+def stream_threat_model_ollama(ollama_model, prompt, use_cache=True):
+    return _stream_threat_model("Ollama", (ollama_model,), prompt, use_cache)
 
-    response = requests.post(url, json=data)
+# Function to stream the threat model from the Claude response.
+def stream_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt, use_cache=True):
+    return _stream_threat_model("Anthropic", (anthropic_api_key, anthropic_model), prompt, use_cache)
 
-    outer_json = response.json()
 
-    inner_json = json.loads(outer_json['response'])
+# Function to get a threat model from any provider through the async provider
+# layer, for callers that run many generations concurrently.
+@traced("generate", stage="threat_model")
+async def aget_threat_model(provider, credentials, prompt, use_cache=True):
+    response_text = await achat(
+        provider, credentials, prompt,
+        system=THREAT_MODEL_SYSTEM_PROMPT, json_mode=True, use_cache=use_cache,
+    )
+    try:
+        return parse_json(response_text)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON: {str(e)}")
+        print("Raw JSON string:")
+        print(response_text)
+        return None
 
-    return inner_json
 
-# Function to get threat model from the Claude response.
-def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
-    client = Anthropic(api_key=anthropic_api_key)
-    response = client.messages.create(
-        model=anthropic_model,
-        max_tokens=1024,
-        system="You are a helpful assistant designed to output JSON.",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
+# Function to generate a threat model one STRIDE category at a time: every
+# shard of create_sharded_threat_model_prompts is requested at once through
+# the async provider layer and the results are merged. Shards that fail are
+# left out; if they all fail the first error is raised.
+@traced("generate", stage="threat_model")
+async def aget_threat_model_sharded(provider, credentials, prompts, use_cache=True):
+    results = await asyncio.gather(
+        *(aget_threat_model(provider, credentials, prompt, use_cache=use_cache) for prompt in prompts.values()),
+        return_exceptions=True,
     )
+    shards = {category: result for category, result in zip(prompts, results) if isinstance(result, dict)}
+    if not shards:
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        return None
+    return merge_threat_models(shards)
 
-    # Combine all text blocks into a single string
-    full_content = ''.join(block.text for block in response.content)
-    
-    # Parse the combined JSON string
-    response_content = json.loads(full_content)
-    return response_content
\ No newline at end of file
+
+# Function to generate the shards of a threat model from synchronous code. It
+# yields (category, threat model or None, error or None) as each shard
+# finishes, so the threats can be shown while the others are still running.
+def iter_threat_model_shards(provider, credentials, prompts, use_cache=True):
+    futures = {
+        submit(aget_threat_model(provider, credentials, prompt, use_cache=use_cache)): category
+        for category, prompt in prompts.items()
+    }
+    try:
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        # Also reached when the caller stops early, e.g. on a Streamlit rerun
+        for future in futures:
+            future.cancel()
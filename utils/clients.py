@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .sdk import lazy_import
+
+# Imported when the first client of each is created
+anthropic = lazy_import("anthropic")
+mistralai = lazy_import("mistralai")
+openai = lazy_import("openai")
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_TIMEOUT = 300
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# Clients kept alive at once; the least recently used is dropped beyond this
+MAX_CLIENTS = 32
+
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+
+def pool_size():
+    return int(os.getenv('STRIDE_GPT_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+
+def http_timeout():
+    """Return (connect, read) timeouts in seconds for provider requests."""
+    return (
+        float(os.getenv('STRIDE_GPT_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+        float(os.getenv('STRIDE_GPT_HTTP_TIMEOUT', DEFAULT_TIMEOUT)),
+    )
+
+
+def openai_url(path):
+    return os.getenv('OPENAI_BASE_URL', DEFAULT_OPENAI_BASE_URL).rstrip("/") + path
+
+
+def ollama_url(path):
+    host = os.getenv('OLLAMA_HOST', DEFAULT_OLLAMA_HOST)
+    if "://" not in host:
+        host = "http://" + host
+    return host.rstrip("/") + path
+
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def _registry_key(kind, *parts):
+    # Credentials are hashed so they are not kept around as dictionary keys
+    digest = hashlib.sha256("\0".join(str(part) for part in parts).encode()).hexdigest()
+    return f"{kind}:{digest}"
+
+
+def _get_or_create(key, factory):
+    """Return the client registered under `key`, creating it with `factory` on first use.
+
+    Clients are shared by every Streamlit session and rerun in the process,
+    so connections (and their TLS sessions) are reused between generations.
+    """
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+    client = factory()
+    with _clients_lock:
+        # Another thread may have won the race; keep a single client per key
+        client = _clients.setdefault(key, client)
+        _clients.move_to_end(key)
+        while len(_clients) > MAX_CLIENTS:
+            # Not closed: another session may still be in the middle of a
+            # request with it. Its connections go once the last user drops it.
+            _clients.popitem(last=False)
+    return client
+
+
+def _pooled_httpx_client(client_class):
+    # Depending on the SDK version the client derives from httpx or a fork
+    # of it; build limits and timeouts from the module it actually uses.
+    base = next(cls for cls in client_class.__mro__ if cls.__name__ in ("Client", "AsyncClient"))
+    http_module = sys.modules[base.__module__.split(".")[0]]
+    connect, read = http_timeout()
+    size = pool_size()
+    return client_class(
+        limits=http_module.Limits(max_connections=size, max_keepalive_connections=size),
+        timeout=http_module.Timeout(read, connect=connect),
+    )
+
+
+# The SDKs' own retries are turned off (max_retries=0): utils/scheduler.py
+# retries every provider the same way and counts failures for its circuit breaker.
+def get_openai_client(api_key):
+    return _get_or_create(
+        _registry_key("openai", api_key, os.getenv('OPENAI_BASE_URL', '')),
+        lambda: openai.OpenAI(api_key=api_key, http_client=_pooled_httpx_client(openai.DefaultHttpxClient), max_retries=0),
+    )
+
+
+def get_azure_openai_client(azure_api_endpoint, azure_api_key, azure_api_version):
+    return _get_or_create(
+        _registry_key("azure", azure_api_endpoint, azure_api_key, azure_api_version),
+        lambda: openai.AzureOpenAI(
+            azure_endpoint=azure_api_endpoint,
+            api_key=azure_api_key,
+            api_version=azure_api_version,
+            http_client=_pooled_httpx_client(openai.DefaultHttpxClient),
+            max_retries=0,
+        ),
+    )
+
+
+def get_anthropic_client(api_key):
+    return _get_or_create(
+        _registry_key("anthropic", api_key, os.getenv('ANTHROPIC_BASE_URL', '')),
+        lambda: anthropic.Anthropic(api_key=api_key, http_client=_pooled_httpx_client(anthropic.DefaultHttpxClient), max_retries=0),
+    )
+
+
+def get_mistral_client(api_key):
+    def create():
+        connect, read = http_timeout()
+        size = pool_size()
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+        return mistralai.Mistral(api_key=api_key, client=http_client)
+
+    return _get_or_create(_registry_key("mistral", api_key), create)
+
+
+def get_http_session():
+    """Return the shared requests.Session used for Ollama and other plain HTTP calls."""
+    def create():
+        session = requests.Session()
+        size = pool_size()
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    return _get_or_create("http-session", create)
+
+
+# Async clients hold connections that belong to the event loop they were
+# first used on, so they are registered per loop rather than process-wide.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_or_create_async(key, factory):
+    """Return the async client registered under `key` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, OrderedDict())
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = factory()
+        clients.move_to_end(key)
+        while len(clients) > MAX_CLIENTS:
+            # Left to the garbage collector, as in _get_or_create
+            clients.popitem(last=False)
+    return client
+
+
+def get_async_openai_client(api_key):
+    return _get_or_create_async(
+        _registry_key("openai", api_key, os.getenv('OPENAI_BASE_URL', '')),
+        lambda: openai.AsyncOpenAI(api_key=api_key, http_client=_pooled_httpx_client(openai.DefaultAsyncHttpxClient), max_retries=0),
+    )
+
+
+def get_async_azure_openai_client(azure_api_endpoint, azure_api_key, azure_api_version):
+    return _get_or_create_async(
+        _registry_key("azure", azure_api_endpoint, azure_api_key, azure_api_version),
+        lambda: openai.AsyncAzureOpenAI(
+            azure_endpoint=azure_api_endpoint,
+            api_key=azure_api_key,
+            api_version=azure_api_version,
+            http_client=_pooled_httpx_client(openai.DefaultAsyncHttpxClient),
+            max_retries=0,
+        ),
+    )
+
+
+def get_async_anthropic_client(api_key):
+    return _get_or_create_async(
+        _registry_key("anthropic", api_key, os.getenv('ANTHROPIC_BASE_URL', '')),
+        lambda: anthropic.AsyncAnthropic(api_key=api_key, http_client=_pooled_httpx_client(anthropic.DefaultAsyncHttpxClient), max_retries=0),
+    )
+
+
+def get_async_mistral_client(api_key):
+    # The Mistral client takes both: `client` for the sync methods and
+    # `async_client` for the *_async ones used here.
+    return _get_or_create_async(
+        _registry_key("mistral", api_key),
+        lambda: mistralai.Mistral(api_key=api_key, async_client=_pooled_httpx_client(httpx.AsyncClient)),
+    )
+
+
+def get_async_http_client():
+    """Return the shared httpx.AsyncClient used for Ollama and GitHub requests."""
+    return _get_or_create_async("http-client", lambda: _pooled_httpx_client(httpx.AsyncClient))
@@ -0,0 +1,225 @@
+import math
+import re
+import threading
+from collections import namedtuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: token counts fall back to a per-provider estimate
+    tiktoken = None
+
+PACK_GREEDY = "greedy"
+PACK_KNAPSACK = "knapsack"
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Context windows in tokens, matched by the longest model name prefix
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "o3": 200000,
+    "claude": 200000,
+    "gemini-pro": 32760,
+    "gemini-1.5": 1000000,
+    "mistral-large": 128000,
+    "mistral-medium": 32000,
+    "mistral-small": 32000,
+    "llama2": 4096,
+    "llama3": 8192,
+    "codellama": 16384,
+}
+
+# Tokens kept free for the model's answer and for the fixed prompt text
+OUTPUT_RESERVE = 4000
+PROMPT_OVERHEAD = 800
+
+# Share of the remaining window given to the system description. When code
+# excerpts are retrieved per STRIDE category they get the rest.
+DESCRIPTION_SHARE = 1.0
+OVERVIEW_SHARE = 0.4
+
+# Estimated characters per token when no tokenizer is available
+CHARS_PER_TOKEN = {
+    "gpt": 4.0,
+    "o1": 4.0,
+    "o3": 4.0,
+    "claude": 3.5,
+    "gemini": 4.0,
+    "mistral": 3.5,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# The knapsack works on token counts rounded up to this many buckets
+KNAPSACK_RESOLUTION = 2000
+
+# Summaries are walked until this multiple of the budget has been collected,
+# so that the packer has something to choose from without reading every file
+# of a very large repository.
+CANDIDATE_FACTOR = 3
+
+# (pattern on the lower-cased path, weight). Matches add up.
+PATH_WEIGHTS = [
+    (re.compile(r"auth|login|logout|signin|signup|session|oauth|saml|sso|jwt|token|passw|credential|identity"), 5),
+    (re.compile(r"crypt|cipher|hash|signature|signing|secret|key|cert|tls|ssl|vault|kms"), 4),
+    (re.compile(r"permission|role|acl|rbac|polic|admin|access|privilege"), 4),
+    (re.compile(r"route|handler|controller|view|endpoint|api/|/api|middleware|server|webhook|upload"), 3),
+    (re.compile(r"config|setting|\.env|environment"), 3),
+    (re.compile(r"terraform|\.tf$|k8s|kubernetes|helm|docker|deploy|infra|ansible|cloudformation|iam"), 3),
+    (re.compile(r"model|schema|serializ|valid|sanitiz|query|sql|db/|database"), 2),
+    (re.compile(r"log|audit"), 1),
+]
+
+# Paths that rarely say anything about the attack surface
+LOW_VALUE_PATH = re.compile(r"(^|/)(tests?|specs?|__tests__|examples?|docs?|vendor|node_modules|third_party|fixtures|migrations)/|\.min\.|_test\.|\.test\.|\.spec\.")
+
+# (pattern on the summary, weight)
+CONTENT_WEIGHTS = [
+    (re.compile(r"jwt|jsonwebtoken|oauth|passport|bcrypt|argon2|scrypt|pbkdf2|password|login_required|authenticate"), 4),
+    (re.compile(r"crypto|hashlib|hmac|cryptography|ssl|tls|secrets|\bsign\b|encrypt|decrypt"), 3),
+    (re.compile(r"@\w*\.?(?:route|get|post|put|patch|delete)\b|Mapping\(|Routes:|router\.|app\.(?:get|post|use)"), 3),
+    (re.compile(r"subprocess|os\.system|\beval\b|\bexec\b|pickle|yaml\.load|deserializ|child_process"), 3),
+    (re.compile(r"sql|cursor|execute|query|orm|sqlalchemy|sequelize|gorm|activerecord"), 2),
+    (re.compile(r"requests|http|urllib|fetch|axios|net/http|socket"), 1),
+    (re.compile(r"os\.environ|getenv|dotenv|config|settings"), 1),
+]
+
+PackItem = namedtuple("PackItem", ["key", "tokens", "score"])
+
+
+class TokenCounter:
+    """Counts tokens for one model, with tiktoken where it is installed."""
+
+    def __init__(self, model=None):
+        self.model = model or ""
+        self._encoding = None
+        if tiktoken is not None and self.model.startswith(("gpt", "o1", "o3", "text-")):
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        for prefix, ratio in CHARS_PER_TOKEN.items():
+            if self.model.startswith(prefix):
+                self.chars_per_token = ratio
+                break
+
+    @property
+    def name(self):
+        """Identifies how tokens are counted, for use in cache keys."""
+        if self._encoding is not None:
+            return f"tiktoken:{self._encoding.name}"
+        return f"chars/{self.chars_per_token}"
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model=None):
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            counter = _counters[model] = TokenCounter(model)
+        return counter
+
+
+def context_window(model):
+    """Return the context window of `model` in tokens, or DEFAULT_CONTEXT_WINDOW if it is unknown."""
+    if not model:
+        return DEFAULT_CONTEXT_WINDOW
+    model = model.lower()
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def description_budget(model, share=DESCRIPTION_SHARE):
+    """Return the tokens available to the system description in a threat model prompt for `model`."""
+    available = context_window(model) - OUTPUT_RESERVE - PROMPT_OVERHEAD
+    return max(int(available * share), 1000)
+
+
+def security_score(path, summary=""):
+    """Score how much a file is likely to tell about the application's attack surface."""
+    lowered = path.lower()
+    score = 1.0
+    score += sum(weight for pattern, weight in PATH_WEIGHTS if pattern.search(lowered))
+    score += sum(weight for pattern, weight in CONTENT_WEIGHTS if pattern.search(summary))
+    if LOW_VALUE_PATH.search(lowered):
+        score /= 4
+    return score
+
+
+def pack_greedy(items, budget):
+    """Pick items by score per token until `budget` is full; returns the chosen keys."""
+    chosen = []
+    remaining = budget
+    for item in sorted(items, key=lambda item: (-item.score / max(item.tokens, 1), item.key)):
+        if item.tokens <= remaining:
+            chosen.append(item.key)
+            remaining -= item.tokens
+    return chosen
+
+
+def pack_knapsack(items, budget, resolution=KNAPSACK_RESOLUTION):
+    """Pick the items with the highest total score that fit in `budget` (0/1 knapsack).
+
+    Token counts are rounded up to `budget / resolution`, so the table stays
+    small for large budgets. The slack this leaves is filled greedily, and
+    the greedy packing is returned instead if it scores higher.
+    """
+    items = [item for item in items if item.tokens <= budget]
+    if not items:
+        return []
+    unit = max(budget / resolution, 1)
+    capacity = int(budget // unit)
+    weights = [max(1, math.ceil(item.tokens / unit)) for item in items]
+    best = [0.0] * (capacity + 1)
+    taken = []
+    for item, weight in zip(items, weights):
+        row = bytearray(capacity + 1)
+        for size in range(capacity, weight - 1, -1):
+            value = best[size - weight] + item.score
+            if value > best[size]:
+                best[size] = value
+                row[size] = 1
+        taken.append(row)
+
+    chosen = set()
+    size = capacity
+    for index in range(len(items) - 1, -1, -1):
+        if taken[index][size]:
+            chosen.add(index)
+            size -= weights[index]
+    used = sum(items[index].tokens for index in chosen)
+    rest = [PackItem(index, items[index].tokens, items[index].score)
+            for index in range(len(items)) if index not in chosen]
+    chosen.update(pack_greedy(rest, budget - used))
+
+    greedy = pack_greedy(items, budget)
+    by_key = {item.key: item for item in items}
+    if sum(by_key[key].score for key in greedy) > sum(items[index].score for index in chosen):
+        return greedy
+    return [items[index].key for index in sorted(chosen)]
+
+
+def pack(items, budget, strategy=PACK_GREEDY):
+    if strategy == PACK_KNAPSACK:
+        return pack_knapsack(items, budget)
+    if strategy == PACK_GREEDY:
+        return pack_greedy(items, budget)
+    raise ValueError(f"Unknown packing strategy: {strategy}")
@@ -0,0 +1,56 @@
+import streamlit as st
+
+from .telemetry import PROVIDER_SPAN, get_telemetry
+
+# Spans listed in the panel; all of them are in the downloaded trace
+RECENT_SPANS = 200
+
+
+def render_diagnostics():
+    """Show where time, tokens and money went in this process: per stage, per provider and per span."""
+    telemetry = get_telemetry()
+    stages, providers = telemetry.summary()
+    with st.expander("🔬 Diagnostics", expanded=True):
+        st.caption("Totals since this server process started, across all sessions.")
+        if providers:
+            st.markdown("**Provider requests**")
+            st.dataframe(providers, hide_index=True, column_config={
+                "total_s": st.column_config.NumberColumn("total s", format="%.2f"),
+                "cost_usd": st.column_config.NumberColumn("est. cost", format="$%.4f"),
+            })
+        if stages:
+            st.markdown("**Stages**")
+            st.dataframe(stages, hide_index=True, column_config={
+                "total_s": st.column_config.NumberColumn("total s", format="%.3f"),
+                "mean_s": st.column_config.NumberColumn("mean s", format="%.3f"),
+                "p95_s": st.column_config.NumberColumn("p95 s (≤)", format="%g"),
+            })
+        spans = telemetry.recent_spans(RECENT_SPANS)
+        if spans:
+            st.markdown("**Recent spans**")
+            st.dataframe(
+                [
+                    {
+                        "span": span["name"] if span["name"] != PROVIDER_SPAN
+                        else f"{span['attributes'].get('provider')}: {span['attributes'].get('stage')}",
+                        "seconds": span["attributes"].get("duration"),
+                        "first token s": span["attributes"].get("ttft"),
+                        "prompt tokens": span["attributes"].get("prompt_tokens"),
+                        "completion tokens": span["attributes"].get("completion_tokens"),
+                        "error": span["error"],
+                    }
+                    for span in reversed(spans)
+                ],
+                hide_index=True,
+            )
+        if not (stages or providers):
+            st.info("Nothing has been recorded yet.")
+
+        download_traces, download_metrics = st.columns(2)
+        download_traces.download_button(
+            "Download traces (JSON)", telemetry.traces_json(), file_name="stride_gpt_traces.json", mime="application/json",
+        )
+        download_metrics.download_button(
+            "Download metrics (Prometheus)", telemetry.prometheus_text(), file_name="stride_gpt_metrics.prom",
+            mime="text/plain",
+        )
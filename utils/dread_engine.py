@@ -0,0 +1,224 @@
+import csv
+import io
+import math
+
+import numpy as np
+
+DREAD_FACTORS = ("Damage Potential", "Reproducibility", "Exploitability", "Affected Users", "Discoverability")
+
+# A risk score below the first edge is Low, below the second Medium, else High
+BUCKET_EDGES = (4.0, 7.0)
+BUCKET_LABELS = ("Low", "Medium", "High")
+
+MARKDOWN_COLUMNS = ("Threat Type", "Scenario") + DREAD_FACTORS + ("Risk Score",)
+MARKDOWN_ROW = "| {} | {} | {:g} | {:g} | {:g} | {:g} | {:g} | {:.2f} |"
+CSV_COLUMNS = ("Repository", "Threat Type", "Scenario") + DREAD_FACTORS + ("Risk Score", "Risk Level", "Rank")
+
+
+def _score(value):
+    # Scores are meant to be integers, but models also send "7" or 7.5;
+    # anything that is not a number counts as 0, like a missing score.
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return score if math.isfinite(score) else 0.0
+
+
+def _format_score(score):
+    return f"{score:g}"
+
+
+def _cell(text):
+    # Keep model text from breaking out of its table cell
+    text = str(text)
+    if "|" in text or "\n" in text:
+        text = text.replace("|", "\\|").replace("\n", " ")
+    return text
+
+
+class DreadTable:
+    """DREAD assessments held column by column, so scores, rankings and
+    statistics are computed with NumPy over all threats at once.
+
+    Build one with `from_assessment` for a single threat model or
+    `from_assessments` for many repositories, e.g. the records written by
+    batch.py. `scores` has one row per threat and one column per factor of
+    DREAD_FACTORS.
+    """
+
+    def __init__(self, threat_types, scenarios, scores, repos=None):
+        self.threat_types = np.asarray(threat_types, dtype=object)
+        self.scenarios = np.asarray(scenarios, dtype=object)
+        self.scores = np.asarray(scores, dtype=float).reshape(-1, len(DREAD_FACTORS))
+        if repos is None:
+            repos = np.full(len(self.threat_types), None, dtype=object)
+        self.repos = np.asarray(repos, dtype=object)
+        self._risk = None
+
+    @classmethod
+    def from_assessment(cls, dread_assessment, repo=None):
+        """Load the "Risk Assessment" list of one DREAD assessment.
+
+        Raises TypeError if an entry of the list is not a dictionary.
+        """
+        threats = (dread_assessment or {}).get("Risk Assessment", [])
+        return cls.from_assessments([(repo, threats)])
+
+    @classmethod
+    def from_assessments(cls, assessments):
+        """Load many assessments into one table.
+
+        `assessments` is a dict mapping each repository to its DREAD
+        assessment, or an iterable of (repository, assessment) pairs, where an
+        assessment is either the whole JSON answer or its list of threats.
+        """
+        if isinstance(assessments, dict):
+            assessments = assessments.items()
+        threat_types = []
+        scenarios = []
+        scores = []
+        repos = []
+        for repo, threats in assessments:
+            if isinstance(threats, dict):
+                threats = threats.get("Risk Assessment", [])
+            for threat in threats or []:
+                if not isinstance(threat, dict):
+                    raise TypeError(f"Expected a dictionary, got {type(threat)}: {threat}")
+                threat_types.append(threat.get("Threat Type", "N/A"))
+                scenarios.append(threat.get("Scenario", "N/A"))
+                scores.append([_score(threat.get(factor, 0)) for factor in DREAD_FACTORS])
+                repos.append(repo)
+        return cls(threat_types, scenarios, scores, repos)
+
+    def __len__(self):
+        return len(self.threat_types)
+
+    @property
+    def risk(self):
+        """The risk score of each threat: the mean of its five factors."""
+        if self._risk is None:
+            self._risk = self.scores.mean(axis=1) if len(self) else np.zeros(0)
+        return self._risk
+
+    def buckets(self):
+        """The Low/Medium/High label of each threat's risk score."""
+        return np.asarray(BUCKET_LABELS, dtype=object)[np.digitize(self.risk, BUCKET_EDGES)]
+
+    def ranks(self):
+        """The rank of each threat by risk score, 1 being the highest; ties share the best rank."""
+        order = np.argsort(-self.risk, kind="stable")
+        ranked = self.risk[order]
+        # Start a new rank wherever the score changes, else reuse the previous one
+        starts = np.r_[True, ranked[1:] != ranked[:-1]] if len(self) else np.zeros(0, dtype=bool)
+        positions = np.arange(1, len(self) + 1)
+        ranks = np.empty(len(self), dtype=int)
+        ranks[order] = np.maximum.accumulate(np.where(starts, positions, 0))
+        return ranks
+
+    def take(self, indices):
+        """Return a new table with the threats at `indices`, in that order."""
+        return DreadTable(
+            self.threat_types[indices], self.scenarios[indices], self.scores[indices], self.repos[indices]
+        )
+
+    def sorted(self, descending=True):
+        """Return a copy ordered by risk score, highest first unless `descending` is False."""
+        order = np.argsort(-self.risk if descending else self.risk, kind="stable")
+        return self.take(order)
+
+    def top(self, count):
+        """Return the `count` threats with the highest risk scores, highest first."""
+        count = min(count, len(self))
+        if count <= 0:
+            return self.take(np.zeros(0, dtype=int))
+        candidates = np.argpartition(-self.risk, count - 1)[:count]
+        return self.take(candidates[np.argsort(-self.risk[candidates], kind="stable")])
+
+    def filter(self, repo=None, threat_type=None, bucket=None):
+        """Return the threats matching all of the given repository, threat type and bucket."""
+        mask = np.ones(len(self), dtype=bool)
+        if repo is not None:
+            mask &= self.repos == repo
+        if threat_type is not None:
+            mask &= self.threat_types == threat_type
+        if bucket is not None:
+            mask &= self.buckets() == bucket
+        return self.take(np.flatnonzero(mask))
+
+    def bucket_counts(self):
+        """Return how many threats fall in each bucket, as {label: count}."""
+        counts = np.bincount(np.digitize(self.risk, BUCKET_EDGES), minlength=len(BUCKET_LABELS))
+        return dict(zip(BUCKET_LABELS, counts.tolist()))
+
+    def group_stats(self, by="threat_type"):
+        """Return risk statistics per threat type (or per repository with by="repo").
+
+        Each group maps to its count, mean, min and max risk score, and the
+        number of threats in each bucket.
+        """
+        keys = self.repos if by == "repo" else self.threat_types
+        if not len(self):
+            return {}
+        labels, groups = np.unique(keys.astype(str), return_inverse=True)
+        risk = self.risk
+        counts = np.bincount(groups, minlength=len(labels))
+        totals = np.bincount(groups, weights=risk, minlength=len(labels))
+        minimums = np.full(len(labels), np.inf)
+        np.minimum.at(minimums, groups, risk)
+        maximums = np.full(len(labels), -np.inf)
+        np.maximum.at(maximums, groups, risk)
+        # One row per group, one column per bucket
+        bucket_counts = np.zeros((len(labels), len(BUCKET_LABELS)), dtype=int)
+        np.add.at(bucket_counts, (groups, np.digitize(risk, BUCKET_EDGES)), 1)
+        return {
+            label: {
+                "count": int(counts[index]),
+                "mean": float(totals[index] / counts[index]),
+                "min": float(minimums[index]),
+                "max": float(maximums[index]),
+                **dict(zip(BUCKET_LABELS, bucket_counts[index].tolist())),
+            }
+            for index, label in enumerate(labels.tolist())
+        }
+
+    def rows(self):
+        """Yield each threat as a dict of its fields, scores, risk score, bucket and rank."""
+        keys = CSV_COLUMNS
+        for values in zip(*self._columns()):
+            row = dict(zip(keys, values[:3]))
+            row.update(zip(DREAD_FACTORS, values[3]))
+            row.update(zip(keys[-3:], values[4:]))
+            yield row
+
+    def _columns(self):
+        # Plain Python lists; indexing NumPy object arrays one item at a time is slow
+        return (self.repos.tolist(), self.threat_types.tolist(), self.scenarios.tolist(), self.scores.tolist(),
+                self.risk.tolist(), self.buckets().tolist(), self.ranks().tolist())
+
+    def to_markdown(self):
+        """Render the threats as the Markdown table shown in the app."""
+        lines = [
+            "| " + " | ".join(MARKDOWN_COLUMNS) + " |",
+            "|-------------|----------|------------------|-----------------|----------------|----------------|-----------------|-------------|",
+        ]
+        # One format call per row; the list is joined once, in linear time
+        lines.extend(
+            MARKDOWN_ROW.format(_cell(threat_type), _cell(scenario), *scores, risk)
+            for threat_type, scenario, scores, risk in zip(
+                self.threat_types.tolist(), self.scenarios.tolist(), self.scores.tolist(), self.risk.tolist()
+            )
+        )
+        return "\n".join(lines) + "\n"
+
+    def to_csv(self, file=None):
+        """Write every threat as CSV to `file`, or return the CSV text if no file is given."""
+        out = file if file is not None else io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(
+            (repo, threat_type, scenario, *map(_format_score, scores), f"{risk:.2f}", bucket, rank)
+            for repo, threat_type, scenario, scores, risk, bucket, rank in zip(*self._columns())
+        )
+        if file is None:
+            return out.getvalue()
@@ -0,0 +1,81 @@
+import asyncio
+import queue
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """Return the process-wide event loop that runs on its own daemon thread.
+
+    Synchronous callers (Streamlit reruns, worker threads) hand their
+    coroutines to this loop, so the async clients created on it, and their
+    connection pools, are shared by every caller instead of being rebuilt
+    by a fresh asyncio.run() each time.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="stride-gpt-asyncio", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """Schedule `coro` on the background loop and return a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+
+
+def run_sync(coro, timeout=None):
+    """Run `coro` on the background loop and block until it returns."""
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the background loop; await the coroutine instead")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+
+def iter_sync(agen):
+    """Iterate the async generator `agen` from synchronous code, yielding each item as it is produced.
+
+    `agen` is read on the background loop and its items are handed over
+    through a queue, so a stream of many small chunks costs one thread
+    switch per chunk rather than a scheduled call. Stopping early (e.g. on
+    a Streamlit rerun) cancels the read and closes `agen`, and with it the
+    request it was reading.
+    """
+    items = queue.SimpleQueue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((True, item))
+        except Exception as error:
+            items.put((False, error))
+        else:
+            items.put((False, None))
+        finally:
+            await agen.aclose()
+
+    future = submit(pump())
+    try:
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        future.cancel()
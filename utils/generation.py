@@ -0,0 +1,175 @@
+import json
+
+from .context_packer import context_window, get_token_counter
+from .telemetry import traced
+
+# Output limits in tokens, matched by the longest model name prefix
+MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4-turbo": 4096,
+    "gpt-4": 4096,
+    "gpt-3.5-turbo": 4096,
+    "claude-3-5": 8192,
+    "claude-3-7": 64000,
+    "claude-3": 4096,
+    "claude-sonnet-4": 64000,
+    "claude-opus-4": 32000,
+    "gemini-1.5": 8192,
+    "gemini-2": 8192,
+    "mistral-large": 8192,
+    "llama3": 4096,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+
+# Never ask for less than this, even when the prompt nearly fills the window
+MIN_OUTPUT_TOKENS = 1024
+
+# More than this many tokens of output are never needed in one answer; a
+# larger request only holds back the tokens-per-minute budget.
+OUTPUT_TOKEN_CAP = 16384
+
+# Requests made to finish an answer that stopped at the output limit
+MAX_CONTINUATIONS = 3
+
+CONTINUE_PROMPT = (
+    "Your previous answer was cut off. Continue it exactly where it stopped, "
+    "without repeating anything and without any introduction."
+)
+
+
+def output_token_limit(model):
+    """Return how many tokens `model` can generate in one answer."""
+    model = (model or "").lower()
+    matches = [prefix for prefix in MAX_OUTPUT_TOKENS if model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_MAX_OUTPUT_TOKENS
+    return MAX_OUTPUT_TOKENS[max(matches, key=len)]
+
+
+def max_output_tokens(model, prompt=""):
+    """Size max_tokens for a request: the model's output limit, within the room the prompt leaves."""
+    room = context_window(model) - get_token_counter(model).count(prompt)
+    return max(MIN_OUTPUT_TOKENS, min(output_token_limit(model), OUTPUT_TOKEN_CAP, room))
+
+
+def continuation_messages(system, prompt, partial):
+    """Return the chat messages that ask a model to carry on from its cut-off answer `partial`."""
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    if partial:
+        messages.append({"role": "assistant", "content": partial})
+        messages.append({"role": "user", "content": CONTINUE_PROMPT})
+    return messages
+
+
+def _json_start(text):
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    return min(starts) if starts else -1
+
+
+def _closing(stack):
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def _closes_element(stack):
+    return any(outer == "[" and inner == "{" for outer, inner in zip(stack, stack[1:]))
+
+
+def _strip_trailing_commas(text):
+    # Drop commas directly before a closing bracket, outside strings
+    out = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            end = len(out)
+            while end and out[end - 1].isspace():
+                end -= 1
+            if end and out[end - 1] == ",":
+                del out[end - 1]
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json(text):
+    """Parse the JSON in a model answer that may be wrapped in prose or code fences, or cut off.
+
+    Trailing commas are dropped, and a cut-off answer is closed after its
+    last complete array element, so a half-written threat is dropped rather
+    than returned without its fields.
+    Raises json.JSONDecodeError if nothing usable can be recovered.
+    """
+    start = _json_start(text or "")
+    if start == -1:
+        raise json.JSONDecodeError("No JSON in response", text or "", 0)
+    text = text[start:]
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+    # Models often leave a comma after the last element
+    text = _strip_trailing_commas(text)
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+
+    # Walk the text once, remembering where it could be cut and closed:
+    # after each complete element, with the containers open at that point.
+    stack = []
+    cuts = []
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return json.loads(text[:index + 1])
+            cuts.append((index + 1, tuple(stack)))
+        elif char == "," and stack:
+            cuts.append((index, tuple(stack)))
+
+    # Prefer cuts that do not close an object inside an array early, i.e.
+    # that leave no array element with only some of its fields
+    clean = [cut for cut in cuts if not _closes_element(cut[1])]
+    partial = [cut for cut in cuts if _closes_element(cut[1])]
+    candidates = [text[:cut] + _closing(open_stack) for cut, open_stack in reversed(clean)]
+    candidates += [text[:cut] + _closing(open_stack) for cut, open_stack in reversed(partial)]
+    # Last resort: close whatever was open where the text stops
+    candidates.append(text.rstrip().rstrip(",:") + ('"' if in_string else "") + _closing(stack))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise json.JSONDecodeError("Could not repair JSON response", text, len(text))
+
+
+@traced("json_parse")
+def parse_json(text):
+    """json.loads, falling back to `repair_json` for answers that are not quite valid JSON."""
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return repair_json(text)
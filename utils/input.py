@@ -1,7 +1,7 @@
 import streamlit as st
-from .repo_analysis import analyze_github_repo
+from .repo_analysis import analyze_and_index_github_repo
 
-def get_input():
+def get_input(model=None):
     github_url = st.text_input(
         label="Enter GitHub repository URL (optional)",
         placeholder="https://github.com/owner/repo",
@@ -9,19 +9,33 @@ def get_input():
         help="Enter the URL of the GitHub repository you want to analyze.",
     )
 
-    if github_url and github_url != st.session_state.get('last_analyzed_url', ''):
+    if not github_url:
+        # Don't retrieve excerpts from a repository that is no longer selected
+        st.session_state.pop('repo_index', None)
+        st.session_state.pop('last_analyzed_url', None)
+        st.session_state.pop('github_commit', None)
+    elif github_url != st.session_state.get('last_analyzed_url', ''):
         if 'github_api_key' not in st.session_state or not st.session_state['github_api_key']:
             st.warning("Please enter a GitHub API key to analyze the repository.")
         else:
             with st.spinner('Analyzing GitHub repository...'):
-                system_description = analyze_github_repo(github_url)
+                # With an index the prompt pulls relevant excerpts per STRIDE
+                # category, so the up-front summary only needs to be an overview.
+                system_description, repo_index, commit_sha = analyze_and_index_github_repo(github_url, model=model)
+                st.session_state['repo_index'] = repo_index
                 st.session_state['github_analysis'] = system_description
+                # Stored threat models are keyed by the commit they describe
+                st.session_state['github_commit'] = commit_sha
                 st.session_state['last_analyzed_url'] = github_url
                 st.session_state['app_input'] = system_description + "\n\n" + st.session_state.get('app_input', '')
+                # The text area keeps its own state once created, so the
+                # analysis is put there rather than passed as its value
+                st.session_state['app_desc'] = st.session_state['app_input']
 
+    if 'app_desc' not in st.session_state:
+        st.session_state['app_desc'] = st.session_state.get('app_input', '')
     input_text = st.text_area(
         label="Describe the application to be modelled",
-        value=st.session_state.get('app_input', ''),
         placeholder="Enter your application details...",
         height=300,
         key="app_desc",
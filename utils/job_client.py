@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+from .clients import get_http_session, http_timeout
+from .job_queue import FINISHED_STATUSES
+
+
+class JobClient:
+    """Client of the job service in server.py."""
+
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def _request(self, method, path, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        response = get_http_session().request(
+            method, self.base_url + path, headers=headers, timeout=http_timeout(), **kwargs
+        )
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"Job service returned {response.status_code}: {message}")
+        return response
+
+    def submit(self, kind, params, credentials=None):
+        """Submit a job and return it; an identical job already known to the service is returned instead."""
+        body = {"kind": kind, "params": params}
+        if credentials:
+            body["credentials"] = list(credentials)
+        return self._request("POST", "/jobs", json=body).json()
+
+    def get(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}").json()
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}").json()["cancelled"]
+
+    def events(self, job_id):
+        """Yield the job each time its status changes, until it has finished."""
+        with self._request("GET", f"/jobs/{job_id}/events", stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    job = json.loads(line[len("data: "):])
+                    yield job
+                    if job["status"] in FINISHED_STATUSES:
+                        return
+
+    def wait(self, job_id, timeout=None, poll_interval=1.0):
+        """Poll until the job has finished and return it; raises TimeoutError after `timeout` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job["status"] in FINISHED_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} did not finish within {timeout} seconds")
+            time.sleep(poll_interval)
+
+
+def get_job_client():
+    """Return a JobClient for STRIDE_GPT_API_URL, or None when the app should generate in-process."""
+    base_url = os.getenv('STRIDE_GPT_API_URL')
+    if not base_url:
+        return None
+    return JobClient(base_url, os.getenv('STRIDE_GPT_API_TOKEN'))
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .repo_cache import DEFAULT_CACHE_DIR
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# A job that is resubmitted while an identical one is queued, running or
+# finished successfully within this many seconds gets the existing job back.
+DEFAULT_DEDUPE_SECONDS = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key);
+"""
+
+
+def job_key(kind, params, principal=None):
+    """Return the identity of a job: the same kind with the same parameters, for the same principal."""
+    return hashlib.sha256(json.dumps([kind, params, principal], sort_keys=True).encode()).hexdigest()
+
+
+def credentials_fingerprint(provider, credentials):
+    """Return a principal for jobs submitted with `credentials`, or None for the service's own.
+
+    Only this hash is stored, as part of the job key, so that a caller is
+    never handed a job run with somebody else's API key.
+    """
+    if not credentials:
+        return None
+    return hashlib.sha256(json.dumps([provider, list(credentials)]).encode()).hexdigest()
+
+
+class JobQueue:
+    """Persistent queue of generation jobs in SQLite.
+
+    Jobs survive restarts of the service and of the browser that submitted
+    them. Workers claim the oldest queued job inside a write transaction, so
+    several worker threads or processes can share one database. Parameters
+    are stored as given, so they must not contain credentials.
+    """
+
+    def __init__(self, path=None, dedupe_seconds=DEFAULT_DEDUPE_SECONDS):
+        if path is None:
+            cache_dir = os.getenv('STRIDE_GPT_CACHE_DIR') or DEFAULT_CACHE_DIR
+            path = os.getenv('STRIDE_GPT_JOB_DB') or os.path.join(cache_dir, "jobs.sqlite3")
+        self.path = os.path.expanduser(path)
+        self.dedupe_seconds = dedupe_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # Same per-thread, per-process connections as RepoCache
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def submit(self, kind, params, reuse_done=True, principal=None):
+        """Queue a job and return it, or return the identical job that already exists.
+
+        An identical queued or running job is always returned; one that has
+        finished successfully only when `reuse_done` is set. Jobs are only
+        identical for the same `principal` (see `credentials_fingerprint`).
+        """
+        key = job_key(kind, params, principal)
+        now = time.time()
+        done_since = now - self.dedupe_seconds if reuse_done else now
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE key = ? AND (status IN (?, ?) OR (status = ? AND finished > ?)) "
+                "ORDER BY created DESC LIMIT 1",
+                (key, JOB_QUEUED, JOB_RUNNING, JOB_DONE, done_since),
+            ).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, key, kind, params, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, kind, json.dumps(params), JOB_QUEUED, now, now),
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self._job(row)
+
+    def claim(self, worker):
+        """Mark the oldest queued job as running for `worker` and return it, or None."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started = ?, updated = ? WHERE id = ?",
+                (JOB_RUNNING, worker, now, now, row["id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self._job(job)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        # A job cancelled while it ran stays cancelled; its late result is dropped
+        return self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, updated = ? "
+            "WHERE id = ? AND status = ?",
+            (status, None if result is None else json.dumps(result), error, now, now, job_id, JOB_RUNNING),
+        ).rowcount == 1
+
+    def complete(self, job_id, result):
+        return self._finish(job_id, JOB_DONE, result=result)
+
+    def fail(self, job_id, error):
+        return self._finish(job_id, JOB_FAILED, error=error)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns False if it had already finished."""
+        now = time.time()
+        return self._connection().execute(
+            "UPDATE jobs SET status = ?, finished = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+            (JOB_CANCELLED, now, now, job_id, JOB_QUEUED, JOB_RUNNING),
+        ).rowcount == 1
+
+    def requeue_running(self, worker_prefix=None):
+        """Put jobs left running by a worker that died back in the queue; returns how many."""
+        now = time.time()
+        if worker_prefix is None:
+            query, args = "WHERE status = ?", (JOB_RUNNING,)
+        else:
+            query, args = "WHERE status = ? AND worker LIKE ?", (JOB_RUNNING, worker_prefix + "%")
+        return self._connection().execute(
+            f"UPDATE jobs SET status = ?, worker = NULL, started = NULL, updated = ? {query}",
+            (JOB_QUEUED, now, *args),
+        ).rowcount
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._job(row)
+
+    def status(self, job_id):
+        row = self._connection().execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else row["status"]
+
+    def counts(self):
+        """Return {status: number of jobs}."""
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = None if job["result"] is None else json.loads(job["result"])
+        return job
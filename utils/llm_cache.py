@@ -0,0 +1,170 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .job_queue import credentials_fingerprint
+from .repo_cache import RepoCache
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_MAX_MB = 64
+
+# Bump to invalidate every cached response, e.g. after a prompt format change
+CACHE_VERSION = 1
+
+
+def _cache_enabled():
+    return os.getenv('STRIDE_GPT_LLM_CACHE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+class LLMCache:
+    """Two-tier cache of LLM responses: an in-process LRU in front of SQLite.
+
+    The memory tier answers repeated clicks within one Streamlit server; the
+    SQLite tier (a RepoCache in its own file) is shared by every process
+    using the same cache directory and survives restarts. Entries older than
+    `ttl` seconds are treated as misses, and both tiers are size bounded.
+    """
+
+    def __init__(self, cache_dir=None, ttl=None, memory_entries=None, max_bytes=None):
+        if ttl is None:
+            ttl = float(os.getenv('STRIDE_GPT_LLM_CACHE_TTL', DEFAULT_TTL_SECONDS))
+        if memory_entries is None:
+            memory_entries = int(os.getenv('STRIDE_GPT_LLM_CACHE_ENTRIES', DEFAULT_MEMORY_ENTRIES))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('STRIDE_GPT_LLM_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk = RepoCache(cache_dir, max_bytes=max_bytes, filename="llm_cache.sqlite3")
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached response for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, data = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    # Hand out a fresh copy; callers keep results in session state and may mutate them
+                    return json.loads(data)
+                del self._memory[key]
+
+        entry = self.disk.get("response", key)
+        if entry is None:
+            return None
+        if now - entry["created"] > self.ttl:
+            self.disk.delete("response", key)
+            return None
+        self._remember(key, entry["created"], json.dumps(entry["response"]))
+        return entry["response"]
+
+    def put(self, key, response):
+        created = time.time()
+        self._remember(key, created, json.dumps(response))
+        self.disk.put("response", key, {"created": created, "response": response})
+
+    def _remember(self, key, created, data):
+        with self._lock:
+            self._memory[key] = (created, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self.disk.clear()
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide response cache, configured from the STRIDE_GPT_LLM_CACHE_* variables."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
+
+
+def _function_fingerprint(func):
+    # The request parameters (system prompt, max_tokens, response format...)
+    # are written into each provider function, so a change to its code must
+    # not return responses produced by the old version. Decorators such as
+    # the scheduler's are looked through to the provider function itself.
+    code = inspect.unwrap(func).__code__
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_consts).encode())
+    return f"{func.__module__}.{func.__qualname__}:{digest.hexdigest()[:16]}"
+
+
+def response_cache_key(provider, fingerprint, params, prompt, principal=None):
+    # `principal` fingerprints the credentials, so that an answer is only
+    # returned to callers holding the key it was generated with
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "provider": provider, "function": fingerprint,
+         "params": params, "prompt": hashlib.sha256(prompt.encode()).hexdigest(), "principal": principal},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _key_function(func, provider, key_args, prompt_arg):
+    signature = inspect.signature(func)
+    fingerprint = _function_fingerprint(func)
+
+    def make_key(args, kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = {name: bound.arguments[name] for name in key_args}
+        secrets = [value for name, value in bound.arguments.items() if name not in key_args and name != prompt_arg]
+        prompt = bound.arguments[prompt_arg]
+        if not isinstance(prompt, str):
+            prompt = json.dumps(prompt, sort_keys=True, default=str)
+        return response_cache_key(provider, fingerprint, params, prompt, credentials_fingerprint(provider, secrets))
+
+    return make_key
+
+
+def cached_response(provider, *key_args, prompt_arg="prompt"):
+    """Cache the responses of an LLM call keyed on (provider, model, parameters, prompt).
+
+    `key_args` names the arguments that select what answers (model,
+    deployment, endpoint...). The remaining arguments are credentials: only
+    a hash of them goes into the key, and a caller with a different key
+    never gets the answer. Empty responses are never stored. Pass
+    `use_cache=False` to the decorated function to skip the cache for one
+    call, or set STRIDE_GPT_LLM_CACHE=0 to turn it off altogether.
+    """
+    def decorator(func):
+        make_key = _key_function(func, provider, key_args, prompt_arg)
+
+        @functools.wraps(func)
+        def wrapper(*args, use_cache=True, **kwargs):
+            if not (use_cache and _cache_enabled()):
+                return func(*args, **kwargs)
+            key = make_key(args, kwargs)
+
+            cache = get_llm_cache()
+            response = cache.get(key)
+            if response is not None:
+                return response
+            response = func(*args, **kwargs)
+            if response:
+                cache.put(key, response)
+            return response
+
+        return wrapper
+
+    return decorator
+
@@ -1,5 +1,4 @@
 import os
-import streamlit as st
 from dotenv import load_dotenv
 
 def load_env():
@@ -9,6 +8,9 @@ def load_env():
 
 def load_env_variables():
     """Load environment variables into Streamlit session state"""
+    # Imported here so that load_env() stays usable without Streamlit
+    import streamlit as st
+
     load_env()
     
     github_api_key = os.getenv('GITHUB_API_KEY')
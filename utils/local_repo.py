@@ -0,0 +1,305 @@
+import os
+import re
+import subprocess
+from .context_packer import PACK_GREEDY
+from .notify import show_error
+from .repo_analysis import (
+    CHAR_LIMIT,
+    _description_cache_key,
+    _index_cache_key,
+    _limit_key,
+    _lookup_cached,
+    describe_files,
+    git_blob_sha,
+    is_analyzed_file,
+    rank_blobs,
+)
+from .repo_cache import get_repo_cache
+from .retrieval import RepoIndex
+from .telemetry import traced
+
+# Bytes inspected when deciding whether a file is binary, as git does
+BINARY_SNIFF_BYTES = 8000
+
+
+class GitIgnore:
+    """The rules of one .gitignore file, matched against paths relative to its directory."""
+
+    def __init__(self, lines):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # A slash anywhere but at the end anchors the pattern to this directory
+            anchored = "/" in line
+            regex = _translate(line.lstrip("/"))
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z"), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                return cls(f.readlines())
+        except OSError:
+            return None
+
+    def match(self, rel_path, is_dir):
+        """Return True/False if a rule decides `rel_path`, None if none applies."""
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+def _translate(pattern):
+    """Translate a gitignore glob into a regular expression, with '**' spanning directories."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            members = pattern[i + 1:end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            parts.append("[" + members.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+def _is_ignored(rel_path, is_dir, ignores):
+    ignored = False
+    for base, gitignore in ignores:
+        decision = gitignore.match(rel_path[len(base):], is_dir)
+        if decision is not None:
+            ignored = decision
+    return ignored
+
+
+def iter_local_paths(root):
+    """Yield the relative POSIX paths of the files under `root` that .gitignore does not exclude.
+
+    The tree is walked lazily, one directory at a time in sorted order, and
+    ignored directories are never entered.
+    """
+    ignores = []
+    exclude = GitIgnore.from_file(os.path.join(root, ".git", "info", "exclude"))
+    if exclude is not None:
+        ignores.append(("", exclude))
+    yield from _walk(root, "", ignores)
+
+
+def _walk(root, rel_dir, ignores):
+    directory = os.path.join(root, rel_dir)
+    gitignore = GitIgnore.from_file(os.path.join(directory, ".gitignore"))
+    if gitignore is not None:
+        ignores = ignores + [(rel_dir, gitignore)]
+
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.name == ".git":
+            continue
+        rel_path = rel_dir + entry.name
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if _is_ignored(rel_path, is_dir, ignores):
+            continue
+        if is_dir:
+            yield from _walk(root, rel_path + "/", ignores)
+        elif entry.is_file(follow_symlinks=False):
+            yield rel_path
+
+
+def _decode_text(data):
+    """Return `data` decoded as UTF-8, or None for binary content."""
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def iter_local_contents(root):
+    """Yield (path, blob_sha, content) for the analysed, non-binary files in a working tree."""
+    for path in iter_local_paths(root):
+        if not is_analyzed_file(path):
+            continue
+        with open(os.path.join(root, path), "rb") as f:
+            data = f.read()
+        content = _decode_text(data)
+        if content is not None:
+            yield path, git_blob_sha(data), content
+
+
+def is_bare_repo(path):
+    return (
+        os.path.isfile(os.path.join(path, "HEAD"))
+        and os.path.isdir(os.path.join(path, "objects"))
+        and os.path.isdir(os.path.join(path, "refs"))
+    )
+
+
+def _git(git_dir, *args):
+    return subprocess.run(
+        ["git", f"--git-dir={git_dir}", *args], capture_output=True, check=True
+    ).stdout
+
+
+def list_git_blobs(git_dir, ref="HEAD"):
+    """Return (path, blob_sha) for README.md and the source files at `ref`, in tree order."""
+    blobs = []
+    for record in _git(git_dir, "ls-tree", "-r", "-z", ref).split(b"\0"):
+        if not record:
+            continue
+        info, path = record.split(b"\t", 1)
+        _, object_type, blob_sha = info.split()
+        path = path.decode()
+        if object_type == b"blob" and is_analyzed_file(path):
+            blobs.append((path, blob_sha.decode()))
+    return blobs
+
+
+def iter_git_contents(git_dir, blobs, skip=frozenset()):
+    """Yield (path, blob_sha, content) for `blobs`, streamed through one `git cat-file --batch`.
+
+    Paths in `skip` are not read and come back with content None; binary
+    blobs are left out.
+    """
+    process = subprocess.Popen(
+        ["git", f"--git-dir={git_dir}", "cat-file", "--batch"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    try:
+        for path, blob_sha in blobs:
+            if path in skip:
+                yield path, blob_sha, None
+                continue
+            process.stdin.write(blob_sha.encode() + b"\n")
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                raise RuntimeError(f"git cat-file could not read {path} ({blob_sha})")
+            data = process.stdout.read(int(header[2]))
+            process.stdout.read(1)  # trailing newline
+            content = _decode_text(data)
+            if content is not None:
+                yield path, blob_sha, content
+    finally:
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+
+
+@traced("repo_analysis")
+def analyze_local_repo(path, processes=None, use_cache=True, char_limit=CHAR_LIMIT, token_budget=None,
+                       model=None, strategy=PACK_GREEDY):
+    """Build the same system description as analyze_github_repo from a local directory or bare git repository.
+
+    Working trees are walked on disk honouring .gitignore; bare repositories
+    are read at HEAD through git. No network access is needed. Files are
+    summarised across `processes` worker processes (all CPUs by default).
+    With a `token_budget` the description is packed for `model` as in
+    analyze_github_repo.
+    """
+    try:
+        path = os.path.abspath(path)
+        processes = processes or os.cpu_count() or 1
+        cache = get_repo_cache() if use_cache else None
+
+        if is_bare_repo(path):
+            commit_sha = _git(path, "rev-parse", "HEAD").decode().strip()
+            description_key = _description_cache_key(
+                path, commit_sha, _limit_key(char_limit, token_budget, model, strategy),
+            )
+            if cache is not None:
+                description = cache.get("description", description_key)
+                if description is not None:
+                    return description
+            blobs = list_git_blobs(path, commit_sha)
+            if token_budget is not None:
+                blobs = rank_blobs(blobs)
+            reusable = _lookup_cached(cache, blobs) if cache is not None else {}
+            files = iter_git_contents(path, blobs, skip=reusable.keys())
+            description, _ = describe_files(
+                path, files, cache=cache, reusable=reusable, processes=processes, char_limit=char_limit,
+                token_budget=token_budget, model=model, strategy=strategy,
+            )
+            if cache is not None:
+                cache.put("description", description_key, description)
+            return description
+
+        # A working tree may hold uncommitted changes, so only the per-file
+        # summaries, keyed by content, are cached.
+        files = iter_local_contents(path)
+        description, _ = describe_files(
+            path, files, cache=cache, check_cache=cache is not None, processes=processes, char_limit=char_limit,
+            token_budget=token_budget, model=model, strategy=strategy,
+        )
+        return description
+    except Exception as e:
+        show_error(f"Error analyzing local repository: {e}")
+        return ""
+
+
+@traced("repo_index")
+def index_local_repo(path, use_cache=True):
+    """Build a RepoIndex over every analysed file of a local directory or bare git repository."""
+    try:
+        path = os.path.abspath(path)
+        cache = get_repo_cache() if use_cache else None
+        if is_bare_repo(path):
+            commit_sha = _git(path, "rev-parse", "HEAD").decode().strip()
+            if cache is not None:
+                data = cache.get("index", _index_cache_key(path, commit_sha))
+                if data is not None:
+                    return RepoIndex.from_dict(data)
+            files = iter_git_contents(path, list_git_blobs(path, commit_sha))
+        else:
+            commit_sha = None
+            files = iter_local_contents(path)
+
+        index = RepoIndex()
+        for file_path, _, content in files:
+            index.add_file(file_path, content)
+        if cache is not None and commit_sha is not None:
+            cache.put("index", _index_cache_key(path, commit_sha), index.to_dict())
+        return index
+    except Exception as e:
+        show_error(f"Error indexing local repository: {e}")
+        return None
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .repo_cache import DEFAULT_CACHE_DIR
+
+# What is stored for a threat model: the model itself and each downstream analysis
+ARTIFACT_KINDS = ("threat_model", "mitigations", "attack_tree", "test_cases", "dread_assessment")
+
+DEFAULT_SEARCH_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    repo TEXT,
+    commit_sha TEXT,
+    params TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_repo ON models (repo, updated);
+CREATE INDEX IF NOT EXISTS models_updated ON models (updated);
+CREATE TABLE IF NOT EXISTS artifacts (
+    model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (model_id, kind)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    threat_type TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_model ON entries (model_id, kind);
+CREATE INDEX IF NOT EXISTS entries_threat_type ON entries (threat_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    threat_type, text, content='entries', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, threat_type, text) VALUES (NEW.id, NEW.threat_type, NEW.text);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, threat_type, text) VALUES ('delete', OLD.id, OLD.threat_type, OLD.text);
+END;
+"""
+
+
+def model_key(repo, commit, params):
+    """Return the identity of a stored threat model: the same repository commit generated with the same parameters."""
+    return hashlib.sha256(json.dumps([repo, commit, params], sort_keys=True).encode()).hexdigest()
+
+
+def fts_query(text):
+    """Turn what a user typed into an FTS5 query that matches rows containing every word.
+
+    Words are quoted, so FTS5 operators and punctuation in the input cannot
+    cause a syntax error; a trailing * keeps its meaning as a prefix search.
+    """
+    return " ".join(f'"{word.rstrip("*")}"' + ("*" if word.endswith("*") else "")
+                    for word in re.findall(r"\w+\*?", text))
+
+
+def search_entries(kind, content):
+    """Return (threat_type, text) rows to index for an artifact: one per threat, or the whole text."""
+    if kind == "threat_model":
+        threats = content.get("threat_model", []) if isinstance(content, dict) else []
+        return [
+            (str(threat.get("Threat Type", "")), f"{threat.get('Scenario', '')}\n{threat.get('Potential Impact', '')}")
+            for threat in threats if isinstance(threat, dict)
+        ]
+    if kind == "dread_assessment":
+        threats = content.get("Risk Assessment", []) if isinstance(content, dict) else []
+        return [
+            (str(threat.get("Threat Type", "")), str(threat.get("Scenario", "")))
+            for threat in threats if isinstance(threat, dict)
+        ]
+    return [("", content if isinstance(content, str) else json.dumps(content))]
+
+
+class ModelStore:
+    """Persistent store of threat models and their downstream analyses in SQLite.
+
+    A model is keyed by repository, commit and generation parameters (see
+    `model_key`), so generating the same thing again can be answered by
+    loading it. Every threat, and the text of every other analysis, is also
+    kept in an FTS5 index, which searches thousands of stored models at once.
+    The database is in WAL mode, so Streamlit workers and batch runs can share it.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            cache_dir = os.getenv('STRIDE_GPT_CACHE_DIR') or DEFAULT_CACHE_DIR
+            path = os.getenv('STRIDE_GPT_STORE_DB') or os.path.join(cache_dir, "models.sqlite3")
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # Same per-thread, per-process connections as RepoCache
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(self, key, kind, content, repo=None, commit=None, params=None):
+        """Store one artifact of the model `key`, replacing an earlier one of the same kind.
+
+        The model is created on its first artifact; `repo`, `commit` and
+        `params` describe it and are only needed then.
+        """
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind: {kind}")
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO models (key, repo, commit_sha, params, created, updated) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET updated = excluded.updated",
+                (key, repo, commit, json.dumps(params or {}, sort_keys=True), now, now),
+            )
+            (model_id,) = conn.execute("SELECT id FROM models WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (model_id, kind, content, updated) VALUES (?, ?, ?, ?)",
+                (model_id, kind, json.dumps(content), now),
+            )
+            conn.execute("DELETE FROM entries WHERE model_id = ? AND kind = ?", (model_id, kind))
+            conn.executemany(
+                "INSERT INTO entries (model_id, kind, position, threat_type, text) VALUES (?, ?, ?, ?, ?)",
+                [(model_id, kind, position, threat_type, text)
+                 for position, (threat_type, text) in enumerate(search_entries(kind, content))],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self, key):
+        """Return a stored model with {kind: content} of its artifacts under "artifacts", or None."""
+        conn = self._connection()
+        row = conn.execute("SELECT * FROM models WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        model = self._model(row)
+        model["artifacts"] = {
+            kind: json.loads(content)
+            for kind, content in conn.execute("SELECT kind, content FROM artifacts WHERE model_id = ?", (row["id"],))
+        }
+        return model
+
+    def search(self, query="", threat_type=None, kind=None, repo=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the stored threats and analyses matching every word of `query`, best match first.
+
+        `threat_type`, `kind` and `repo` narrow the results to one STRIDE
+        category, artifact kind or repository. Without a query the newest
+        matching entries are returned.
+        """
+        match = fts_query(query or "")
+        filters, args = [], []
+        for column, value in (("e.threat_type", threat_type), ("e.kind", kind), ("m.repo", repo)):
+            if value:
+                filters.append(f"{column} = ?")
+                args.append(value)
+        if match:
+            sql = (
+                "SELECT m.key, m.repo, m.commit_sha, m.params, m.updated, e.kind, e.position, e.threat_type, "
+                "snippet(entries_fts, 1, '[', ']', '…', 16) AS snippet, bm25(entries_fts) AS score "
+                "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid JOIN models m ON m.id = e.model_id "
+                f"WHERE entries_fts MATCH ? {''.join(' AND ' + f for f in filters)} ORDER BY score LIMIT ?"
+            )
+            args = [match, *args]
+        else:
+            sql = (
+                "SELECT m.key, m.repo, m.commit_sha, m.params, m.updated, e.kind, e.position, e.threat_type, "
+                "substr(e.text, 1, 200) AS snippet, 0 AS score "
+                "FROM entries e JOIN models m ON m.id = e.model_id "
+                f"{'WHERE ' + ' AND '.join(filters) if filters else ''} ORDER BY m.updated DESC, e.id LIMIT ?"
+            )
+        rows = self._connection().execute(sql, (*args, limit)).fetchall()
+        return [self._model(row) for row in rows]
+
+    def recent(self, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the most recently updated models, with the kinds of artifact stored for each."""
+        rows = self._connection().execute(
+            "SELECT m.*, group_concat(a.kind) AS kinds FROM models m LEFT JOIN artifacts a ON a.model_id = m.id "
+            "GROUP BY m.id ORDER BY m.updated DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        models = []
+        for row in rows:
+            model = self._model(row)
+            model["kinds"] = model["kinds"].split(",") if model["kinds"] else []
+            models.append(model)
+        return models
+
+    def delete(self, key):
+        return self._connection().execute("DELETE FROM models WHERE key = ?", (key,)).rowcount == 1
+
+    def count(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM models").fetchone()
+        return count
+
+    @staticmethod
+    def _model(row):
+        model = dict(row)
+        model.pop("id", None)
+        model["params"] = json.loads(model["params"])
+        return model
+
+
+_model_store = None
+_model_store_lock = threading.Lock()
+
+
+def get_model_store():
+    """Return the process-wide store, kept in STRIDE_GPT_STORE_DB (by default models.sqlite3 in the cache directory)."""
+    global _model_store
+    with _model_store_lock:
+        if _model_store is None:
+            _model_store = ModelStore()
+        return _model_store
@@ -0,0 +1,43 @@
+import sys
+
+
+def _streamlit():
+    """Return the streamlit module when running inside the app, else None.
+
+    Modules shared with the command line tools must not import Streamlit
+    themselves; they report errors and read session settings through here,
+    which only uses Streamlit if the app has already loaded it.
+    """
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        if not st.runtime.exists():
+            return None
+    except AttributeError:
+        return None
+    return st
+
+
+def show_error(message):
+    st = _streamlit()
+    if st is None:
+        print(message, file=sys.stderr)
+    else:
+        st.error(message)
+
+
+def show_message(message):
+    st = _streamlit()
+    if st is None:
+        print(message, file=sys.stderr)
+    else:
+        st.write(message)
+
+
+def session_value(key, default=None):
+    """Return `key` from the Streamlit session state, or `default` outside the app."""
+    st = _streamlit()
+    if st is None:
+        return default
+    return st.session_state.get(key, default)
@@ -0,0 +1,398 @@
+import json
+from contextlib import aclosing
+
+from .clients import (
+    get_async_anthropic_client,
+    get_async_azure_openai_client,
+    get_async_http_client,
+    get_async_mistral_client,
+    get_async_openai_client,
+    ollama_url,
+)
+from .event_loop import iter_sync, run_sync
+from .generation import CONTINUE_PROMPT, MAX_CONTINUATIONS, continuation_messages, max_output_tokens
+from .job_queue import credentials_fingerprint
+from .llm_cache import _cache_enabled, _function_fingerprint, get_llm_cache, response_cache_key
+from .scheduler import estimate_tokens, get_scheduler
+from .sdk import lazy_import
+from .telemetry import provider_call
+
+genai = lazy_import("google.generativeai")
+
+# Allow the generation of threat models
+GOOGLE_SAFETY_SETTINGS = {'DANGEROUS': 'block_only_high'}
+
+PROVIDERS = ("OpenAI", "Azure OpenAI", "Google", "Anthropic", "Mistral", "Ollama")
+
+# Credentials are a tuple in the order each provider's generator functions
+# take them, e.g. (api_key, model_name) for OpenAI. These are the positions
+# that select the model; the others are secrets and only enter cache keys hashed.
+MODEL_ARGS = {
+    "OpenAI": (1,),
+    "Azure OpenAI": (0, 2, 3),
+    "Google": (1,),
+    "Anthropic": (1,),
+    "Mistral": (1,),
+    "Ollama": (0,),
+}
+
+# Yielded last by the stream functions below when the answer stopped at max_tokens
+_TRUNCATED = object()
+
+
+def _openai_kwargs(json_mode, partial):
+    # JSON mode would make the continuation a new object of its own
+    return {"response_format": {"type": "json_object"}} if json_mode and not partial else {}
+
+
+async def _openai_chat(client, model, system, prompt, json_mode, max_tokens, partial):
+    response = await client.chat.completions.create(
+        model=model, messages=continuation_messages(system, prompt, partial), max_tokens=max_tokens,
+        **_openai_kwargs(json_mode, partial)
+    )
+    choice = response.choices[0]
+    return choice.message.content or "", choice.finish_reason == "length"
+
+
+async def _openai_stream(client, model, system, prompt, json_mode, max_tokens, partial):
+    stream = await client.chat.completions.create(
+        model=model, messages=continuation_messages(system, prompt, partial), max_tokens=max_tokens, stream=True,
+        **_openai_kwargs(json_mode, partial)
+    )
+    finish_reason = None
+    async with stream:
+        async for chunk in stream:
+            if not chunk.choices:
+                # Azure sends events without choices
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                yield choice.delta.content
+            finish_reason = choice.finish_reason or finish_reason
+    if finish_reason == "length":
+        yield _TRUNCATED
+
+
+def _anthropic_kwargs(model, system, prompt, max_tokens, partial):
+    messages = [{"role": "user", "content": prompt}]
+    if partial:
+        # Claude continues its own unfinished turn
+        messages.append({"role": "assistant", "content": partial})
+    kwargs = {"system": system} if system else {}
+    return {"model": model, "max_tokens": max_tokens, "messages": messages, **kwargs}
+
+
+async def _anthropic_chat(client, model, system, prompt, json_mode, max_tokens, partial):
+    response = await client.messages.create(**_anthropic_kwargs(model, system, prompt, max_tokens, partial))
+    # Combine all text blocks into a single string
+    text = ''.join(block.text for block in response.content if block.type == "text")
+    return text, response.stop_reason == "max_tokens"
+
+
+async def _anthropic_stream(client, model, system, prompt, json_mode, max_tokens, partial):
+    async with client.messages.stream(**_anthropic_kwargs(model, system, prompt, max_tokens, partial)) as stream:
+        async for text in stream.text_stream:
+            yield text
+        message = await stream.get_final_message()
+    if message.stop_reason == "max_tokens":
+        yield _TRUNCATED
+
+
+async def _mistral_chat(client, model, system, prompt, json_mode, max_tokens, partial):
+    response = await client.chat.complete_async(
+        model=model, messages=continuation_messages(system, prompt, partial), max_tokens=max_tokens,
+        **_openai_kwargs(json_mode, partial)
+    )
+    choice = response.choices[0]
+    return choice.message.content or "", choice.finish_reason == "length"
+
+
+async def _mistral_stream(client, model, system, prompt, json_mode, max_tokens, partial):
+    stream = await client.chat.stream_async(
+        model=model, messages=continuation_messages(system, prompt, partial), max_tokens=max_tokens,
+        **_openai_kwargs(json_mode, partial)
+    )
+    finish_reason = None
+    async with stream:
+        async for event in stream:
+            choices = event.data.choices
+            if not choices:
+                continue
+            if isinstance(choices[0].delta.content, str) and choices[0].delta.content:
+                yield choices[0].delta.content
+            finish_reason = choices[0].finish_reason or finish_reason
+    if finish_reason == "length":
+        yield _TRUNCATED
+
+
+def _google_request(api_key, model, system, prompt, json_mode, max_tokens, partial):
+    # Return the model to ask and what to send it
+    genai.configure(api_key=api_key)
+    generation_config = {"max_output_tokens": max_tokens}
+    if json_mode and not partial:
+        generation_config["response_mime_type"] = "application/json"
+    generative_model = genai.GenerativeModel(model, system_instruction=system or None,
+                                             generation_config=generation_config)
+    contents = prompt
+    if partial:
+        contents = [
+            {"role": "user", "parts": [prompt]},
+            {"role": "model", "parts": [partial]},
+            {"role": "user", "parts": [CONTINUE_PROMPT]},
+        ]
+    return generative_model, contents
+
+
+def _google_truncated(response):
+    return bool(response.candidates) and response.candidates[0].finish_reason.name == "MAX_TOKENS"
+
+
+async def _google_chat(api_key, model, system, prompt, json_mode, max_tokens, partial):
+    generative_model, contents = _google_request(api_key, model, system, prompt, json_mode, max_tokens, partial)
+    response = await generative_model.generate_content_async(contents, safety_settings=GOOGLE_SAFETY_SETTINGS)
+    return response.text, _google_truncated(response)
+
+
+async def _google_stream(api_key, model, system, prompt, json_mode, max_tokens, partial):
+    generative_model, contents = _google_request(api_key, model, system, prompt, json_mode, max_tokens, partial)
+    response = await generative_model.generate_content_async(
+        contents, safety_settings=GOOGLE_SAFETY_SETTINGS, stream=True
+    )
+    truncated = False
+    async for chunk in response:
+        truncated = _google_truncated(chunk)
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. the final safety ratings) raise
+            continue
+        if text:
+            yield text
+    if truncated:
+        yield _TRUNCATED
+
+
+def _ollama_request(model, system, prompt, json_mode, max_tokens, partial, stream):
+    data = {
+        "model": model,
+        "stream": stream,
+        "messages": continuation_messages(system, prompt, partial),
+        "options": {"num_predict": max_tokens},
+    }
+    if json_mode and not partial:
+        data["format"] = "json"
+    return data
+
+
+async def _ollama_chat(client, model, system, prompt, json_mode, max_tokens, partial):
+    data = _ollama_request(model, system, prompt, json_mode, max_tokens, partial, stream=False)
+    response = await client.post(ollama_url("/api/chat"), json=data)
+    response.raise_for_status()
+    body = response.json()
+    return body["message"]["content"], body.get("done_reason") == "length"
+
+
+async def _ollama_stream(client, model, system, prompt, json_mode, max_tokens, partial):
+    # Ollama sends one JSON object per line until an object with "done" set
+    data = _ollama_request(model, system, prompt, json_mode, max_tokens, partial, stream=True)
+    async with client.stream("POST", ollama_url("/api/chat"), json=data) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            body = json.loads(line)
+            if "error" in body:
+                raise RuntimeError(f"Ollama error: {body['error']}")
+            text = body.get("message", {}).get("content", "")
+            if text:
+                yield text
+            if body.get("done"):
+                if body.get("done_reason") == "length":
+                    yield _TRUNCATED
+                break
+
+
+# The request and stream function of each provider
+IMPLEMENTATIONS = {
+    "OpenAI": (_openai_chat, _openai_stream),
+    "Azure OpenAI": (_openai_chat, _openai_stream),
+    "Google": (_google_chat, _google_stream),
+    "Anthropic": (_anthropic_chat, _anthropic_stream),
+    "Mistral": (_mistral_chat, _mistral_stream),
+    "Ollama": (_ollama_chat, _ollama_stream),
+}
+
+
+def _target(provider, credentials):
+    """Return the client (the API key for Google) and the model that a request to `provider` goes to."""
+    if provider == "OpenAI":
+        api_key, model_name = credentials
+        return get_async_openai_client(api_key), model_name
+    if provider == "Azure OpenAI":
+        endpoint, api_key, api_version, deployment_name = credentials
+        return get_async_azure_openai_client(endpoint, api_key, api_version), deployment_name
+    if provider == "Google":
+        api_key, model_name = credentials
+        return api_key, model_name
+    if provider == "Anthropic":
+        api_key, model_name = credentials
+        return get_async_anthropic_client(api_key), model_name
+    if provider == "Mistral":
+        api_key, model_name = credentials
+        return get_async_mistral_client(api_key), model_name
+    if provider == "Ollama":
+        (model_name,) = credentials
+        return get_async_http_client(), model_name
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+async def _dispatch(provider, credentials, prompt, system, json_mode, max_tokens, partial=""):
+    """Send one request and return (text, whether it stopped at max_tokens)."""
+    client, model = _target(provider, credentials)
+    chat, _ = IMPLEMENTATIONS[provider]
+    return await chat(client, model, system, prompt, json_mode, max_tokens, partial)
+
+
+def _dispatch_stream(provider, credentials, prompt, system, json_mode, max_tokens, partial=""):
+    """Stream one request: its text chunks, then _TRUNCATED if it stopped at max_tokens."""
+    client, model = _target(provider, credentials)
+    _, stream = IMPLEMENTATIONS[provider]
+    return stream(client, model, system, prompt, json_mode, max_tokens, partial)
+
+
+def _request_size(provider, credentials, prompt, system, max_tokens):
+    # Return the model, max_tokens and the tokens to reserve for a request
+    model = credentials[MODEL_ARGS[provider][-1]]
+    max_tokens = max_tokens or max_output_tokens(model, (system or "") + prompt)
+    return model, max_tokens, estimate_tokens((system or "") + prompt, max_tokens)
+
+
+async def _complete(provider, credentials, prompt, system, json_mode, max_tokens):
+    """Return the whole answer, asking for continuations while it stops at the output limit.
+
+    Each request goes through the scheduler of utils/scheduler.py (rate
+    limits, retries and the circuit breaker), so a failed continuation is
+    retried on its own instead of regenerating the whole answer.
+    """
+    model, max_tokens, tokens = _request_size(provider, credentials, prompt, system, max_tokens)
+    scheduler = get_scheduler(provider)
+    text = ""
+    with provider_call(scheduler.key, model, (system or "") + prompt) as call:
+        for requests in range(1, MAX_CONTINUATIONS + 2):
+            if text and provider == "Anthropic":
+                # The API rejects an assistant turn that ends in whitespace
+                text = text.rstrip()
+            chunk, truncated = await scheduler.acall(
+                _dispatch, provider, credentials, prompt, system, json_mode, max_tokens, text, tokens=tokens
+            )
+            text += chunk
+            if not truncated:
+                break
+        call.span.set(requests=requests)
+        call.complete(text)
+    return text
+
+
+async def _stream(provider, credentials, prompt, system, json_mode, max_tokens, stage=None):
+    """Yield the answer of `_complete` in chunks as they are generated.
+
+    A stream is only retried by the scheduler before its first chunk; the
+    continuations are requested like those of `_complete`.
+    """
+    model, max_tokens, tokens = _request_size(provider, credentials, prompt, system, max_tokens)
+    scheduler = get_scheduler(provider)
+    text = ""
+    with provider_call(scheduler.key, model, (system or "") + prompt, stage) as call:
+        for requests in range(1, MAX_CONTINUATIONS + 2):
+            if text and provider == "Anthropic":
+                # The API rejects an assistant turn that ends in whitespace
+                text = text.rstrip()
+            truncated = False
+            chunks = scheduler.astream(
+                _dispatch_stream, provider, credentials, prompt, system, json_mode, max_tokens, text, tokens=tokens
+            )
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk is _TRUNCATED:
+                        truncated = True
+                        continue
+                    text += chunk
+                    call.chunk(chunk)
+                    yield chunk
+            if not truncated:
+                break
+        call.span.set(requests=requests)
+
+
+def _cache_key(provider, credentials, prompt, system, json_mode, max_tokens):
+    params = {
+        "model": [credentials[index] for index in MODEL_ARGS[provider]],
+        "system": system,
+        "json_mode": json_mode,
+        "max_tokens": max_tokens,
+    }
+    return response_cache_key(
+        provider, _function_fingerprint(_complete), params, prompt, credentials_fingerprint(provider, credentials)
+    )
+
+
+async def achat(provider, credentials, prompt, system=None, json_mode=False, max_tokens=None, use_cache=True):
+    """Send one chat request to `provider` and return the text of its answer.
+
+    Every provider goes through its SDK's async client (plain httpx for
+    Ollama), so any number of requests can be awaited concurrently from one
+    thread. `max_tokens` defaults to what the model can generate, and an
+    answer cut off at that limit is continued. Answers are cached for
+    callers with the same credentials only; pass `use_cache=False` to
+    always query the model.
+    """
+    if not (use_cache and _cache_enabled()):
+        return await _complete(provider, credentials, prompt, system, json_mode, max_tokens)
+
+    key = _cache_key(provider, credentials, prompt, system, json_mode, max_tokens)
+    cache = get_llm_cache()
+    text = cache.get(key)
+    if text is not None:
+        return text
+    text = await _complete(provider, credentials, prompt, system, json_mode, max_tokens)
+    if text:
+        cache.put(key, text)
+    return text
+
+
+async def astream_chat(provider, credentials, prompt, system=None, json_mode=False, max_tokens=None,
+                       use_cache=True, stage=None):
+    """Like `achat`, but yield the answer in chunks as the model writes it.
+
+    Streams share the response cache with `achat`: a cached answer is
+    yielded as a single chunk, and a stream is only stored once it has been
+    read to the end. A stream is read outside the span of its caller, so
+    `stage` names the stage its provider span is recorded under.
+    """
+    key = None
+    if use_cache and _cache_enabled():
+        key = _cache_key(provider, credentials, prompt, system, json_mode, max_tokens)
+        text = get_llm_cache().get(key)
+        if text is not None:
+            yield text
+            return
+    chunks = []
+    stream = _stream(provider, credentials, prompt, system, json_mode, max_tokens, stage)
+    async with aclosing(stream):
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+    text = "".join(chunks)
+    if key is not None and text:
+        get_llm_cache().put(key, text)
+
+
+def chat(provider, credentials, prompt, system=None, json_mode=False, max_tokens=None, use_cache=True):
+    """Blocking wrapper of `achat` for synchronous callers."""
+    return run_sync(achat(provider, credentials, prompt, system, json_mode, max_tokens, use_cache))
+
+
+def stream_chat(provider, credentials, prompt, system=None, json_mode=False, max_tokens=None,
+                use_cache=True, stage=None):
+    """Blocking iterator over the chunks of `astream_chat` for synchronous callers."""
+    return iter_sync(astream_chat(provider, credentials, prompt, system, json_mode, max_tokens, use_cache, stage))
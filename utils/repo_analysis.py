@@ -1,68 +1,665 @@
+import asyncio
 import base64
-import re
-from collections import defaultdict
-from github import Github
-import streamlit as st
+import functools
+import hashlib
+import os
+import random
+import tarfile
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
+from urllib.parse import quote
+import requests
+from github import Github, GithubException
+from .clients import get_async_http_client
+from .event_loop import submit
+from .notify import session_value, show_error
+from .repo_cache import get_repo_cache
+from .retrieval import INDEX_VERSION, RepoIndex
+from .context_packer import (
+    CANDIDATE_FACTOR,
+    DESCRIPTION_SHARE,
+    OVERVIEW_SHARE,
+    PACK_GREEDY,
+    PackItem,
+    get_token_counter,
+    description_budget,
+    pack,
+    security_score,
+)
+from .summarizer import summarize_content, summarize_file  # noqa: F401
+from .telemetry import span, traced
 
-def analyze_github_repo(repo_url):
+SOURCE_EXTENSIONS = ('.py', '.js', '.ts', '.html', '.css', '.java', '.go', '.rb')
+CHAR_LIMIT = 100000
+README_LIMIT = 5000
+
+# Bump whenever summarize_content changes, so cached summaries are not reused
+SUMMARY_VERSION = 2
+
+# Fetch modes understood by analyze_github_repo
+FETCH_SERIAL = "serial"
+FETCH_CONCURRENT = "concurrent"
+FETCH_ARCHIVE = "archive"
+# Like FETCH_CONCURRENT, but the blobs are requested with an async HTTP
+# client on the shared event loop instead of one thread per request
+FETCH_ASYNC = "async"
+
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+
+DEFAULT_MAX_WORKERS = 8
+MAX_FETCH_ATTEMPTS = 4
+
+# Requests kept in flight ahead of the consumer, as a multiple of the worker
+# count. Bounding this lets the character budget stop the walk early without
+# having downloaded the rest of the tree.
+FETCH_WINDOW_FACTOR = 4
+
+# In archive mode, a repository analysed before is brought up to date by
+# fetching the changed blobs one by one when there are at most this many.
+INCREMENTAL_FETCH_LIMIT = 100
+
+# Files summarised per batch and per summarizer process. Batches are consumed
+# in order, so at most one batch is summarised past the character budget.
+SUMMARY_BATCH_SIZE = 32
+
+# Seconds to wait for the archive download to connect or send its next chunk
+ARCHIVE_TIMEOUT = 60
+
+
+class RateLimitGate:
+    """Holds back every fetch worker while GitHub has asked us to slow down."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def remaining(self):
+        """Return how many seconds are left before requests may resume."""
+        with self._lock:
+            return self._resume_at - time.monotonic()
+
+    def wait(self):
+        while True:
+            delay = self.remaining()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def back_off(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+def _rate_limit_delay(error, attempt):
+    """Return how long to back off for a rate-limited response, or None if `error` is not one."""
+    return _response_rate_limit_delay(error.status, error.headers, error.data or error.message, attempt)
+
+
+def _response_rate_limit_delay(status, headers, message, attempt):
+    if status not in (403, 429):
+        return None
+
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    if 'retry-after' in headers:
+        return float(headers['retry-after'])
+    if headers.get('x-ratelimit-remaining') == '0' and 'x-ratelimit-reset' in headers:
+        return max(float(headers['x-ratelimit-reset']) - time.time(), 1.0)
+
+    message = str(message or '').lower()
+    if status == 429 or 'secondary rate limit' in message:
+        # GitHub asks clients to wait at least a minute when it sends no header
+        return 60 * 2 ** attempt + random.uniform(0, 5)
+    return None
+
+
+def _fetch_file(repo, path, ref, gate):
+    for attempt in range(MAX_FETCH_ATTEMPTS):
+        gate.wait()
+        try:
+            content = repo.get_contents(path, ref=ref)
+            return base64.b64decode(content.content).decode()
+        except GithubException as e:
+            delay = _rate_limit_delay(e, attempt)
+            if delay is None or attempt == MAX_FETCH_ATTEMPTS - 1:
+                raise
+            gate.back_off(delay)
+
+
+def iter_file_contents(repo, paths, ref, max_workers=1):
+    """Yield (path, content) pairs in the order of `paths`.
+
+    With more than one worker the blobs are downloaded by a bounded thread
+    pool that keeps a sliding window of requests in flight, so results still
+    come back in tree order and abandoning the generator stops the walk.
+    """
+    gate = RateLimitGate()
+    if max_workers <= 1:
+        for path in paths:
+            yield path, _fetch_file(repo, path, ref, gate)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="github-fetch")
+    pending = deque()
+    remaining = iter(paths)
     try:
-        parts = repo_url.split('/')
-        owner = parts[-2]
-        repo_name = parts[-1]
-
-        g = Github(st.session_state.get('github_api_key', ''))
-        repo = g.get_repo(f"{owner}/{repo_name}")
-        default_branch = repo.default_branch
-        tree = repo.get_git_tree(default_branch, recursive=True)
-
-        file_summaries = defaultdict(list)
-        total_chars = 0
-        char_limit = 100000
-        readme_content = ""
-
-        for file in tree.tree:
-            if file.path.lower() == 'readme.md':
-                content = repo.get_contents(file.path, ref=default_branch)
-                readme_content = base64.b64decode(content.content).decode()
-            elif file.type == "blob" and file.path.endswith(('.py', '.js', '.ts', '.html', '.css', '.java', '.go', '.rb')):
-                content = repo.get_contents(file.path, ref=default_branch)
-                decoded_content = base64.b64decode(content.content).decode()
-                summary = summarize_file(file.path, decoded_content)
-                file_summaries[file.path.split('.')[-1]].append(summary)
-                total_chars += len(summary)
-                if total_chars > char_limit:
-                    break
+        for path in remaining:
+            pending.append((path, pool.submit(_fetch_file, repo, path, ref, gate)))
+            if len(pending) >= max_workers * FETCH_WINDOW_FACTOR:
+                break
+        while pending:
+            path, future = pending.popleft()
+            content = future.result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(_fetch_file, repo, next_path, ref, gate)))
+            yield path, content
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def _afetch_file(api_url, path, ref, headers, gate):
+    client = get_async_http_client()
+    url = f"{api_url}/contents/{quote(path)}"
+    for attempt in range(MAX_FETCH_ATTEMPTS):
+        delay = gate.remaining()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = gate.remaining()
+        response = await client.get(url, params={"ref": ref}, headers=headers)
+        if response.status_code == 200:
+            return response.content.decode()
+        delay = _response_rate_limit_delay(response.status_code, response.headers, response.text, attempt)
+        if delay is None or attempt == MAX_FETCH_ATTEMPTS - 1:
+            response.raise_for_status()
+        gate.back_off(delay)
 
-        system_description = f"Repository: {repo_url}\n\n"
-        if readme_content:
-            system_description += "README.md Content:\n"
-            if len(readme_content) > 5000:
-                system_description += readme_content[:5000] + "...\n(README truncated due to length)\n\n"
+
+def iter_file_contents_async(api_url, paths, ref, github_api_key="", max_in_flight=DEFAULT_MAX_WORKERS * FETCH_WINDOW_FACTOR):
+    """Yield (path, content) pairs in the order of `paths`, fetched through the async HTTP client.
+
+    Same contract as iter_file_contents, but the sliding window of requests
+    is a set of tasks on the shared event loop rather than a thread pool, so
+    the window can be much larger without a thread per request. `api_url` is
+    the repository's REST URL, e.g. https://api.github.com/repos/owner/repo.
+    """
+    gate = RateLimitGate()
+    headers = {"Accept": "application/vnd.github.raw"}
+    if github_api_key:
+        headers["Authorization"] = f"Bearer {github_api_key}"
+
+    pending = deque()
+    remaining = iter(paths)
+    try:
+        for path in islice(remaining, max(1, max_in_flight)):
+            pending.append((path, submit(_afetch_file(api_url, path, ref, headers, gate))))
+        while pending:
+            path, future = pending.popleft()
+            content = future.result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, submit(_afetch_file(api_url, next_path, ref, headers, gate))))
+            yield path, content
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def is_analyzed_file(path):
+    return path.lower() == 'readme.md' or path.endswith(SOURCE_EXTENSIONS)
+
+
+def git_blob_sha(data):
+    """Return the SHA git assigns to a blob with this content."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def iter_archive_contents(repo, ref):
+    """Yield (path, blob_sha, content) for the analysed files of a single tarball download.
+
+    The archive is streamed straight from the HTTP response and read member by
+    member, so nothing is written to disk and only the wanted files are
+    decoded. Members come back in the order git wrote them, which is tree order.
+    """
+    # The link points at codeload.github.com and already carries a short-lived
+    # token for private repositories, so no credentials are sent along.
+    archive_url = repo.get_archive_link("tarball", ref=ref)
+    with requests.get(archive_url, stream=True, timeout=ARCHIVE_TIMEOUT) as response:
+        response.raise_for_status()
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                # Strip the "<owner>-<repo>-<sha>/" directory every member lives under
+                path = member.name.split('/', 1)[-1]
+                if is_analyzed_file(path):
+                    data = archive.extractfile(member).read()
+                    yield path, git_blob_sha(data), data.decode()
+
+
+def iter_tree_contents(repo, blobs, ref, max_workers=1, skip=frozenset(), fetch=None):
+    """Yield (path, blob_sha, content) for `blobs`, a list of (path, blob_sha) pairs.
+
+    Paths in `skip` are not downloaded and come back with content None.
+    `fetch(paths)` replaces iter_file_contents for the downloads when given.
+    """
+    paths = [path for path, _ in blobs if path not in skip]
+    if fetch is None:
+        fetched = iter_file_contents(repo, paths, ref, max_workers)
+    else:
+        fetched = fetch(paths)
+    with closing(fetched):
+        for path, blob_sha in blobs:
+            if path in skip:
+                yield path, blob_sha, None
             else:
-                system_description += readme_content + "\n\n"
+                _, content = next(fetched)
+                yield path, blob_sha, content
+
+
+def _summary_cache_key(path, blob_sha):
+    # Summaries depend on the extension and the summarizer, not on the path
+    return f"{SUMMARY_VERSION}:{path.rsplit('.', 1)[-1]}:{blob_sha}"
+
+
+def _cache_entry(path, blob_sha):
+    if path.lower() == 'readme.md':
+        return "readme", blob_sha
+    return "summary", _summary_cache_key(path, blob_sha)
+
+
+def _lookup_cached(cache, blobs):
+    """Return {path: cached README content or summary body} for `blobs`."""
+    keys = {"readme": {}, "summary": {}}
+    for path, blob_sha in blobs:
+        kind, key = _cache_entry(path, blob_sha)
+        keys[kind][path] = key
+
+    found = {}
+    for kind, paths in keys.items():
+        values = cache.get_many(kind, paths.values())
+        found.update((path, values[key]) for path, key in paths.items() if key in values)
+    return found
+
+
+def parse_repo_url(repo_url):
+    parts = repo_url.rstrip('/').split('/')
+    owner = parts[-2]
+    repo_name = parts[-1]
+    if repo_name.endswith('.git'):
+        repo_name = repo_name[:-4]
+    return owner, repo_name
+
+
+def build_system_description(repo_url, readme_content, file_summaries):
+    sections = [f"Repository: {repo_url}\n\n"]
+    if readme_content:
+        sections.append("README.md Content:\n")
+        if len(readme_content) > README_LIMIT:
+            sections.append(readme_content[:README_LIMIT] + "...\n(README truncated due to length)\n\n")
+        else:
+            sections.append(readme_content + "\n\n")
+
+    for file_type, summaries in file_summaries.items():
+        sections.append(f"{file_type.upper()} Files:\n")
+        for summary in summaries:
+            sections.append(summary + "\n")
+        sections.append("\n")
+
+    return "".join(sections)
+
+
+def _summarize_batch(batch, pool, processes):
+    paths = [path for path, _ in batch]
+    contents = [content for _, content in batch]
+    with span("summarize", files=len(batch)):
+        if pool is None or len(batch) < 2:
+            return list(map(summarize_content, paths, contents))
+        chunksize = max(1, len(batch) // (processes * 4))
+        return list(pool.map(summarize_content, paths, contents, chunksize=chunksize))
 
-        for file_type, summaries in file_summaries.items():
-            system_description += f"{file_type.upper()} Files:\n"
-            for summary in summaries:
-                system_description += summary + "\n"
-            system_description += "\n"
 
-        return system_description
+def describe_files(repo_url, files, cache=None, reusable=None, check_cache=False, processes=1,
+                   char_limit=CHAR_LIMIT, token_budget=None, model=None, strategy=PACK_GREEDY):
+    """Summarise `files` and build the system description.
+
+    `files` yields (path, blob_sha, content) in the order they should appear;
+    content may be None for paths whose value is in `reusable`. With
+    `check_cache` every file is looked up in `cache` before it is summarised.
+    Files are summarised in batches, across a process pool when `processes`
+    is above one.
+
+    Without a `token_budget` the walk stops once `char_limit` is exceeded.
+    With one, summaries are counted in `model` tokens and collected up to
+    CANDIDATE_FACTOR times the budget; the packer then keeps the files most
+    relevant to security that fit (see utils/context_packer.py).
+
+    Returns (description, analyzed) where `analyzed` maps each path that was
+    summarised to [blob_sha, value].
+    """
+    reusable = reusable or {}
+    counter = get_token_counter(model) if token_budget is not None else None
+    entries = []
+    total = 0
+    limit = char_limit if counter is None else token_budget * CANDIDATE_FACTOR
+    readme_content = ""
+    analyzed = {}
+
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    batch_size = SUMMARY_BATCH_SIZE * max(processes, 1)
+    try:
+        with closing(files):
+            over_budget = False
+            while not over_budget:
+                batch = list(islice(files, batch_size))
+                if not batch:
+                    break
+
+                values = {}
+                to_summarize = []
+                for path, blob_sha, content in batch:
+                    kind, key = _cache_entry(path, blob_sha)
+                    value = reusable.get(path)
+                    if value is None and cache is not None and check_cache:
+                        value = cache.get(kind, key)
+                    if value is not None:
+                        values[path] = value
+                    elif kind == "readme":
+                        values[path] = content
+                        if cache is not None:
+                            cache.put(kind, key, content)
+                    else:
+                        to_summarize.append((path, blob_sha, content))
+
+                summaries = _summarize_batch([(path, content) for path, _, content in to_summarize], pool, processes)
+                for (path, blob_sha, _), value in zip(to_summarize, summaries):
+                    values[path] = value
+                    if cache is not None:
+                        cache.put(*_cache_entry(path, blob_sha), value)
+
+                for path, blob_sha, _ in batch:
+                    value = values[path]
+                    analyzed[path] = [blob_sha, value]
+                    if path.lower() == 'readme.md':
+                        readme_content = value
+                        continue
+                    summary = f"File: {path}\n" + value
+                    size = len(summary) if counter is None else counter.count(summary)
+                    entries.append((path, summary, size))
+                    total += size
+                    if total > limit:
+                        over_budget = True
+                        break
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if counter is not None:
+        # The README goes in first and whole (up to README_LIMIT); the
+        # file summaries share what is left.
+        remaining = token_budget - counter.count(build_system_description(repo_url, readme_content, {}))
+        items = [PackItem(path, size, security_score(path, summary)) for path, summary, size in entries]
+        chosen = set(pack(items, remaining, strategy))
+        entries = [entry for entry in entries if entry[0] in chosen]
+
+    file_summaries = defaultdict(list)
+    for path, summary, _ in entries:
+        file_summaries[path.split('.')[-1]].append(summary)
+    return build_system_description(repo_url, readme_content, file_summaries), analyzed
+
+
+def rank_blobs(blobs):
+    """Order (path, blob_sha) pairs README first, then by the security relevance of their path."""
+    return sorted(blobs, key=lambda blob: (blob[0].lower() != 'readme.md', -security_score(blob[0])))
+
+
+def _limit_key(char_limit=CHAR_LIMIT, token_budget=None, model=None, strategy=PACK_GREEDY):
+    # Descriptions differ by whatever bounded them, so it is part of their cache key
+    if token_budget is None:
+        return str(char_limit)
+    return f"{token_budget}:{get_token_counter(model).name}:{strategy}"
+
+
+def _description_cache_key(repo_url, commit_sha, limit_key=str(CHAR_LIMIT)):
+    return f"{SUMMARY_VERSION}:{limit_key}:{repo_url}@{commit_sha}"
+
+
+def _index_cache_key(repo_url, commit_sha):
+    return f"{INDEX_VERSION}:{repo_url}@{commit_sha}"
+
+
+def _manifest_cache_key(repo_url, limit_key=str(CHAR_LIMIT)):
+    return f"{SUMMARY_VERSION}:{limit_key}:{repo_url}"
+
+
+def _manifest(commit_sha, tree, analyzed):
+    # `tree` holds every analysable file of the commit, `files` only those
+    # that were summarised before the budget ran out; diffing the trees
+    # keeps the files past the budget from looking new on every commit.
+    return {"commit": commit_sha, "tree": tree, "files": analyzed}
+
+
+TreeDiff = namedtuple("TreeDiff", ["added", "modified", "removed", "unchanged"])
+
+
+def diff_trees(old_blobs, new_blobs):
+    """Compare two {path: blob_sha} mappings and return the changed paths as a TreeDiff."""
+    added, modified, unchanged = [], [], []
+    for path, blob_sha in new_blobs.items():
+        if path not in old_blobs:
+            added.append(path)
+        elif old_blobs[path] != blob_sha:
+            modified.append(path)
+        else:
+            unchanged.append(path)
+    removed = [path for path in old_blobs if path not in new_blobs]
+    return TreeDiff(added, modified, removed, unchanged)
+
+
+def _list_blobs(repo, commit_sha):
+    """Return (path, blob_sha) for README.md and the source files at `commit_sha`, in tree order."""
+    tree = repo.get_git_tree(commit_sha, recursive=True)
+    return [
+        (file.path, file.sha) for file in tree.tree
+        if file.path.lower() == 'readme.md'
+        or (file.type == "blob" and is_analyzed_file(file.path))
+    ]
+
+
+def _github_token(github_api_key=None):
+    if github_api_key is None:
+        return session_value('github_api_key', '')
+    return github_api_key
+
+
+def github_api_url(base_url=None):
+    """Return the GitHub API root to use: `base_url`, else GITHUB_API_URL (e.g. a GitHub Enterprise server)."""
+    return base_url or os.getenv('GITHUB_API_URL') or DEFAULT_GITHUB_API_URL
+
+
+def repo_api_url(repo_url, base_url=None):
+    owner, repo_name = parse_repo_url(repo_url)
+    return f"{github_api_url(base_url).rstrip('/')}/repos/{owner}/{repo_name}"
+
+
+def open_github_repo(repo_url, github_api_key=None, max_workers=DEFAULT_MAX_WORKERS, base_url=None):
+    """Return (repo, commit_sha) for `repo_url`, pinned to the head of its default branch."""
+    owner, repo_name = parse_repo_url(repo_url)
+    github_api_key = _github_token(github_api_key)
+
+    # PyGithub spaces requests 0.25s apart by default; concurrency is
+    # bounded by the worker pool and RateLimitGate instead. Lazy objects
+    # avoid a request for the repository itself.
+    g = Github(
+        github_api_key, base_url=github_api_url(base_url), pool_size=max_workers,
+        seconds_between_requests=None, lazy=True,
+    )
+    repo = g.get_repo(f"{owner}/{repo_name}")
+
+    # A single request resolves the head of the default branch. Everything
+    # else is pinned to that commit, so an unchanged repository can be
+    # answered from the cache without any further API calls.
+    commit_sha = repo.get_commit("HEAD").raw_data["sha"]
+    return repo, commit_sha
+
+
+@traced("repo_analysis")
+def analyze_github_repo(repo_url, github_api_key=None, fetch_mode=FETCH_CONCURRENT,
+                        max_workers=DEFAULT_MAX_WORKERS, base_url=None, use_cache=True,
+                        char_limit=CHAR_LIMIT, processes=1, token_budget=None, model=None,
+                        strategy=PACK_GREEDY):
+    try:
+        if fetch_mode == FETCH_SERIAL:
+            max_workers = 1
+        repo, commit_sha = open_github_repo(repo_url, github_api_key, max_workers, base_url)
+        return _describe_github_repo(
+            repo, commit_sha, repo_url, github_api_key, fetch_mode, max_workers, base_url,
+            get_repo_cache() if use_cache else None, char_limit, processes, token_budget, model, strategy,
+        )
     except Exception as e:
-        st.error(f"Error analyzing GitHub repository: {e}")
+        show_error(f"Error analyzing GitHub repository: {e}")
         return ""
 
-def summarize_file(file_path, content):
-    imports = re.findall(r'^import .*|^from .* import .*', content, re.MULTILINE)
-    functions = re.findall(r'def .*\\(.*\\):', content)
-    classes = re.findall(r'class .*:', content)
 
-    summary = f"File: {file_path}\n"
-    if imports:
-        summary += "Imports:\n" + "\n".join(imports[:5]) + "\n"
-    if functions:
-        summary += "Functions:\n" + "\n".join(functions[:5]) + "\n"
-    if classes:
-        summary += "Classes:\n" + "\n".join(classes[:5]) + "\n"
+def _describe_github_repo(repo, commit_sha, repo_url, github_api_key, fetch_mode, max_workers, base_url, cache,
+                          char_limit, processes, token_budget, model, strategy):
+    # analyze_github_repo for a repository already opened at `commit_sha`
+    limit_key = _limit_key(char_limit, token_budget, model, strategy)
+    description_key = _description_cache_key(repo_url, commit_sha, limit_key)
+    previous = None
+    if cache is not None:
+        description = cache.get("description", description_key)
+        if description is not None:
+            return description
+        previous = cache.get("manifest", _manifest_cache_key(repo_url, limit_key))
+
+    # Summaries that can be reused without downloading the file, by path
+    reusable = {}
+    blobs = None
+    if previous is not None:
+        # Incremental re-analysis: diff against the last analysed commit
+        # and only fetch what was added or changed since.
+        blobs = _list_blobs(repo, commit_sha)
+        # Manifests written before the tree was recorded only have the analysed files
+        old_blobs = previous.get("tree") or {path: entry[0] for path, entry in previous["files"].items()}
+        changes = diff_trees(old_blobs, dict(blobs))
+        reusable = {path: previous["files"][path][1] for path in changes.unchanged if path in previous["files"]}
+        if fetch_mode == FETCH_ARCHIVE and len(changes.added) + len(changes.modified) <= INCREMENTAL_FETCH_LIMIT:
+            fetch_mode = FETCH_CONCURRENT
+
+    if blobs is None and (cache is not None or fetch_mode != FETCH_ARCHIVE):
+        # One request; the archive may be left unread past the budget
+        blobs = _list_blobs(repo, commit_sha)
+    tree = dict(blobs) if blobs is not None else {}
 
-    return summary
+    if fetch_mode == FETCH_ARCHIVE:
+        files = iter_archive_contents(repo, commit_sha)
+    else:
+        if token_budget is not None:
+            # Fetch the likeliest security-relevant files first, so they
+            # are among the candidates if the walk stops early.
+            blobs = rank_blobs(blobs)
+        if cache is not None:
+            reusable.update(_lookup_cached(cache, [blob for blob in blobs if blob[0] not in reusable]))
+        fetch = None
+        if fetch_mode == FETCH_ASYNC:
+            fetch = functools.partial(
+                iter_file_contents_async, repo_api_url(repo_url, base_url), ref=commit_sha,
+                github_api_key=_github_token(github_api_key), max_in_flight=max_workers * FETCH_WINDOW_FACTOR,
+            )
+        files = iter_tree_contents(repo, blobs, commit_sha, max_workers, skip=reusable.keys(), fetch=fetch)
+
+    description, analyzed = describe_files(
+        repo_url, files, cache=cache, reusable=reusable,
+        check_cache=fetch_mode == FETCH_ARCHIVE, processes=processes, char_limit=char_limit,
+        token_budget=token_budget, model=model, strategy=strategy,
+    )
+    if cache is not None:
+        cache.put("description", description_key, description)
+        cache.put("manifest", _manifest_cache_key(repo_url, limit_key), _manifest(commit_sha, tree, analyzed))
+    return description
+
+
+@traced("repo_index")
+def index_github_repo(repo_url, github_api_key=None, base_url=None, use_cache=True):
+    """Build a RepoIndex over every analysed file of `repo_url` from a single archive download.
+
+    Unlike the system description the index is not cut off at a character
+    budget, so excerpts can be retrieved from anywhere in a large repository.
+    """
+    try:
+        cache = get_repo_cache() if use_cache else None
+        repo, commit_sha = open_github_repo(repo_url, github_api_key, base_url=base_url)
+        if cache is not None:
+            data = cache.get("index", _index_cache_key(repo_url, commit_sha))
+            if data is not None:
+                return RepoIndex.from_dict(data)
+
+        index = RepoIndex()
+        with closing(iter_archive_contents(repo, commit_sha)) as files:
+            for path, _, content in files:
+                index.add_file(path, content)
+        if cache is not None:
+            cache.put("index", _index_cache_key(repo_url, commit_sha), index.to_dict())
+        return index
+    except Exception as e:
+        show_error(f"Error indexing GitHub repository: {e}")
+        return None
+
+
+@traced("repo_analysis")
+def analyze_and_index_github_repo(repo_url, github_api_key=None, base_url=None, use_cache=True, processes=1,
+                                  model=None, strategy=PACK_GREEDY):
+    """Return (system description, RepoIndex, commit SHA) for `repo_url`, downloading the repository at most once.
+
+    The description is packed into `model`'s description budget, which is
+    only an overview share of it when the index has excerpts to retrieve.
+    What is not in the cache is built from one archive download, kept in
+    memory for both the index and the summaries.
+    """
+    try:
+        cache = get_repo_cache() if use_cache else None
+        repo, commit_sha = open_github_repo(repo_url, github_api_key, base_url=base_url)
+        index_key = _index_cache_key(repo_url, commit_sha)
+        data = cache.get("index", index_key) if cache is not None else None
+        if data is not None:
+            index = RepoIndex.from_dict(data)
+            share = OVERVIEW_SHARE if index else DESCRIPTION_SHARE
+            description = _describe_github_repo(
+                repo, commit_sha, repo_url, github_api_key, FETCH_CONCURRENT, DEFAULT_MAX_WORKERS, base_url, cache,
+                CHAR_LIMIT, processes, description_budget(model, share), model, strategy,
+            )
+            return description, index, commit_sha
+
+        with closing(iter_archive_contents(repo, commit_sha)) as archive:
+            files = list(archive)
+        index = RepoIndex()
+        for path, _, content in files:
+            index.add_file(path, content)
+        if cache is not None:
+            cache.put("index", index_key, index.to_dict())
+
+        token_budget = description_budget(model, OVERVIEW_SHARE if index else DESCRIPTION_SHARE)
+        limit_key = _limit_key(token_budget=token_budget, model=model, strategy=strategy)
+        description_key = _description_cache_key(repo_url, commit_sha, limit_key)
+        description = cache.get("description", description_key) if cache is not None else None
+        if description is None:
+            # Rank as the per-file fetch modes do, so the likeliest
+            # security-relevant files are among the candidates
+            ranked = {path: position for position, (path, _) in enumerate(rank_blobs([file[:2] for file in files]))}
+            files.sort(key=lambda file: ranked[file[0]])
+            description, analyzed = describe_files(
+                repo_url, (file for file in files), cache=cache, check_cache=True, processes=processes,
+                token_budget=token_budget, model=model, strategy=strategy,
+            )
+            if cache is not None:
+                cache.put("description", description_key, description)
+                tree = {path: blob_sha for path, blob_sha, _ in files}
+                cache.put("manifest", _manifest_cache_key(repo_url, limit_key), _manifest(commit_sha, tree, analyzed))
+        return description, index, commit_sha
+    except Exception as e:
+        show_error(f"Error analyzing GitHub repository: {e}")
+        return "", None, None
@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stride-gpt")
+DEFAULT_MAX_MB = 256
+
+# Entries are evicted down to this fraction of the size limit, so that a
+# full cache is not trimmed again on every single write.
+EVICTION_TARGET = 0.9
+
+# A single value may take at most this fraction of the size limit; anything
+# larger would flush most of the cache and is simply not stored.
+MAX_ENTRY_FRACTION = 0.25
+
+# Reads only refresh an entry's LRU timestamp if it is older than this many
+# seconds, which keeps cache hits from turning into a write each time.
+ACCESS_RESOLUTION = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL);
+INSERT OR IGNORE INTO stats (id, total_size) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE stats SET total_size = total_size + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+
+class RepoCache:
+    """Content-addressed cache of repository analysis results.
+
+    Per-file summaries are keyed by git blob SHA and whole-repository system
+    descriptions by commit SHA, so an entry can never go stale. Everything is
+    kept in a single SQLite database in WAL mode, which lets several Streamlit
+    worker processes share one cache directory. Once the stored values exceed
+    `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, filename="repo_cache.sqlite3"):
+        self.cache_dir = os.path.expanduser(cache_dir or os.getenv('STRIDE_GPT_CACHE_DIR') or DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('STRIDE_GPT_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.path = os.path.join(self.cache_dir, filename)
+        self._local = threading.local()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or a fork, so keep one per
+        # thread and per process.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, kind, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, last_access FROM entries WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > ACCESS_RESOLUTION:
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE kind = ? AND key = ?", (now, kind, key)
+            )
+        return json.loads(row[0])
+
+    def get_many(self, kind, keys):
+        """Return {key: value} for those of `keys` that are cached."""
+        conn = self._connection()
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value FROM entries WHERE kind = ? AND key IN ({placeholders})",
+                (kind, *batch),
+            ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE entries SET last_access = ? WHERE kind = ? AND key = ? AND last_access < ?",
+                [(now, kind, key, now - ACCESS_RESOLUTION) for key in found],
+            )
+        return found
+
+    def put(self, kind, key, value):
+        data = json.dumps(value)
+        if len(data) > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        conn = self._connection()
+        # An upsert rather than INSERT OR REPLACE: the rows REPLACE deletes do
+        # not fire the delete trigger, so the total size would only grow.
+        conn.execute(
+            "INSERT INTO entries (kind, key, value, size, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "last_access = excluded.last_access",
+            (kind, key, data, len(data), time.time()),
+        )
+        self._evict_if_needed(conn)
+
+    def _evict_if_needed(self, conn):
+        (total,) = conn.execute("SELECT total_size FROM stats WHERE id = 0").fetchone()
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICTION_TARGET
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes
+        # evicting at the same time cannot both trim the same overflow.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                (total,) = conn.execute("SELECT total_size FROM stats WHERE id = 0").fetchone()
+                if total <= target:
+                    break
+                deleted = conn.execute(
+                    "DELETE FROM entries WHERE rowid IN "
+                    "(SELECT rowid FROM entries ORDER BY last_access LIMIT 64)"
+                ).rowcount
+                if not deleted:
+                    break
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, kind, key):
+        self._connection().execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+
+_repo_cache = None
+_repo_cache_lock = threading.Lock()
+
+
+def get_repo_cache():
+    """Return the process-wide cache, configured from STRIDE_GPT_CACHE_DIR and STRIDE_GPT_CACHE_MAX_MB."""
+    global _repo_cache
+    with _repo_cache_lock:
+        if _repo_cache is None:
+            _repo_cache = RepoCache()
+        return _repo_cache
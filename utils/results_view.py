@@ -0,0 +1,153 @@
+import numpy as np
+import streamlit as st
+
+from .dread_engine import BUCKET_LABELS, DREAD_FACTORS, DreadTable
+from .telemetry import traced
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+STRIDE_TYPES = ("Spoofing", "Tampering", "Repudiation", "Information Disclosure",
+                "Denial of Service", "Elevation of Privilege")
+
+# Views kept in the session state under this prefix, one per result shown
+VIEW_STATE_PREFIX = "_view_"
+
+
+def cached_view(key, source, build):
+    """Return build(source), reusing the copy made on an earlier rerun while `source` is the same object.
+
+    Streamlit reruns the whole script on every widget interaction; results
+    are kept in the session state, so the same object comes back each time
+    and its view does not have to be rebuilt to change a page or a filter.
+    """
+    state_key = VIEW_STATE_PREFIX + key
+    cached = st.session_state.get(state_key)
+    if cached is not None and cached[0] is source:
+        return cached[1]
+    view = build(source)
+    st.session_state[state_key] = (source, view)
+    return view
+
+
+def threat_columns(threats):
+    """Return the threats of a threat model as {column: NumPy array}, the form the table views filter."""
+    threats = [threat for threat in threats if isinstance(threat, dict)]
+    columns = {}
+    for name in ("Threat Type", "Scenario", "Potential Impact"):
+        column = np.empty(len(threats), dtype=object)
+        column[:] = [str(threat.get(name, "N/A")) for threat in threats]
+        columns[name] = column
+    return columns
+
+
+def dread_columns(table):
+    """Return a DreadTable as {column: NumPy array}, highest risk first."""
+    table = table.sorted()
+    columns = {
+        "Rank": table.ranks(),
+        "Threat Type": table.threat_types.astype(str),
+        "Scenario": table.scenarios.astype(str),
+    }
+    columns.update(zip(DREAD_FACTORS, table.scores.T))
+    columns["Risk Score"] = table.risk
+    columns["Risk Level"] = table.buckets()
+    return columns
+
+
+def _text_mask(columns, names, query):
+    # Case-insensitive substring match in any of the named columns
+    query = query.lower()
+    return np.fromiter(
+        (any(query in value.lower() for value in values) for values in zip(*(columns[name] for name in names))),
+        dtype=bool,
+        count=len(columns[names[0]]),
+    )
+
+
+def _filter_controls(key, columns, risk_levels=False):
+    """Show the filter widgets of a table and return the mask of the rows they keep."""
+    rows = len(columns["Threat Type"])
+    mask = np.ones(rows, dtype=bool)
+    present = set(columns["Threat Type"].tolist())
+    types = [t for t in STRIDE_TYPES if t in present] + sorted(present.difference(STRIDE_TYPES))
+
+    filter_columns = st.columns(3 if risk_levels else 2)
+    selected_types = filter_columns[0].multiselect("STRIDE category", types, key=f"{key}_types")
+    if selected_types:
+        mask &= np.isin(columns["Threat Type"], selected_types)
+    query = filter_columns[1].text_input("Search", key=f"{key}_search", placeholder="Words in the scenario...")
+    if query:
+        mask &= _text_mask(columns, ["Scenario", "Potential Impact"] if "Potential Impact" in columns else ["Scenario"], query)
+    if risk_levels:
+        selected_levels = filter_columns[2].multiselect("Risk level", BUCKET_LABELS, key=f"{key}_levels")
+        if selected_levels:
+            mask &= np.isin(columns["Risk Level"], selected_levels)
+    return mask
+
+
+def page_bounds(total, page_size, page):
+    """Return (page, pages, start, stop) for showing page `page` of `total` rows.
+
+    The page is clamped to the pages there are, at least one even when no
+    row is left; rows start:stop are the ones on it.
+    """
+    pages = max(1, -(-total // page_size))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * page_size
+    return page, pages, start, min(start + page_size, total)
+
+
+def paginated_dataframe(key, columns, mask, column_config=None):
+    """Show the rows of `columns` selected by `mask`, one page at a time."""
+    indices = np.flatnonzero(mask)
+    total = len(indices)
+    page_size = st.session_state.get(f"{key}_page_size", PAGE_SIZES[0])
+    page, pages, start, stop = page_bounds(total, page_size, st.session_state.get(f"{key}_page", 1))
+    # A filter can leave fewer pages than the one that was open
+    if st.session_state.get(f"{key}_page", 1) != page:
+        st.session_state[f"{key}_page"] = page
+
+    shown = indices[start:stop]
+    st.dataframe(
+        {name: column[shown] for name, column in columns.items()},
+        hide_index=True,
+        column_config=column_config,
+    )
+
+    info, size, number = st.columns([3, 1, 1])
+    info.caption(f"Showing {start + 1 if total else 0}–{stop} of {total} threats")
+    size.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size", label_visibility="collapsed")
+    number.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}_page", label_visibility="collapsed")
+
+
+@traced("render")
+def render_threat_model(threat_model, key="threat_model"):
+    """Show a threat model as a filterable, paginated table followed by its improvement suggestions."""
+    columns = cached_view(key, threat_model, lambda source: threat_columns(source.get("threat_model", [])))
+    mask = _filter_controls(key, columns)
+    paginated_dataframe(key, columns, mask, column_config={
+        "Threat Type": st.column_config.TextColumn(width="small"),
+        "Scenario": st.column_config.TextColumn(width="large"),
+        "Potential Impact": st.column_config.TextColumn(width="medium"),
+    })
+
+    suggestions = threat_model.get("improvement_suggestions", [])
+    if suggestions:
+        st.markdown("#### Improvement Suggestions\n\n" + "\n".join(f"- {suggestion}" for suggestion in suggestions))
+
+
+def render_dread_assessment(dread_assessment, key="dread_assessment"):
+    """Show a DREAD assessment as a table filterable by STRIDE category and risk level, highest risk first."""
+    table, columns, csv = cached_view(key, dread_assessment, _build_dread_view)
+    st.caption(" · ".join(f"{label} risk: {count}" for label, count in table.bucket_counts().items()))
+    mask = _filter_controls(key, columns, risk_levels=True)
+    config = {factor: st.column_config.NumberColumn(format="%g") for factor in DREAD_FACTORS}
+    config["Risk Score"] = st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=10)
+    config["Scenario"] = st.column_config.TextColumn(width="large")
+    paginated_dataframe(key, columns, mask, column_config=config)
+    st.download_button("Download as CSV", csv, file_name="dread_assessment.csv", mime="text/csv", key=f"{key}_csv")
+
+
+def _build_dread_view(dread_assessment):
+    table = DreadTable.from_assessment(dread_assessment)
+    return table, dread_columns(table), table.sorted().to_csv()
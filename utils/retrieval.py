@@ -0,0 +1,156 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+
+# Bump whenever chunk_file or the stored chunks change, so cached indexes are not reused
+INDEX_VERSION = 1
+
+CHUNK_LINES = 40
+CHUNK_OVERLAP = 10
+DEFAULT_TOP_K = 4
+
+# Files larger than this are usually generated or minified and only add noise
+MAX_INDEXED_FILE_BYTES = 200000
+
+# Excerpts are cut to this many characters in prompts
+MAX_EXCERPT_CHARS = 1500
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Terms that tend to appear in code relevant to each STRIDE category
+STRIDE_QUERIES = {
+    "Spoofing": "auth authenticate login logout password credential token jwt oauth saml session cookie identity verify signature certificate sso apikey",
+    "Tampering": "validate validation sanitize input request body form upload write update insert sql query serialize deserialize pickle hash integrity csrf",
+    "Repudiation": "log logger logging audit event trace history record timestamp monitor",
+    "Information Disclosure": "secret key password token encrypt decrypt crypto tls ssl cert env config error exception traceback debug response header pii",
+    "Denial of Service": "limit rate throttle timeout retry queue pool thread async upload size loop cache memory",
+    "Elevation of Privilege": "admin role permission authorize authorization access policy scope privilege sudo root exec eval subprocess shell command",
+}
+
+Chunk = namedtuple("Chunk", ["path", "start_line", "end_line", "text"])
+
+_IDENTIFIER = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+_CAMEL_CASE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    """Split text into lower-case terms, breaking identifiers on snake_case and camelCase."""
+    terms = []
+    for identifier in _IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        if len(lowered) > 1:
+            terms.append(lowered)
+        parts = [part.lower() for word in identifier.split("_") for part in _CAMEL_CASE.findall(word)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 1)
+    return terms
+
+
+def chunk_file(path, content, chunk_lines=CHUNK_LINES, overlap=CHUNK_OVERLAP):
+    """Split `content` into overlapping windows of `chunk_lines` lines."""
+    lines = content.splitlines()
+    chunks = []
+    step = max(chunk_lines - overlap, 1)
+    for start in range(0, max(len(lines), 1), step):
+        window = lines[start:start + chunk_lines]
+        if any(line.strip() for line in window):
+            chunks.append(Chunk(path, start + 1, start + len(window), "\n".join(window)))
+        if start + chunk_lines >= len(lines):
+            break
+    return chunks
+
+
+class RepoIndex:
+    """A BM25 index over line-window chunks of a repository's files.
+
+    Everything is plain Python, so building and querying the index needs no
+    GPU and no extra dependencies. File paths are indexed along with each
+    chunk, so a chunk of `auth/session.py` matches a query for "session".
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self._postings = defaultdict(list)
+        self._lengths = []
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add_file(self, path, content):
+        if len(content) > MAX_INDEXED_FILE_BYTES:
+            return
+        for chunk in chunk_file(path, content):
+            self._add_chunk(chunk)
+
+    def _add_chunk(self, chunk):
+        chunk_id = len(self.chunks)
+        terms = tokenize(chunk.path) + tokenize(chunk.text)
+        self.chunks.append(chunk)
+        self._lengths.append(len(terms))
+        for term, count in Counter(terms).items():
+            self._postings[term].append((chunk_id, count))
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """Return the `top_k` chunks scoring highest for `query`, best first."""
+        if not self.chunks:
+            return []
+        total = len(self.chunks)
+        average_length = sum(self._lengths) / total or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * count * (BM25_K1 + 1) / (count + norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.chunks[chunk_id] for chunk_id, _ in best]
+
+    def to_dict(self):
+        return {"chunks": [list(chunk) for chunk in self.chunks]}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        for chunk in data["chunks"]:
+            index._add_chunk(Chunk(*chunk))
+        return index
+
+
+def retrieve_for_stride(index, extra_terms="", top_k=DEFAULT_TOP_K):
+    """Return {STRIDE category: [Chunk, ...]} with the `top_k` chunks for each category."""
+    return {
+        category: index.search(f"{query} {extra_terms}", top_k)
+        for category, query in STRIDE_QUERIES.items()
+    }
+
+
+def format_retrieved_context(results):
+    """Render retrieve_for_stride() results as a prompt section.
+
+    A chunk that is relevant to several categories is printed once and
+    referred to by location afterwards.
+    """
+    sections = []
+    seen = set()
+    for category, chunks in results.items():
+        if not chunks:
+            continue
+        sections.append(f"### {category}\n")
+        for chunk in chunks:
+            location = f"{chunk.path}:{chunk.start_line}-{chunk.end_line}"
+            if location in seen:
+                sections.append(f"(see {location} above)\n")
+                continue
+            seen.add(location)
+            text = chunk.text
+            if len(text) > MAX_EXCERPT_CHARS:
+                text = text[:MAX_EXCERPT_CHARS] + "\n..."
+            sections.append(f"{location}\n```\n{text}\n```\n")
+        sections.append("\n")
+    return "".join(sections)
@@ -0,0 +1,426 @@
+import asyncio
+import email.utils
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import aclosing
+
+from .context_packer import DEFAULT_CHARS_PER_TOKEN
+from .generation import max_output_tokens
+from .telemetry import model_argument, provider_call, stage_name
+
+# Scheduler keys are the provider names used by the response cache; the UI
+# names are accepted too.
+PROVIDER_KEYS = {
+    "OpenAI": "openai",
+    "Azure OpenAI": "azure",
+    "Google": "google",
+    "Anthropic": "anthropic",
+    "Mistral": "mistral",
+    "Ollama": "ollama",
+}
+
+DEFAULT_CONCURRENCY = 8
+# A local Ollama server runs few generations at once; queueing more on it
+# only makes each of them slower.
+DEFAULT_OLLAMA_CONCURRENCY = 2
+
+DEFAULT_MAX_ATTEMPTS = 5
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# Consecutive failed requests that open a provider's circuit, and the seconds
+# it stays open before a single trial request is let through
+FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+# Statuses worth retrying: timeouts, conflicts, rate limits, server errors and
+# Anthropic's "overloaded"
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504, 529)
+
+# Output tokens charged to the tokens-per-minute budget when a request does
+# not say how many it may generate
+DEFAULT_OUTPUT_TOKENS = 1024
+
+ProviderLimits = namedtuple("ProviderLimits", ["requests_per_minute", "tokens_per_minute", "concurrency"])
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to a provider that keeps failing."""
+
+
+def provider_limits(key):
+    """Read the limits of provider `key` from STRIDE_GPT_<KEY>_RPM, _TPM and _CONCURRENCY (0 = unlimited)."""
+    prefix = f"STRIDE_GPT_{key.upper()}_"
+    default_concurrency = DEFAULT_OLLAMA_CONCURRENCY if key == "ollama" else DEFAULT_CONCURRENCY
+    return ProviderLimits(
+        requests_per_minute=float(os.getenv(prefix + "RPM", 0)),
+        tokens_per_minute=float(os.getenv(prefix + "TPM", 0)),
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", default_concurrency)),
+    )
+
+
+def max_attempts():
+    return max(1, int(os.getenv('STRIDE_GPT_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)))
+
+
+def estimate_tokens(prompt, max_tokens=None):
+    """Estimate the tokens a request uses: its prompt plus the output it may generate."""
+    if not isinstance(prompt, str):
+        prompt = str(prompt or "")
+    return int(len(prompt) / DEFAULT_CHARS_PER_TOKEN) + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+def call_tokens(arguments, prompt):
+    """Estimate the tokens of a call of a provider function from its bound arguments.
+
+    The output is charged at the call's own max_tokens, or at the limit the
+    generator modules size their requests with (utils/generation.py), not at
+    DEFAULT_OUTPUT_TOKENS: a request allowed 16k output tokens would
+    otherwise slip through the tokens-per-minute budget.
+    """
+    max_tokens = arguments.get("max_tokens") or arguments.get("max_output_tokens")
+    model = model_argument(arguments)
+    if max_tokens is None and isinstance(model, str) and isinstance(prompt, str):
+        max_tokens = max_output_tokens(model, prompt)
+    return estimate_tokens(prompt, max_tokens)
+
+
+def error_status(error):
+    """Return the HTTP status of a provider SDK, httpx or requests error, or None."""
+    for source in (error, getattr(error, "response", None), getattr(error, "raw_response", None)):
+        for name in ("status_code", "code"):
+            status = getattr(source, name, None)
+            if isinstance(status, int):
+                return status
+    return None
+
+
+def retry_after(error):
+    """Return the seconds a Retry-After (or retry-after-ms) header of the error's response asks for, or None."""
+    for source in (getattr(error, "response", None), getattr(error, "raw_response", None)):
+        headers = getattr(source, "headers", None)
+        if not headers:
+            continue
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            value = headers.get("retry-after")
+            if value:
+                try:
+                    return float(value)
+                except ValueError:
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_transient(error):
+    """Return True for timeouts and dropped connections, whichever library raised them."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(
+        marker in cls.__name__
+        for cls in type(error).__mro__
+        for marker in ("Timeout", "Connect", "RemoteProtocol")
+    )
+
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter, so retries of requests that
+    # failed together do not arrive together
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, holding at most a minute's worth.
+
+    A reservation is taken even when the bucket is short, driving the level
+    below zero; the caller waits for the returned delay until it is paid
+    back. Waiters are therefore served in the order they arrived.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take `amount` units and return how many seconds to wait before using them."""
+        with self._lock:
+            now = self.clock()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            # A request larger than the whole bucket waits for a full bucket
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+
+class Slots:
+    """A semaphore that threads and coroutines on any event loop can share.
+
+    A released slot is handed straight to the oldest waiter.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._used = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take_or_wait(self, wake):
+        with self._lock:
+            if self._used < self.size and not self._waiters:
+                self._used += 1
+                return True
+            self._waiters.append(wake)
+            return False
+
+    def acquire(self):
+        event = threading.Event()
+        if not self._take_or_wait(event.set):
+            event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        if self._take_or_wait(wake):
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = wake not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(wake)
+            if handed_over:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._used -= 1
+                return
+            wake = self._waiters.popleft()
+        wake()
+
+
+class CircuitBreaker:
+    """Stops requests to a provider after `threshold` consecutive failures.
+
+    After `reset_seconds` one trial request is let through: if it succeeds
+    the circuit closes, otherwise it stays open for another period.
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def check(self, name):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_seconds - self.clock()
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError(
+                    f"{name} is failing; requests are paused for {max(remaining, 0):.0f} more seconds"
+                )
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = self.clock()
+                self._trial = False
+
+
+class ProviderScheduler:
+    """Admission control and retries for the requests sent to one provider.
+
+    Each request waits for its share of the requests-per-minute and
+    tokens-per-minute budgets and for a concurrency slot. Rate limits,
+    server errors and timeouts are retried with exponential backoff; a
+    Retry-After header pauses every request to the provider for that long.
+    Other errors (bad requests, invalid keys) are raised at once. `clock`
+    and `sleep` are only replaced by tests.
+    """
+
+    def __init__(self, key, limits=None, clock=time.monotonic, sleep=time.sleep):
+        self.key = key
+        self.limits = limits or provider_limits(key)
+        self.clock = clock
+        self.sleep = sleep
+        self.requests = TokenBucket(self.limits.requests_per_minute, clock) if self.limits.requests_per_minute else None
+        self.tokens = TokenBucket(self.limits.tokens_per_minute, clock) if self.limits.tokens_per_minute else None
+        self.slots = Slots(max(1, self.limits.concurrency))
+        self.breaker = CircuitBreaker(clock=clock)
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def back_off(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, self.clock() + seconds)
+
+    def _admission_delay(self, tokens):
+        # Reserve the request and its tokens, then report how long to wait
+        with self._lock:
+            delay = self._resume_at - self.clock()
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return max(0.0, delay)
+
+    def _failed(self, error, attempt):
+        """Record a failed attempt and return the seconds to wait before the next, or None to give up."""
+        status = error_status(error)
+        if status not in RETRYABLE_STATUSES and not (status is None and is_transient(error)):
+            # The provider answered; the request itself was at fault
+            self.breaker.success()
+            return None
+        if status == 429:
+            # Being rate limited is not an outage: the provider is answering
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+        if attempt + 1 >= max_attempts():
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            return backoff_delay(attempt)
+        self.back_off(delay)
+        return delay
+
+    def call(self, func, *args, tokens=DEFAULT_OUTPUT_TOKENS, **kwargs):
+        """Call `func(*args, **kwargs)` under the limits of this provider, retrying transient failures."""
+        attempt = 0
+        while True:
+            self.breaker.check(self.key)
+            self.sleep(self._admission_delay(tokens))
+            self.slots.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                delay = self._failed(error, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                self.slots.release()
+            self.sleep(delay)
+            attempt += 1
+
+    async def acall(self, func, *args, tokens=DEFAULT_OUTPUT_TOKENS, **kwargs):
+        """Async version of `call` for a coroutine function `func`."""
+        attempt = 0
+        while True:
+            self.breaker.check(self.key)
+            await asyncio.sleep(self._admission_delay(tokens))
+            await self.slots.aacquire()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as error:
+                delay = self._failed(error, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                self.slots.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def astream(self, func, *args, tokens=DEFAULT_OUTPUT_TOKENS, **kwargs):
+        """Yield the chunks of the async generator `func(*args, **kwargs)`, holding a slot until it ends.
+
+        A stream is only retried if it fails before its first chunk; after
+        that the caller has already shown part of the answer.
+        """
+        attempt = 0
+        while True:
+            self.breaker.check(self.key)
+            await asyncio.sleep(self._admission_delay(tokens))
+            await self.slots.aacquire()
+            started = False
+            try:
+                async with aclosing(func(*args, **kwargs)) as chunks:
+                    async for chunk in chunks:
+                        started = True
+                        yield chunk
+            except Exception as error:
+                delay = self._failed(error, max_attempts() if started else attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.success()
+                return
+            finally:
+                self.slots.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider):
+    """Return the process-wide scheduler of `provider` (a UI name or a cache key such as "openai")."""
+    key = PROVIDER_KEYS.get(provider, provider)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = ProviderScheduler(key)
+        return scheduler
+
+
+def scheduled(provider, prompt_arg="prompt"):
+    """Send every call of the decorated provider function through the scheduler of `provider`.
+
+    Each call is also recorded as a provider span (utils/telemetry.py).
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        stage = stage_name(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            prompt = arguments.get(prompt_arg)
+            scheduler = get_scheduler(provider)
+            with provider_call(scheduler.key, model_argument(arguments), prompt, stage) as call:
+                result = scheduler.call(func, *args, tokens=call_tokens(arguments, prompt), **kwargs)
+                call.complete(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
@@ -0,0 +1,92 @@
+import importlib
+import logging
+import sys
+import threading
+import time
+
+# The SDK module each provider needs; Ollama is plain HTTP
+PROVIDER_SDKS = {
+    "OpenAI": "openai",
+    "Azure OpenAI": "openai",
+    "Google": "google.generativeai",
+    "Anthropic": "anthropic",
+    "Mistral": "mistralai",
+    "Ollama": None,
+}
+
+_import_seconds = {}
+_import_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def load_sdk(name):
+    """Import the SDK module `name` (or return it if already imported), recording how long the import took."""
+    if name in sys.modules:
+        # import_module waits if another thread is still importing it
+        return importlib.import_module(name)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    with _import_lock:
+        _import_seconds.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+class LazyModule:
+    """Stands in for an SDK module and imports it on first attribute access.
+
+    Each SDK takes up to seconds to import, and a session only uses one
+    provider, so generator modules refer to SDKs through these instead of
+    importing all of them at start-up.
+    """
+
+    _name = None
+    _module = None
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes not set in __init__, i.e. the module's
+        if self._module is None:
+            self._module = load_sdk(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return a LazyModule for `name`, e.g. genai = lazy_import("google.generativeai")."""
+    return LazyModule(name)
+
+
+def _load_quietly(name):
+    try:
+        load_sdk(name)
+    except Exception as e:
+        # The generation that needs it will raise the error where it is shown
+        logger.warning("Could not preload %s: %s", name, e)
+
+
+def preload_provider(provider, background=True):
+    """Start importing the SDK of `provider`, so it is ready by the time the first request is made.
+
+    With `background`, the import runs in a daemon thread while the user
+    fills in the form; a generation that starts before it is done waits for it.
+    """
+    name = PROVIDER_SDKS.get(provider)
+    if not name or name in sys.modules:
+        return
+    if background:
+        threading.Thread(target=_load_quietly, args=(name,), name=f"preload-{name}", daemon=True).start()
+    else:
+        load_sdk(name)
+
+
+def sdk_import_times():
+    """Return {SDK module: seconds its import took} for the SDKs imported so far through this module."""
+    with _import_lock:
+        return dict(_import_seconds)
@@ -0,0 +1,139 @@
+import datetime
+import hashlib
+import sqlite3
+
+import streamlit as st
+
+from .llm_cache import _cache_enabled
+from .model_store import ARTIFACT_KINDS, get_model_store, model_key
+from .results_view import STRIDE_TYPES
+
+KIND_LABELS = {
+    "threat_model": "Threat model",
+    "mitigations": "Mitigations",
+    "attack_tree": "Attack tree",
+    "test_cases": "Test cases",
+    "dread_assessment": "DREAD assessment",
+}
+
+
+def store_identity(provider, model, app_details, app_input, sharded=False):
+    """Return (key, fields) of the stored threat model for the current repository and inputs.
+
+    The repository and its commit come from the last analysis; the
+    description is hashed, so an edited description is a different model.
+    """
+    repo = st.session_state.get('last_analyzed_url')
+    commit = st.session_state.get('github_commit')
+    app_type, authentication, internet_facing, sensitive_data = app_details
+    params = {
+        "provider": provider,
+        "model": model,
+        "app_type": app_type,
+        "authentication": authentication,
+        "internet_facing": internet_facing,
+        "sensitive_data": sensitive_data,
+        "sharded": sharded,
+        "description": hashlib.sha256(app_input.encode()).hexdigest(),
+    }
+    return model_key(repo, commit, params), {"repo": repo, "commit": commit, "params": params}
+
+
+def find_stored_model(key, use_cache=True):
+    """Return the stored model `key` if it has a threat model and reusing responses is allowed, else None."""
+    if not (use_cache and _cache_enabled()):
+        return None
+    model = get_model_store().load(key)
+    if model is None or "threat_model" not in model["artifacts"]:
+        return None
+    return model
+
+
+def store_result(kind, result):
+    """Store a result of the threat model in the session, if it has a place in the store."""
+    key = st.session_state.get('stored_model_key')
+    if key is None:
+        return
+    try:
+        get_model_store().save(key, kind, result, **st.session_state.get('stored_model_fields', {}))
+    except sqlite3.Error as e:
+        # The result is still shown; only reloading it later is lost
+        st.warning(f"⚠️ Could not store the {KIND_LABELS[kind].lower()}: {e}")
+
+
+def load_stored_model(model):
+    """Show a stored threat model and its stored analyses in place of the session's results."""
+    artifacts = model["artifacts"]
+    st.session_state['threat_model'] = artifacts["threat_model"]
+    for kind in ARTIFACT_KINDS[1:]:
+        if kind in artifacts:
+            st.session_state[kind] = artifacts[kind]
+        else:
+            st.session_state.pop(kind, None)
+    st.session_state['stored_model_key'] = model["key"]
+    st.session_state['stored_model_fields'] = {}
+
+
+def model_label(model):
+    params = model["params"]
+    source = model["repo"] or "Description only"
+    if model["commit_sha"]:
+        source += f" @ {model['commit_sha'][:7]}"
+    updated = datetime.datetime.fromtimestamp(model["updated"]).strftime("%Y-%m-%d %H:%M")
+    return f"{source} · {params.get('provider')} {params.get('model') or ''} · {updated}"
+
+
+def render_model_store():
+    """Search the stored threat models and load one, with its analyses, without generating anything."""
+    with st.expander("🗄️ Stored Threat Models", expanded=False):
+        store = get_model_store()
+        query_column, type_column, kind_column = st.columns([3, 2, 2])
+        query = query_column.text_input("Search stored threats", key="store_query", placeholder="e.g. JWT token")
+        threat_type = type_column.selectbox("STRIDE category", ["All", *STRIDE_TYPES], key="store_threat_type")
+        kind = kind_column.selectbox(
+            "In", ARTIFACT_KINDS, key="store_kind", format_func=KIND_LABELS.get, index=None, placeholder="Everything",
+        )
+        threat_type = None if threat_type == "All" else threat_type
+
+        if query or threat_type or kind:
+            hits = store.search(query, threat_type=threat_type, kind=kind)
+            if not hits:
+                st.info("No stored threats match.")
+                return
+            st.dataframe(
+                [
+                    {"Threat Type": hit["threat_type"], "Match": hit["snippet"], "In": KIND_LABELS[hit["kind"]],
+                     "Threat model": model_label(hit)}
+                    for hit in hits
+                ],
+                hide_index=True,
+            )
+            models = {hit["key"]: hit for hit in hits}
+        else:
+            recent = store.recent()
+            if not recent:
+                st.info("Generated threat models are stored here, with their analyses.")
+                return
+            st.caption(f"{store.count()} stored threat models; the most recent:")
+            st.dataframe(
+                [
+                    {"Threat model": model_label(model),
+                     "Stored": ", ".join(KIND_LABELS[kind] for kind in ARTIFACT_KINDS if kind in model["kinds"])}
+                    for model in recent
+                ],
+                hide_index=True,
+            )
+            models = {model["key"]: model for model in recent}
+
+        choice_column, button_column = st.columns([5, 1])
+        key = choice_column.selectbox(
+            "Threat model to load", list(models), format_func=lambda key: model_label(models[key]),
+            key="store_choice", label_visibility="collapsed",
+        )
+        if button_column.button("Load", key="store_load", use_container_width=True):
+            model = store.load(key)
+            if model is None or "threat_model" not in model["artifacts"]:
+                st.error("❌ This threat model is no longer stored.")
+                return
+            load_stored_model(model)
+            st.rerun()
@@ -0,0 +1,135 @@
+import json
+
+from .generation import repair_json
+
+
+class JSONArrayStreamParser:
+    """Incrementally parse a JSON object and report the items of one array as they complete.
+
+    Feed it the chunks of a streamed response such as
+    {"threat_model": [{...}, {...}], "improvement_suggestions": [...]};
+    each call to `feed` returns the items of the array under `key` that were
+    closed by that chunk, so they can be shown before the rest has arrived.
+    Only the top-level object is inspected, anything before its opening
+    brace (e.g. a Markdown code fence) is skipped, and strings are tracked
+    so that braces inside them do not count.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.items = []
+        # The chunks fed so far, joined only when the whole text is asked for
+        self._chunks = []
+        # The text from position `_offset` on: what an open string or item still needs
+        self._buffer = ""
+        self._offset = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._pending_key = None
+        self._in_target = False
+        self._item_start = None
+
+    @property
+    def text(self):
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def length(self):
+        """The number of characters fed so far."""
+        return self._pos
+
+    def feed(self, chunk):
+        """Consume `chunk` and return the array items completed by it."""
+        self._chunks.append(chunk)
+        # Only the new chunk is scanned; earlier text is kept while an open
+        # string or item may still have to be decoded from it.
+        starts = [start for start in (self._string_start if self._in_string else None, self._item_start)
+                  if start is not None]
+        keep = min(starts, default=self._pos)
+        self._buffer = self._buffer[keep - self._offset:] + chunk
+        self._offset = keep
+        completed = []
+        buffer, offset = self._buffer, self._offset
+        for pos in range(self._pos, offset + len(buffer)):
+            char = buffer[pos - offset]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(pos, completed)
+                continue
+
+            if char == '"':
+                if self._depth >= 1:
+                    self._in_string = True
+                    self._string_start = pos
+            elif char in "{[":
+                if self._depth == 0 and char == "[":
+                    continue
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._last_key == self.key:
+                    self._in_target = True
+                elif self._depth == 3 and self._in_target:
+                    self._item_start = pos
+            elif char in "}]":
+                if self._depth == 0:
+                    continue
+                if self._depth == 3 and self._in_target and self._item_start is not None:
+                    self._emit(buffer[self._item_start - offset:pos + 1 - offset], completed)
+                    self._item_start = None
+                elif self._depth == 2 and self._in_target:
+                    self._in_target = False
+                self._depth -= 1
+                if self._depth == 1:
+                    self._last_key = None
+            elif char == ":" and self._depth == 1:
+                self._last_key = self._pending_key
+            elif char == "," and self._depth == 1:
+                self._last_key = None
+        self._pos = offset + len(buffer)
+        return completed
+
+    def _end_string(self, pos, completed):
+        literal = self._buffer[self._string_start - self._offset:pos + 1 - self._offset]
+        if self._depth == 1:
+            try:
+                self._pending_key = json.loads(literal)
+            except json.JSONDecodeError:
+                self._pending_key = None
+        elif self._depth == 2 and self._in_target:
+            # Arrays of strings, such as the improvement suggestions
+            self._emit(literal, completed)
+
+    def _emit(self, literal, completed):
+        try:
+            item = json.loads(literal)
+        except json.JSONDecodeError:
+            return
+        self.items.append(item)
+        completed.append(item)
+
+    def result(self):
+        """Return the whole parsed object once the stream has ended.
+
+        A response cut off at the output limit is repaired (see
+        utils/generation.py). Raises json.JSONDecodeError if no JSON object
+        can be recovered from it.
+        """
+        text = self.text
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        return repair_json(text)
@@ -0,0 +1,208 @@
+import ast
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Entries listed per section of a file summary
+MAX_ITEMS = 5
+
+# Lines longer than this are cut, so minified or generated code cannot blow up a summary
+MAX_LINE_CHARS = 200
+
+
+def _clip(line):
+    line = " ".join(line.split())
+    if len(line) > MAX_LINE_CHARS:
+        return line[:MAX_LINE_CHARS - 3] + "..."
+    return line
+
+
+def _first_unique(items):
+    # Items may be lazy, so stop consuming them once MAX_ITEMS are found
+    unique = {}
+    for item in items:
+        if item:
+            unique[_clip(item)] = None
+            if len(unique) == MAX_ITEMS:
+                break
+    return list(unique)
+
+
+def _format_summary(sections):
+    summary = ""
+    for title, items in sections:
+        items = _first_unique(items)
+        if items:
+            summary += f"{title}:\n" + "\n".join(items) + "\n"
+    return summary
+
+
+def _python_import(node):
+    names = ", ".join(ast.unparse(alias) for alias in node.names)
+    if isinstance(node, ast.Import):
+        return f"import {names}"
+    return f"from {'.' * node.level}{node.module or ''} import {names}"
+
+
+def _python_class(node):
+    header = f"class {node.name}"
+    bases = [ast.unparse(base) for base in node.bases + node.keywords]
+    if bases:
+        header += "(" + ", ".join(bases) + ")"
+    decorators = " ".join(f"@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+    if decorators:
+        header = f"{decorators} {header}"
+    methods = [
+        child.name for child in node.body
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+    ]
+    if methods:
+        header += ": " + ", ".join(methods[:MAX_ITEMS * 2])
+    return header
+
+
+def _python_signature(node):
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    signature = f"{prefix} {node.name}({ast.unparse(node.args)})"
+    if node.returns is not None:
+        signature += f" -> {ast.unparse(node.returns)}"
+    decorators = " ".join(f"@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+    return f"{decorators} {signature}" if decorators else signature
+
+
+def summarize_python(content):
+    """Summarise Python source from its syntax tree.
+
+    Decorated functions (route handlers, CLI commands, fixtures) are listed
+    before plain ones, since they are usually the entry points of a module.
+    """
+    tree = compile(content, "<summary>", "exec", ast.PyCF_ONLY_AST)
+    imports = []
+    decorated = []
+    functions = []
+    classes = []
+    # Nodes are only unparsed when they make it into the summary
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            (decorated if node.decorator_list else functions).append(node)
+        elif isinstance(node, ast.ClassDef):
+            classes.append(node)
+    return _format_summary([
+        ("Imports", map(_python_import, imports)),
+        ("Functions", map(_python_signature, decorated + functions)),
+        ("Classes", map(_python_class, classes)),
+    ])
+
+
+# Each extractor is a list of (section title, precompiled pattern); every
+# match of the pattern becomes one entry of the section.
+_PYTHON_FALLBACK = [
+    ("Imports", re.compile(r"^(?:import|from)\s+\S.*$", re.MULTILINE)),
+    ("Functions", re.compile(r"^\s*(?:async\s+)?def\s+\w+\s*\(.*$", re.MULTILINE)),
+    ("Classes", re.compile(r"^\s*class\s+\w+.*$", re.MULTILINE)),
+]
+
+_JAVASCRIPT = [
+    ("Imports", re.compile(
+        r"^\s*import\s.*$|^.*\brequire\(\s*['\"][^'\"]+['\"]\s*\).*$", re.MULTILINE)),
+    ("Routes", re.compile(
+        r"^\s*(?:\w+\.)*(?:app|router|server|api)\.(?:get|post|put|patch|delete|all|use|route)\s*\(\s*['\"`][^'\"`]*['\"`]",
+        re.MULTILINE)),
+    ("Functions", re.compile(
+        r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*\w*\s*(?:<[^>]*>)?\s*\([^)]*\)"
+        r"|^\s*(?:export\s+)?(?:const|let|var)\s+\w+\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b[^(]*)?\([^)]*\)\s*(?::[^=]+)?(?:=>)?",
+        re.MULTILINE)),
+    ("Classes", re.compile(
+        r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?(?:class|interface)\s+\w+[^{]*", re.MULTILINE)),
+]
+
+# Either a single import or an "import (...)" block, whose lines carry no keyword
+_GO_IMPORT = re.compile(r"^import\s*(?:\((.*?)^\)|([^\n]+))", re.MULTILINE | re.DOTALL)
+_GO = [
+    ("Functions", re.compile(r"^func\s+(?:\([^)]*\)\s*)?\w+\s*\([^)]*\)[^{]*", re.MULTILINE)),
+    ("Types", re.compile(r"^type\s+\w+\s+(?:struct|interface)\b", re.MULTILINE)),
+]
+
+_JAVA = [
+    ("Imports", re.compile(r"^import\s+(?:static\s+)?[\w.*]+;", re.MULTILINE)),
+    ("Routes", re.compile(
+        r"^\s*@(?:Get|Post|Put|Patch|Delete|Request)Mapping\b.*$|^\s*@(?:GET|POST|PUT|DELETE|Path)\b.*$",
+        re.MULTILINE)),
+    ("Functions", re.compile(
+        r"^\s*(?:(?:public|protected|private|static|final|abstract|synchronized)\s+)+"
+        r"(?!class\b|interface\b|enum\b|record\b)[\w<>\[\],.? ]+\s+\w+\s*\([^)]*\)",
+        re.MULTILINE)),
+    ("Classes", re.compile(
+        r"^\s*(?:(?:public|protected|private|static|final|abstract|sealed)\s+)*(?:class|interface|enum|record)\s+\w+[^{]*",
+        re.MULTILINE)),
+]
+
+_RUBY = [
+    ("Imports", re.compile(r"^\s*(?:require|require_relative|load)\s+['\"][^'\"]+['\"]", re.MULTILINE)),
+    ("Routes", re.compile(
+        r"^\s*(?:get|post|put|patch|delete|resources?|namespace|scope|match)\s+[:'\"].*$", re.MULTILINE)),
+    ("Functions", re.compile(r"^\s*def\s+(?:self\.)?[\w?!=]+.*$", re.MULTILINE)),
+    ("Classes", re.compile(r"^\s*(?:class|module)\s+[\w:]+.*$", re.MULTILINE)),
+]
+
+EXTRACTORS = {
+    ".js": _JAVASCRIPT,
+    ".jsx": _JAVASCRIPT,
+    ".mjs": _JAVASCRIPT,
+    ".ts": _JAVASCRIPT,
+    ".tsx": _JAVASCRIPT,
+    ".java": _JAVA,
+    ".rb": _RUBY,
+}
+
+
+def _extract(extractor, content):
+    return _format_summary([
+        (title, (match.group(0).strip() for match in pattern.finditer(content)))
+        for title, pattern in extractor
+    ])
+
+
+def _summarize_go(content):
+    imports = []
+    for block, single in _GO_IMPORT.findall(content):
+        if block:
+            imports.extend(line.strip() for line in block.splitlines() if '"' in line)
+        else:
+            imports.append("import " + single.strip())
+    return _format_summary([("Imports", imports)]) + _extract(_GO, content)
+
+
+def summarize_content(file_path, content):
+    """Return the summary of one source file: its imports, functions, classes and routes."""
+    extension = "." + file_path.rsplit(".", 1)[-1].lower() if "." in file_path else ""
+    if extension == ".py":
+        try:
+            return summarize_python(content)
+        except (SyntaxError, ValueError, RecursionError):
+            # Python 2 sources, templates and the like still get a summary
+            return _extract(_PYTHON_FALLBACK, content)
+    if extension == ".go":
+        return _summarize_go(content)
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        return ""
+    return _extract(extractor, content)
+
+
+def summarize_file(file_path, content):
+    return f"File: {file_path}\n" + summarize_content(file_path, content)
+
+
+def summarize_many(files, processes=1, chunksize=None):
+    """Return the summaries of (path, content) pairs, in order, across `processes` worker processes."""
+    files = list(files)
+    paths = [path for path, _ in files]
+    contents = [content for _, content in files]
+    if processes <= 1 or len(files) < 2:
+        return list(map(summarize_content, paths, contents))
+    if chunksize is None:
+        chunksize = max(1, len(files) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(summarize_content, paths, contents, chunksize=chunksize))
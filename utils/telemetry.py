@@ -0,0 +1,414 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from .context_packer import get_token_counter
+
+# Finished spans kept in memory for the diagnostics panel and /traces
+DEFAULT_MAX_SPANS = 5000
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# USD per million (prompt, completion) tokens, matched by the longest model
+# name prefix. Unknown and local models (Ollama) are counted as free.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (3.00, 12.00),
+    "o1": (15.00, 60.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-opus-4": (15.00, 75.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "mistral-small": (0.20, 0.60),
+    "mistral-large": (2.00, 6.00),
+}
+
+PROVIDER_SPAN = "provider_request"
+
+# The argument holding the model in each provider's generator functions
+MODEL_PARAMS = ("model_name", "azure_deployment_name", "google_model", "anthropic_model", "mistral_model", "ollama_model")
+
+# Generator function names end in the provider, e.g. get_threat_model_azure
+PROVIDER_SUFFIXES = ("_azure", "_google", "_anthropic", "_mistral", "_ollama")
+
+METRICS = {
+    "stride_gpt_span_seconds": ("histogram", "Wall time of each instrumented stage."),
+    "stride_gpt_span_errors_total": ("counter", "Instrumented stages that raised an error."),
+    "stride_gpt_provider_request_seconds": ("histogram", "Wall time of provider requests, including queueing and retries."),
+    "stride_gpt_time_to_first_token_seconds": ("histogram", "Time until the first chunk of a streamed answer."),
+    "stride_gpt_tokens_total": ("counter", "Prompt and completion tokens sent to and received from providers."),
+    "stride_gpt_cost_usd_total": ("counter", "Estimated provider cost in US dollars."),
+}
+
+
+def max_spans():
+    return int(os.getenv('STRIDE_GPT_TRACE_SPANS', DEFAULT_MAX_SPANS))
+
+
+def model_price(model):
+    """Return the (prompt, completion) USD price per million tokens of `model`."""
+    model = (model or "").lower()
+    matches = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    if not matches:
+        return 0.0, 0.0
+    return MODEL_PRICES[max(matches, key=len)]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = model_price(model)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class Span:
+    """One timed operation: a stage of the app or a request to a provider."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "end", "error", "_clock")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+        self._clock = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed(self):
+        return time.perf_counter() - self._clock
+
+    def finish(self, error=None):
+        self.end = time.time()
+        self.attributes["duration"] = self.elapsed()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Telemetry:
+    """Collects finished spans and the metrics derived from them.
+
+    Shared by every Streamlit session and job of the process. Spans can be
+    appended to a JSON lines file as they finish (STRIDE_GPT_TRACE_FILE).
+    """
+
+    def __init__(self, trace_file=None, span_limit=None):
+        self.trace_file = trace_file
+        self.spans = deque(maxlen=span_limit or max_spans())
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, metric, labels, value):
+        key = (metric, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            # One count per bucket, then the sum and the count of observations
+            histogram = self._histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def _increment(self, metric, labels, value=1):
+        key = (metric, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record(self, span):
+        attributes = span.attributes
+        with self._lock:
+            self.spans.append(span)
+            if span.name == PROVIDER_SPAN:
+                labels = {"provider": attributes.get("provider", ""), "model": attributes.get("model", ""),
+                          "stage": attributes.get("stage", "")}
+                self._observe("stride_gpt_provider_request_seconds",
+                              dict(labels, status="error" if span.error else "ok"), attributes["duration"])
+                if "ttft" in attributes:
+                    self._observe("stride_gpt_time_to_first_token_seconds", labels, attributes["ttft"])
+                self._increment("stride_gpt_tokens_total", dict(labels, kind="prompt"), attributes.get("prompt_tokens", 0))
+                self._increment("stride_gpt_tokens_total", dict(labels, kind="completion"),
+                                attributes.get("completion_tokens", 0))
+                self._increment("stride_gpt_cost_usd_total", labels, attributes.get("cost_usd", 0.0))
+            else:
+                self._observe("stride_gpt_span_seconds", {"name": span.name}, attributes["duration"])
+                if span.error:
+                    self._increment("stride_gpt_span_errors_total", {"name": span.name})
+            if self.trace_file:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def recent_spans(self, limit=None):
+        """Return the finished spans kept in memory as dicts, oldest first."""
+        with self._lock:
+            spans = list(self.spans)
+        if limit is not None:
+            spans = spans[-limit:]
+        return [span.to_dict() for span in spans]
+
+    def traces_json(self, limit=None):
+        """Return the recent spans as a JSON document: {"spans": [...]}."""
+        return json.dumps({"spans": self.recent_spans(limit)}, default=str)
+
+    def summary(self):
+        """Return per-stage and per-provider totals for display: (stages, providers), lists of dicts."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        stages = []
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric == "stride_gpt_span_seconds":
+                labels = dict(labels)
+                errors = counters.get(("stride_gpt_span_errors_total", (("name", labels["name"]),)), 0)
+                stages.append({"stage": labels["name"], "count": count, "total_s": total,
+                               "mean_s": total / count, "p95_s": _quantile(buckets, count, 0.95), "errors": errors})
+        providers = {}
+        for (metric, labels), value in sorted(histograms.items()):
+            if metric != "stride_gpt_provider_request_seconds":
+                continue
+            labels = dict(labels)
+            row = providers.setdefault((labels["provider"], labels["model"], labels["stage"]), {
+                "provider": labels["provider"], "model": labels["model"], "stage": labels["stage"],
+                "requests": 0, "errors": 0, "total_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            })
+            row["requests"] += value[2]
+            row["total_s"] += value[1]
+            if labels["status"] == "error":
+                row["errors"] += value[2]
+        for (metric, labels), value in counters.items():
+            labels = dict(labels)
+            row = providers.get((labels.get("provider"), labels.get("model"), labels.get("stage")))
+            if row is None:
+                continue
+            if metric == "stride_gpt_tokens_total":
+                row[f"{labels['kind']}_tokens"] += value
+            elif metric == "stride_gpt_cost_usd_total":
+                row["cost_usd"] += value
+        return stages, list(providers.values())
+
+    def prometheus_text(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            if kind == "histogram":
+                for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+                    if name != metric:
+                        continue
+                    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{metric}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {bucket_count}")
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{metric}_sum{_labels(labels)} {total:.6f}")
+                    lines.append(f"{metric}_count{_labels(labels)} {count}")
+            else:
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric:
+                        lines.append(f"{metric}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _quantile(buckets, count, q):
+    # Upper bound of the bucket holding the q-quantile, as Prometheus would estimate it
+    rank = q * count
+    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+        if bucket_count >= rank:
+            return bound
+    return float("inf")
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Return the process-wide Telemetry, created on first use."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            trace_file = os.getenv('STRIDE_GPT_TRACE_FILE')
+            _telemetry = Telemetry(trace_file=os.path.expanduser(trace_file) if trace_file else None)
+        return _telemetry
+
+
+_current_span = contextvars.ContextVar("stride_gpt_span", default=None)
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time the block as a span named `name`, nested under the span it runs in, if any."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as error:
+        current.finish(error)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+        get_telemetry().record(current)
+
+
+def traced(name, **attributes):
+    """Record every call of the decorated function (or coroutine function) as a span named `name`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def stage_name(function_name):
+    """Return the stage of a generator function, e.g. "threat_model" for stream_threat_model_azure."""
+    for prefix in ("aget_", "get_", "stream_"):
+        if function_name.startswith(prefix):
+            function_name = function_name[len(prefix):]
+            break
+    for suffix in PROVIDER_SUFFIXES:
+        if function_name.endswith(suffix):
+            return function_name[:-len(suffix)]
+    return function_name
+
+
+def _answer_text(result):
+    if result is None:
+        return ""
+    if isinstance(result, str):
+        return result
+    if isinstance(result, tuple) and result and isinstance(result[0], str):
+        return result[0]
+    return json.dumps(result, default=str)
+
+
+class ProviderCall:
+    """Token counts, cost and time to first token of one provider request, kept on its span."""
+
+    def __init__(self, current, model):
+        self.span = current
+        self.model = model
+        self.counter = get_token_counter(model)
+        self._chunks = []
+
+    def chunk(self, text):
+        """Note a streamed chunk of the answer."""
+        if not self._chunks:
+            self.span.set(ttft=self.span.elapsed())
+        self._chunks.append(text)
+
+    def complete(self, result=None):
+        """Note the answer: `result` for a request, or the chunks seen for a stream."""
+        text = "".join(self._chunks) if result is None else _answer_text(result)
+        completion_tokens = self.counter.count(text)
+        self.span.set(
+            completion_tokens=completion_tokens,
+            cost_usd=estimate_cost(self.model, self.span.attributes["prompt_tokens"], completion_tokens),
+        )
+
+
+@contextlib.contextmanager
+def provider_call(provider, model, prompt, stage=None):
+    """Record a request to `provider` as a span with its token counts and estimated cost.
+
+    Call `chunk(text)` on the yielded ProviderCall for each streamed chunk,
+    and `complete(result)` (or `complete()` after a stream) once it is done.
+    The stage defaults to that of the span the request is made in.
+
+    The span is not made current: streams run this in a generator, which
+    shares its context with whatever code consumes it.
+    """
+    parent = _current_span.get()
+    if stage is None:
+        stage = parent.attributes.get("stage", parent.name) if parent else ""
+    current = Span(PROVIDER_SPAN, parent, {"provider": provider, "model": model or "", "stage": stage})
+    call = ProviderCall(current, model)
+    current.set(prompt_tokens=call.counter.count(prompt or ""))
+    try:
+        yield call
+    except GeneratorExit:
+        # The consumer stopped reading a stream, e.g. on a Streamlit rerun
+        current.set(cancelled=True)
+        current.finish()
+        raise
+    except BaseException as error:
+        current.finish(error)
+        raise
+    else:
+        current.finish()
+    finally:
+        if "completion_tokens" not in current.attributes:
+            # Failed or abandoned: count what arrived
+            call.complete()
+        get_telemetry().record(current)
+
+
+def model_argument(bound_arguments):
+    """Return the model among the bound arguments of a generator function, if any."""
+    for name in MODEL_PARAMS:
+        if name in bound_arguments:
+            return bound_arguments[name]
+    return None